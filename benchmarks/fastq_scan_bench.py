@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import generators
+from commands import fastq_scan
+
+task = '''
+Benchmark chunked FASTQ scanning against the original line-by-line scan.
+
+Writes a synthetic FASTQ file of `size` MB with `generators.write_fastq`,
+then times counting sequences greater than `length` with each
+implementation: the chunked scan once per engine available (numpy only
+when installed), and the chunked scan gathering QC statistics (--qc) as well.
+'''
+
+def legacy_count_gt_len(filename, nt_len):
+    '''
+    Original `get_perc_gt_len` loop: four `readline` calls per record in text mode
+    '''
+
+    seq_total = 0
+    seq_gt_len = 0
+
+    with open(filename, 'r') as f:
+        while True:
+            seq_identifier = f.readline()
+            raw_seq = f.readline()
+            quality_identifier = f.readline()
+            quality_scores = f.readline()
+
+            if not seq_identifier:
+                return seq_total, seq_gt_len
+
+            if len(raw_seq.rstrip('\n')) > nt_len:
+                seq_gt_len += 1
+            seq_total += 1
+
+def chunked_count_gt_len(filename, nt_len, engine=fastq_scan.DEFAULT_ENGINE):
+    with open(filename, 'rb') as f:
+        return fastq_scan.count_gt_len(f, nt_len, engine=engine)
+
+def chunked_read_stats(filename, nt_len, engine=fastq_scan.DEFAULT_ENGINE):
+    with open(filename, 'rb') as f:
+        stats = fastq_scan.read_stats(f, engine=engine)
+    return stats.histogram.total(), stats.histogram.count_gt(nt_len)
+
+def time_scan(count, filename, nt_len, repeats, *args):
+    best = None
+    for _ in range(repeats):
+        started = time.time()
+        result = count(filename, nt_len, *args)
+        elapsed = time.time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=task)
+    parser.add_argument('-s', '--size', type=float, default=32, help='FASTQ file size in MB. Defaults to 32')
+    parser.add_argument('-l', '--length', type=int, default=30)
+    parser.add_argument('-r', '--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    fd, filename = tempfile.mkstemp(suffix='.fastq')
+    os.close(fd)
+    try:
+        generators.write_fastq(filename, int(args.size * 1e6))
+        size_mb = os.path.getsize(filename) / 1e6
+
+        legacy_result, legacy_time = time_scan(legacy_count_gt_len, filename, args.length, args.repeats)
+        print('\t'.join(['implementation', 'seconds', 'MB/s', 'speedup']))
+        print('\t'.join(map(str, ['readline', round(legacy_time, 4), round(size_mb / legacy_time, 1), '1.0x'])))
+
+        for engine in fastq_scan.ENGINES:
+            if engine == 'numpy' and fastq_scan.numpy is None:
+                continue
+            for name, count in (('chunked', chunked_count_gt_len), ('chunked qc', chunked_read_stats)):
+                chunked_result, chunked_time = time_scan(count, filename, args.length, args.repeats, engine)
+                assert legacy_result == chunked_result, (engine, legacy_result, chunked_result)
+                print('\t'.join(map(str, [
+                    '{0} ({1})'.format(name, engine), round(chunked_time, 4), round(size_mb / chunked_time, 1),
+                    '{0:.1f}x'.format(legacy_time / chunked_time),
+                ])))
+    finally:
+        os.remove(filename)
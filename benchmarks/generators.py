@@ -0,0 +1,134 @@
+import random
+
+# Deterministic synthetic datasets for benchmarks: the same seed and
+# size always write the same file. Sizes are given in bytes, so
+# datasets scale from KB to GB; each generator stops at the first
+# record reaching the size.
+
+BASES = 'ACGT'
+
+# Random bases drawn once per file; reads are slices of it at random
+# offsets, which keeps writing GBs fast without repeating whole reads
+POOL_SIZE = 1 << 20
+
+QUALITIES = ''.join(chr(quality) for quality in range(ord('#'), ord('J')))
+
+
+def random_pool(rand, alphabet=BASES, size=POOL_SIZE):
+    return ''.join(rand.choices(alphabet, k=size))
+
+
+def write_fastq(filename, size, max_len=150, seed=0):
+    '''
+    Writes FASTQ file of about `size` bytes, reads of uniformly random
+    length 1..`max_len` with an occasional N. Returns number of reads
+    '''
+
+    rand = random.Random(seed)
+    pool = random_pool(rand, BASES * 24 + 'N')
+    quality_pool = random_pool(rand, QUALITIES)
+    written = 0
+    num_reads = 0
+    with open(filename, 'w') as f:
+        while written < size:
+            seq_len = rand.randint(1, max_len)
+            start = rand.randrange(POOL_SIZE - seq_len)
+            record = '@read_{0} 1:N:0:1\n{1}\n+\n{2}\n'.format(
+                num_reads, pool[start:start + seq_len], quality_pool[start:start + seq_len]
+            )
+            f.write(record)
+            written += len(record)
+            num_reads += 1
+    return num_reads
+
+
+def write_fasta(filename, size, distinct=10000, read_len=100, line_width=60, seed=0):
+    '''
+    Writes FASTA file of about `size` bytes, drawing reads from
+    `distinct` sequences with Zipf-like frequencies (the k-th most
+    common about 1/k as often as the first), so there are clear top
+    sequences. Sequences are wrapped at `line_width` columns, 0 for
+    none. Returns number of records
+    '''
+
+    rand = random.Random(seed)
+    pool = random_pool(rand)
+    sequences = []
+    for _ in range(distinct):
+        start = rand.randrange(POOL_SIZE - read_len)
+        seq = pool[start:start + read_len]
+        if line_width:
+            seq = '\n'.join(seq[i:i + line_width] for i in range(0, len(seq), line_width))
+        sequences.append(seq)
+    weights = [1.0 / rank for rank in range(1, distinct + 1)]
+
+    written = 0
+    num_records = 0
+    with open(filename, 'w') as f:
+        while written < size:
+            # Draw in batches, weighted choice is costly per call
+            for seq in rand.choices(sequences, weights, k=1000):
+                record = '>seq_{0}\n{1}\n'.format(num_records, seq)
+                f.write(record)
+                written += len(record)
+                num_records += 1
+                if written >= size:
+                    break
+    return num_records
+
+
+def write_gtf(filename, size, num_chromosomes=24, exons_per_gene=4, seed=0):
+    '''
+    Writes GTF file of about `size` bytes of genes made of exon and
+    intron rows, laid out along each chromosome with random gaps and
+    some overlapping neighbours. Returns dict of chromosome to length
+    of the genes laid out on it
+    '''
+
+    rand = random.Random(seed)
+    chromosomes = ['chr{0}'.format(i + 1) for i in range(num_chromosomes)]
+    positions = dict((chromosome, 1) for chromosome in chromosomes)
+    row = ('{chromosome}\tbench\t{feature}\t{start}\t{stop}\t.\t+\t.\t'
+           'gene_id "{gene}"; transcript_id "{gene}.1"; gene_name "{gene}";\n')
+    written = 0
+    num_genes = 0
+    with open(filename, 'w') as f:
+        while written < size:
+            chromosome = chromosomes[num_genes % num_chromosomes]
+            gene = 'GENE{0}'.format(num_genes)
+            # One gene in ten starts inside the one before
+            if rand.random() < 0.1:
+                start = max(positions[chromosome] - rand.randint(1, 5000), 1)
+            else:
+                start = positions[chromosome] + rand.randint(100, 50000)
+            for part in range(exons_per_gene * 2 - 1):
+                stop = start + rand.randint(50, 5000)
+                text = row.format(chromosome=chromosome, feature='intron' if part % 2 else 'exon',
+                                  start=start, stop=stop, gene=gene)
+                f.write(text)
+                written += len(text)
+                start = stop
+            positions[chromosome] = max(positions[chromosome], start)
+            num_genes += 1
+    return positions
+
+
+def write_coordinates(filename, size, chromosome_lengths, seed=0):
+    '''
+    Writes Chr<tab>Position file of about `size` bytes, positions
+    uniformly random over the span of `chromosome_lengths` (from
+    `write_gtf`), plus an unannotated chromosome. Returns number of lines
+    '''
+
+    rand = random.Random(seed)
+    chromosomes = sorted(chromosome_lengths) + ['chrUn']
+    written = 0
+    num_lines = 0
+    with open(filename, 'w') as f:
+        while written < size:
+            chromosome = rand.choice(chromosomes)
+            line = '{0}\t{1}\n'.format(chromosome, rand.randint(1, chromosome_lengths.get(chromosome, 1000000)))
+            f.write(line)
+            written += len(line)
+            num_lines += 1
+    return num_lines
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import generators
+from commands import fastq_nt_gt_len, get_annotations, seq_mode
+from commands.profiling import peak_rss_mb
+
+BENCHMARKS = ('fastq', 'fasta', 'annotate')
+DEFAULT_SIZES = '1,4,16'
+
+task = '''
+Benchmark all three commands on synthetic data.
+
+Generates deterministic FASTQ, FASTA and GTF plus coordinate files of
+each of `sizes` MB (kept in `data_dir` and reused by later runs), then
+times `get_perc_gt_len`, `get_read_stats`, `hash_file` + `get_top_sequences`,
+`cache_chromosomes` and `match_coords` on each, every run in a fresh
+process so peak RSS is its own. Prints a table, and writes every
+result as JSON with --output for comparing runs and plotting scaling
+'''
+
+
+def run_fastq(filename):
+    started = time.time()
+    fastq_nt_gt_len.get_perc_gt_len(filename, fastq_nt_gt_len.NT_DEFAULT_LENGTH)
+    scanned = time.time()
+    results = [{'function': 'get_perc_gt_len', 'seconds': scanned - started, 'peak_rss_mb': peak_rss_mb()}]
+
+    fastq_nt_gt_len.get_read_stats(filename)
+    results.append({'function': 'get_read_stats', 'seconds': time.time() - scanned, 'peak_rss_mb': peak_rss_mb()})
+    return results
+
+
+def run_fasta(filename):
+    started = time.time()
+    list(seq_mode.get_top_sequences(seq_mode.hash_file(filename), seq_mode.DEFAULT_NUM_SEQS))
+    return [{'function': 'hash_file+get_top_sequences', 'seconds': time.time() - started, 'peak_rss_mb': peak_rss_mb()}]
+
+
+def run_annotate(gtf_filename, coord_filename):
+    started = time.time()
+    chromosomes = get_annotations.cache_chromosomes(gtf_filename, get_annotations.DEFAULT_INDEX_TYPE)
+    loaded = time.time()
+    results = [{'function': 'cache_chromosomes', 'seconds': loaded - started, 'peak_rss_mb': peak_rss_mb()}]
+
+    for _ in get_annotations.match_coords(coord_filename, chromosomes):
+        pass
+    results.append({'function': 'match_coords', 'seconds': time.time() - loaded, 'peak_rss_mb': peak_rss_mb()})
+    return results
+
+
+def _run_in_process(queue, target, args):
+    try:
+        queue.put(target(*args))
+    except BaseException as e:
+        queue.put(RuntimeError('{0}: {1}'.format(type(e).__name__, e)))
+
+
+def measure(target, args):
+    '''
+    Runs `target(*args)` in a fresh process, returning its results
+    '''
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_in_process, args=(queue, target, args))
+    process.start()
+    results = queue.get()
+    process.join()
+    if isinstance(results, Exception):
+        raise results
+    return results
+
+
+def get_datasets(benchmark, data_dir, size_mb):
+    '''
+    Returns (filenames, {filename: number of records}) of the dataset
+    for `benchmark` at `size_mb`, generating files not already in `data_dir`
+    '''
+
+    size = int(size_mb * 1e6)
+    name = '{0}_{1:g}mb'.format(benchmark, size_mb)
+    counts_filename = os.path.join(data_dir, name + '.json')
+    if benchmark == 'fastq':
+        filenames = [os.path.join(data_dir, name + '.fastq')]
+    elif benchmark == 'fasta':
+        filenames = [os.path.join(data_dir, name + '.fasta')]
+    else:
+        filenames = [os.path.join(data_dir, name + '.gtf'), os.path.join(data_dir, name + '_coordinates.txt')]
+
+    if os.path.exists(counts_filename) and all(os.path.exists(filename) for filename in filenames):
+        with open(counts_filename) as f:
+            return filenames, json.load(f)
+
+    sys.stderr.write('Generating {0}\n'.format(name))
+    if benchmark == 'fastq':
+        counts = {filenames[0]: generators.write_fastq(filenames[0], size)}
+    elif benchmark == 'fasta':
+        counts = {filenames[0]: generators.write_fasta(filenames[0], size)}
+    else:
+        lengths = generators.write_gtf(filenames[0], size)
+        with open(filenames[0]) as f:
+            num_rows = sum(1 for _ in f)
+        counts = {filenames[0]: num_rows, filenames[1]: generators.write_coordinates(filenames[1], size, lengths)}
+    with open(counts_filename, 'w') as f:
+        json.dump(counts, f)
+    return filenames, counts
+
+
+def run_benchmark(benchmark, data_dir, size_mb, repeats):
+    '''
+    Returns result dicts of the fastest of `repeats` runs of `benchmark`
+    on its dataset of `size_mb`, with throughput in MB and records per second
+    '''
+
+    filenames, counts = get_datasets(benchmark, data_dir, size_mb)
+    target = {'fastq': run_fastq, 'fasta': run_fasta, 'annotate': run_annotate}[benchmark]
+    runs = [measure(target, filenames) for _ in range(repeats)]
+    best = min(runs, key=lambda results: sum(result['seconds'] for result in results))
+
+    for result in best:
+        # match_coords reads the coordinate file, the rest their first file
+        filename = filenames[-1] if result['function'] == 'match_coords' else filenames[0]
+        size = os.path.getsize(filename)
+        seconds = max(result['seconds'], 1e-9)
+        result.update({
+            'benchmark': benchmark,
+            'size_mb': size_mb,
+            'bytes': size,
+            'records': counts[filename],
+            'mb_per_sec': size / 1e6 / seconds,
+            'records_per_sec': counts[filename] / seconds,
+        })
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=task)
+    parser.add_argument('-b', '--benchmark', choices=BENCHMARKS, action='append',
+        help='Benchmark to run. May be repeated. Defaults to all'
+    )
+    parser.add_argument('-s', '--sizes', default=DEFAULT_SIZES,
+        help='Comma-separated dataset sizes in MB, one scaling point each. Defaults to {sizes}'.format(sizes=DEFAULT_SIZES)
+    )
+    parser.add_argument('-d', '--data-dir', default=os.path.join('benchmarks', 'data'),
+        help='Directory generated datasets are kept in. Defaults to benchmarks/data'
+    )
+    parser.add_argument('-r', '--repeats', type=int, default=3, help='Runs per benchmark, the fastest is kept')
+    parser.add_argument('-o', '--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        os.makedirs(args.data_dir)
+
+    columns = ['benchmark', 'function', 'size_mb', 'records', 'seconds', 'mb_per_sec', 'records_per_sec', 'peak_rss_mb']
+    print('\t'.join(columns))
+    results = []
+    for benchmark in args.benchmark or BENCHMARKS:
+        for size_mb in [float(size) for size in args.sizes.split(',')]:
+            for result in run_benchmark(benchmark, args.data_dir, size_mb, args.repeats):
+                results.append(result)
+                print('\t'.join(
+                    str(round(result[column], 3)) if isinstance(result[column], float) else str(result[column])
+                    for column in columns
+                ))
+                sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': multiprocessing.cpu_count(),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
@@ -0,0 +1,13 @@
+'''
+Command line tools, importable as a library for use in-process:
+
+- `commands.get_annotations.GeneAnnotator` loads a gene index once
+  and answers any number of lookups
+- `commands.fastq_nt_gt_len.scan_files` streams a `LengthHistogram`
+  per FASTQ file, `commands.fastq_scan.length_histogram` one per open file
+- `commands.seq_mode.count_sequences` counts sequences read with
+  `commands.fasta.read_sequences`, `top_sequences` picks the most frequent
+
+Library functions raise IOError (OSError) on a file they cannot read;
+only the command lines turn that into an exit with a message.
+'''
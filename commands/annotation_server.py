@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import socket
+import stat
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+if not __package__:
+    # Run as a script: make the `commands` package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commands.get_annotations import DEFAULT_INDEX_TYPE, INDEX_TYPES, GeneAnnotator
+from commands.gtf import ParseStats
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8470
+
+# Latest request latencies kept for percentiles
+LATENCY_WINDOW = 10000
+
+task = '''
+Annotation Query Server.
+
+Loads a GTF annotation file once and answers batches of coordinate
+lookups over localhost HTTP or a Unix socket, from any number of
+concurrent clients.
+
+POST /annotate  Chr<tab>Position lines in, the lines of get_annotations.py
+                out. With Content-Type application/json, takes
+                {{"coordinates": [[chr, position], ...]}} and returns
+                {{"genes": [[name, ...], ...]}}
+GET  /stats     Request count and latency percentiles, as JSON
+GET  /health    ok
+
+Listens on {host}:{port} unless given --socket.
+'''.format(host=DEFAULT_HOST, port=DEFAULT_PORT)
+
+
+class LatencyStats(object):
+    '''
+    Counts requests and coordinates served, keeping the latencies of
+    the latest `window` requests for percentiles. Safe to share
+    between request threads
+    '''
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.coordinates = 0
+        self.errors = 0
+        self.started = time.time()
+
+    def record(self, seconds, coordinates):
+        with self.lock:
+            self.requests += 1
+            self.coordinates += coordinates
+            self.latencies.append(seconds)
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def to_dict(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = {
+                'requests': self.requests,
+                'coordinates': self.coordinates,
+                'errors': self.errors,
+                'uptime_sec': time.time() - self.started,
+            }
+
+        def percentile(perc):
+            return latencies[min(int(len(latencies) * perc / 100.0), len(latencies) - 1)] * 1000
+
+        if latencies:
+            stats['latency_ms'] = {
+                'mean': sum(latencies) / len(latencies) * 1000,
+                'p50': percentile(50),
+                'p95': percentile(95),
+                'p99': percentile(99),
+                'max': latencies[-1] * 1000,
+            }
+        return stats
+
+
+class AnnotationHandler(BaseHTTPRequestHandler):
+    '''
+    Answers requests from the server's `annotator`, recording each
+    in its `stats`
+    '''
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._respond(200, json.dumps(self.server.stats.to_dict(), sort_keys=True), 'application/json')
+        elif self.path == '/health':
+            self._respond(200, 'ok\n')
+        else:
+            self._respond(404, 'Not found\n')
+
+    def do_POST(self):
+        if self.path != '/annotate':
+            self._respond(404, 'Not found\n')
+            return
+
+        start = time.time()
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                pairs = [(chromosome, int(coordinate)) for chromosome, coordinate in json.loads(body)['coordinates']]
+                genes = self.server.annotator.find_batch(pairs)
+                text = json.dumps({'genes': [list(names) for names in genes]})
+                content_type = 'application/json'
+            else:
+                lines = body.splitlines()
+                text = ''.join(result + '\n' for result in self.server.annotator.annotate_lines(lines))
+                pairs = lines
+                content_type = 'text/plain'
+        except (ValueError, KeyError, TypeError) as e:
+            self.server.stats.record_error()
+            self._respond(400, 'Bad request: {0}\n'.format(e))
+            return
+
+        seconds = time.time() - start
+        self.server.stats.record(seconds, len(pairs))
+        self._respond(200, text, content_type, {'X-Annotation-Time-Ms': '{0:.3f}'.format(seconds * 1000)})
+
+    def _respond(self, status, text, content_type='text/plain', headers=None):
+        data = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else self.server.server_address
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class AnnotationServer(ThreadingMixIn, HTTPServer):
+    '''
+    HTTP server answering each client in its own thread
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, address, annotator, verbose=False):
+        HTTPServer.__init__(self, address, AnnotationHandler)
+        self.annotator = annotator
+        self.stats = LatencyStats()
+        self.verbose = verbose
+
+
+class UnixAnnotationServer(ThreadingMixIn, UnixStreamServer):
+    '''
+    `AnnotationServer` listening on a Unix socket
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, path, annotator, verbose=False):
+        # A socket left by an earlier server is replaced, any other file kept
+        if os.path.exists(path):
+            if not is_socket(path):
+                raise OSError('{0} exists and is not a socket'.format(path))
+            os.remove(path)
+        UnixStreamServer.__init__(self, path, AnnotationHandler)
+        self.annotator = annotator
+        self.stats = LatencyStats()
+        self.verbose = verbose
+
+    def server_close(self):
+        UnixStreamServer.server_close(self)
+        if is_socket(self.server_address):
+            os.remove(self.server_address)
+
+
+def is_socket(path):
+    '''
+    Returns whether `path` exists and is a Unix socket
+    '''
+
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def make_server(annotator, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, verbose=False):
+    '''
+    Returns server answering from `annotator`, on a Unix socket at
+    `socket_path` if given, else on `host`:`port`. Port 0 picks a free port
+    '''
+
+    if socket_path:
+        if not hasattr(socket, 'AF_UNIX'):
+            raise OSError('Unix sockets are not supported on this platform')
+        return UnixAnnotationServer(socket_path, annotator, verbose)
+    return AnnotationServer((host, port), annotator, verbose)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=task, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('anno_file', help='Path to annotation file, GTF formatted')
+    parser.add_argument('--index', choices=INDEX_TYPES, default=DEFAULT_INDEX_TYPE,
+        help='Gene structure used for lookups. Defaults to {index_type}'.format(index_type=DEFAULT_INDEX_TYPE)
+    )
+    parser.add_argument('--index-file',
+        help='Path to binary gene index of the annotation file, built there if missing or out of date. Implies --index=array'
+    )
+    parser.add_argument('-f', '--feature', action='append', dest='features',
+        help='Only read GTF rows of this feature type, e.g. gene or transcript. May be repeated. Defaults to all rows'
+    )
+    parser.add_argument('--host', default=DEFAULT_HOST,
+        help='Address to listen on. Defaults to {host}'.format(host=DEFAULT_HOST)
+    )
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT,
+        help='Port to listen on. Defaults to {port}'.format(port=DEFAULT_PORT)
+    )
+    parser.add_argument('-s', '--socket', help='Listen on a Unix socket at this path instead of a port')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Log every request to stderr')
+    args = parser.parse_args()
+
+    stats = ParseStats()
+    try:
+        if args.index_file:
+            annotator = GeneAnnotator.from_index_file(args.anno_file, args.index_file, features=args.features, stats=stats)
+        else:
+            annotator = GeneAnnotator.from_gtf(args.anno_file, args.index, args.features, stats)
+    except (IOError, OSError):
+        exit('Please provide a valid file')
+    if stats.lines:
+        sys.stderr.write('{0}\n'.format(stats))
+
+    try:
+        server = make_server(annotator, args.host, args.port, args.socket, args.verbose)
+    except OSError as error:
+        exit('Cannot serve annotations: {0}'.format(error))
+    sys.stderr.write('Serving annotations on {0}\n'.format(args.socket or '{0}:{1}'.format(*server.server_address)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
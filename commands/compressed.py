@@ -0,0 +1,243 @@
+import gzip
+import queue
+import struct
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# First bytes of gzip (and so BGZF) compressed files
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Threads decompressing BGZF blocks, or reading ahead through other gzip files
+DEFAULT_THREADS = 4
+
+# gzip member header up to the extra field: ID1 ID2 CM FLG MTIME XFL OS XLEN
+GZIP_HEADER = struct.Struct('<4sIBBH')
+# Extra subfield header: SI1 SI2 SLEN
+SUBFIELD_HEADER = struct.Struct('<2sH')
+# Member trailer: CRC32 ISIZE
+GZIP_TRAILER = struct.Struct('<II')
+# gzip header flag for an extra field, which holds BGZF block sizes
+FEXTRA = 4
+BGZF_SUBFIELD = b'BC'
+
+# Decompressed bytes handed over by the read-ahead thread at a time
+READ_AHEAD_SIZE = 1 << 20
+
+# Uncompressed bytes per BGZF block written by `write_bgzf`,
+# leaving room under the 64 KiB block limit for incompressible data
+BGZF_BLOCK_DATA_SIZE = 0xff00
+# Empty block marking the end of a BGZF file
+BGZF_EOF = bytes(bytearray([
+    0x1f, 0x8b, 0x08, 0x04, 0x00, 0x00, 0x00, 0x00, 0x00, 0xff, 0x06, 0x00, 0x42, 0x43,
+    0x02, 0x00, 0x1b, 0x00, 0x03, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+]))
+
+
+def get_bgzf_block_size(header, extra):
+    '''
+    Returns total size of BGZF block from its gzip header and extra
+    field, or None if the member is not a BGZF block
+    '''
+
+    magic, _, _, _, _ = GZIP_HEADER.unpack(header)
+    if magic[:2] != GZIP_MAGIC or not ord(magic[3:4]) & FEXTRA:
+        return None
+
+    position = 0
+    while position + SUBFIELD_HEADER.size <= len(extra):
+        subfield, length = SUBFIELD_HEADER.unpack_from(extra, position)
+        position += SUBFIELD_HEADER.size
+        if subfield == BGZF_SUBFIELD and length == 2:
+            return struct.unpack_from('<H', extra, position)[0] + 1
+        position += length
+
+
+def inflate_block(cdata, crc, size):
+    '''
+    Decompresses raw deflate data of a gzip member, checking its
+    trailer. zlib releases the GIL, so blocks inflate in parallel threads
+    '''
+
+    data = zlib.decompress(cdata, -zlib.MAX_WBITS)
+    if len(data) != size or zlib.crc32(data) & 0xffffffff != crc:
+        raise IOError('BGZF block failed CRC check')
+    return data
+
+
+class BgzfReader(object):
+    '''
+    Reads BGZF (blocked gzip, as written by bgzip) file, decompressing
+    blocks ahead of the reader in a pool of threads, in order
+    '''
+
+    def __init__(self, f, threads=DEFAULT_THREADS):
+        self.f = f
+        self.pool = ThreadPoolExecutor(max(threads, 1))
+        self.max_pending = max(threads, 1) * 4
+        self.pending = deque()
+        self.buffer = b''
+        self.exhausted = False
+
+    def _submit_block(self):
+        header = self.f.read(GZIP_HEADER.size)
+        if not header:
+            self.exhausted = True
+            return
+        xlen = GZIP_HEADER.unpack(header)[-1]
+        extra = self.f.read(xlen)
+        block_size = get_bgzf_block_size(header, extra)
+        if block_size is None:
+            raise IOError('Not a BGZF block')
+
+        rest = self.f.read(block_size - GZIP_HEADER.size - xlen)
+        crc, size = GZIP_TRAILER.unpack(rest[-GZIP_TRAILER.size:])
+        self.pending.append(self.pool.submit(inflate_block, rest[:-GZIP_TRAILER.size], crc, size))
+
+    def read(self, size=-1):
+        pieces = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            while not self.exhausted and len(self.pending) < self.max_pending:
+                self._submit_block()
+            if not self.pending:
+                break
+            data = self.pending.popleft().result()
+            pieces.append(data)
+            length += len(data)
+
+        data = b''.join(pieces)
+        if size < 0:
+            size = len(data)
+        self.buffer = data[size:]
+        return data[:size]
+
+    def close(self):
+        for future in self.pending:
+            future.cancel()
+        self.pool.shutdown()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ReadAheadReader(object):
+    '''
+    Reads file object in a background thread, so decompression of
+    a plain (non-BGZF) gzip file overlaps with processing its data
+    '''
+
+    def __init__(self, f, chunks_ahead=DEFAULT_THREADS):
+        self.f = f
+        self.chunks = queue.Queue(max(chunks_ahead, 1))
+        self.buffer = b''
+        # Start of the unread part of `buffer`, so reads smaller than
+        # a chunk slice it in place rather than copying the rest
+        self.offset = 0
+        self.exhausted = False
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._read_ahead)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _read_ahead(self):
+        try:
+            while not self.closed.is_set():
+                data = self.f.read(READ_AHEAD_SIZE)
+                self._put(data)
+                if not data:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self.closed.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def read(self, size=-1):
+        if 0 <= size <= len(self.buffer) - self.offset:
+            self.offset += size
+            return self.buffer[self.offset - size:self.offset]
+
+        pieces = [self.buffer[self.offset:]]
+        length = len(pieces[0])
+        self.offset = 0
+        while not self.exhausted and (size < 0 or length < size):
+            data = self.chunks.get()
+            if isinstance(data, Exception):
+                raise data
+            if not data:
+                self.exhausted = True
+            pieces.append(data)
+            length += len(data)
+
+        data = b''.join(pieces)
+        if size < 0:
+            size = len(data)
+        self.buffer = data[size:]
+        return data[:size]
+
+    def close(self):
+        self.closed.set()
+        self.thread.join()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_bgzf(filename, data, level=6):
+    '''
+    Writes bytes `data` to `filename` as BGZF, readable by both gzip and bgzip
+    '''
+
+    with open(filename, 'wb') as f:
+        for start in range(0, len(data), BGZF_BLOCK_DATA_SIZE):
+            block = data[start:start + BGZF_BLOCK_DATA_SIZE]
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+            cdata = compressor.compress(block) + compressor.flush()
+            extra = SUBFIELD_HEADER.pack(BGZF_SUBFIELD, 2) + struct.pack(
+                '<H', GZIP_HEADER.size + 6 + len(cdata) + GZIP_TRAILER.size - 1
+            )
+            f.write(GZIP_HEADER.pack(GZIP_MAGIC + b'\x08' + bytes(bytearray([FEXTRA])), 0, 0, 0xff, len(extra)))
+            f.write(extra)
+            f.write(cdata)
+            f.write(GZIP_TRAILER.pack(zlib.crc32(block) & 0xffffffff, len(block)))
+        f.write(BGZF_EOF)
+
+
+def open_binary(filename, threads=DEFAULT_THREADS, read_ahead=False):
+    '''
+    Opens plain, gzip or BGZF compressed file for reading as bytes.
+    BGZF blocks are decompressed by `threads` in parallel; other gzip
+    files (including multi-member) are decompressed in one thread,
+    ahead of the reader. With `read_ahead` plain files are also read
+    in a thread ahead of the reader, e.g. to read several at once
+    '''
+
+    f = open(filename, 'rb')
+    header = f.read(GZIP_HEADER.size)
+    if header[:2] != GZIP_MAGIC:
+        f.seek(0)
+        return ReadAheadReader(f, threads) if read_ahead else f
+
+    extra = b''
+    if len(header) == GZIP_HEADER.size and ord(header[3:4]) & FEXTRA:
+        extra = f.read(GZIP_HEADER.unpack(header)[-1])
+    if extra and get_bgzf_block_size(header, extra) is not None:
+        f.seek(0)
+        return BgzfReader(f, threads)
+    f.close()
+    return ReadAheadReader(gzip.open(filename, 'rb'), threads)
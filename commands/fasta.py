@@ -0,0 +1,51 @@
+# Streaming FASTA readers shared by commands.
+
+# Records wrapped over many lines (contigs, whole chromosomes at 60
+# columns) are collected as a list of line fragments and joined once
+# per record, so assembling a record is linear in its length rather
+# than building a new, longer string for every line.
+
+
+def read_records(f):
+    '''
+    Yields (header, sequence) of each record of an open FASTA file
+    (or any iterable of lines), header without its '>'. Lines before
+    the first header are yielded as a record with header None
+    '''
+
+    header = None
+    fragments = []
+    for line in f:
+        if line[:1] == '>':
+            if header is not None or fragments:
+                yield header, ''.join(fragments)
+            header = line[1:].strip()
+            fragments = []
+        else:
+            fragments.append(line.strip())
+
+    if header is not None or fragments:
+        yield header, ''.join(fragments)
+
+
+def read_sequences(f):
+    '''
+    Yields each sequence of an open FASTA file (or any iterable of
+    lines), joining sequences broken apart over multiple lines.
+    Records without sequence are skipped, except the last, which is
+    always yielded
+    '''
+
+    fragments = []
+    for line in f:
+        if line[:1] == '>':  # Beginning of new sequence
+            if fragments:
+                seq = ''.join(fragments)
+                if seq:
+                    yield seq
+                fragments = []
+        else:
+            fragments.append(line.strip())
+
+    # Final sequence at end of file
+    yield ''.join(fragments)
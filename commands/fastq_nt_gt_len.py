@@ -4,9 +4,39 @@ import sys
 import os
 import fnmatch
 import argparse
+import json
+import multiprocessing
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+if not __package__:
+    # Run as a script: make the `commands` package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commands import compressed, fastq_scan
+from commands.profiling import RunStats
+from commands.scan_cache import ScanCache, file_key
 
 NT_DEFAULT_LENGTH = 30
 
+# File names recognised as FASTQ, plain or gzip/BGZF compressed
+FASTQ_PATTERNS = ('*.fastq', '*.fastq.gz', '*.fq', '*.fq.gz')
+
+# Orders in which results of files scanned in parallel are printed
+ORDERS = ('input', 'completion')
+
+# Mate number of paired-end files, from a file name token such as
+# _R1_ or _R2. (Illumina) or, failing that, _1. or _2. (SRA), or from a
+# directory such as read1/ or R2/
+MATE_NAME = re.compile(r'(?<=[._])R([12])(?=[._])')
+MATE_NUMBER = re.compile(r'(?<=[._])([12])(?=[._])')
+MATE_DIR = re.compile(r'^(?:read|r)([12])$', re.IGNORECASE)
+
+# Output formats of QC statistics, and their columns following the file name
+QC_FORMATS = ('tsv', 'json')
+QC_COLUMNS = ('reads', 'bases', 'mean_length', 'gc_percent', 'n_percent')
+
 task = '''
 FASTQ Percent Nucleotides Greater than Length.
 
@@ -15,57 +45,516 @@ report each file name and the percent of sequences in that file
 that are greater than `length` nucleotides long (default={default_len}).
 '''.format(default_len=NT_DEFAULT_LENGTH)
 
-def get_files(base_dir):
+def compile_globs(patterns):
+    '''
+    Returns function matching a name against any of the glob `patterns`
+    in a single regular expression match, or None for no patterns
+    '''
+
+    if not patterns:
+        return None
+    regex = re.compile('|'.join(fnmatch.translate(os.path.normcase(pattern)) for pattern in patterns))
+    return lambda name: regex.match(os.path.normcase(name)) is not None
+
+def list_dir(path, depth, include, exclude=None, max_depth=None):
+    '''
+    Lists directory `path`, at `depth` below the base directory, in one
+    `os.scandir` pass. Returns (paths of files matching `include`,
+    subdirectories to descend). Entries matching `exclude`, files or
+    directories, are skipped; subdirectories are not descended beyond
+    `max_depth`, nor through symlinks. Unreadable directories are
+    skipped, as `os.walk` does
+    '''
+
+    files = []
+    subdirs = []
+    descend = max_depth is None or depth < max_depth
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if exclude is not None and exclude(entry.name):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                    if is_dir and (not descend or entry.is_symlink()):
+                        continue
+                except OSError:
+                    continue
+                if is_dir:
+                    subdirs.append(entry.path)
+                elif include(entry.name):
+                    files.append(entry.path)
+    except OSError:
+        pass
+    return files, subdirs
+
+def get_files(base_dir, patterns=FASTQ_PATTERNS, exclude=(), max_depth=None, threads=1):
+    '''
+    Recursively walks the directory, yielding paths of files matching
+    any of the glob `patterns` as they are found. Files and directories
+    matching any of the `exclude` globs are skipped, and directories
+    deeper than `max_depth` below `base_dir` (0 for only its own files)
+    are not walked.
+    With `threads` > 1 directories are listed in parallel threads, each
+    directory's files yielded as soon as it is listed, in no fixed
+    order; otherwise in `os.walk` order
+    '''
+
+    include = compile_globs(patterns) or (lambda name: False)
+    exclude = compile_globs(exclude)
+    if threads > 1:
+        return _get_files_parallel(base_dir, include, exclude, max_depth, threads)
+    return _get_files_serial(base_dir, include, exclude, max_depth)
+
+def _get_files_serial(base_dir, include, exclude, max_depth):
+    # Depth first, each directory's files before its subdirectories
+    stack = [(base_dir, 0)]
+    while stack:
+        path, depth = stack.pop()
+        files, subdirs = list_dir(path, depth, include, exclude, max_depth)
+        for filename in files:
+            yield filename
+        stack.extend((subdir, depth + 1) for subdir in reversed(subdirs))
+
+def _get_files_parallel(base_dir, include, exclude, max_depth, threads):
+    # Each directory listed is a task; its subdirectories are queued
+    # before its files are yielded, so threads keep listing while the
+    # files are processed
+    pool = ThreadPoolExecutor(threads)
+    pending = {pool.submit(list_dir, base_dir, 0, include, exclude, max_depth): 0}
+    try:
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                depth = pending.pop(future)
+                files, subdirs = future.result()
+                for subdir in subdirs:
+                    pending[pool.submit(list_dir, subdir, depth + 1, include, exclude, max_depth)] = depth + 1
+                for filename in files:
+                    yield filename
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+def mate_key(filename):
     '''
-    Recursively walk deeper into the directory.
-    I was unsure of the status of this being third-party
-    I would be happy to implement the logic for this 
-    recursive search upon request
+    Returns (key shared by the mates of a pair, mate number 1 or 2) of
+    a paired-end file name, the mate token replaced in the key, or
+    None if no mate token is found. In the file name the last token is
+    taken, an R1/R2 token before a bare 1/2
     '''
 
-    for root, dirnames, filenames in os.walk(base_dir):
-        for filename in fnmatch.filter(filenames, '*.fastq'):
-            yield os.path.join(root, filename)
+    dirname, basename = os.path.split(os.path.normpath(filename))
+    mate = None
+    for pattern in (MATE_NAME, MATE_NUMBER):
+        matches = list(pattern.finditer(basename))
+        if matches:
+            match = matches[-1]
+            mate = int(match.group(1))
+            basename = basename[:match.start(1)] + '?' + basename[match.end(1):]
+            break
+
+    components = dirname.split(os.sep)
+    for index in range(len(components) - 1, -1, -1):
+        match = MATE_DIR.match(components[index])
+        if match:
+            if mate is None:
+                mate = int(match.group(1))
+            components[index] = components[index][:match.start(1)] + '?'
+            break
 
-def get_perc_gt_len(filename, nt_len):
+    if mate is None:
+        return None
+    return (os.sep.join(components), basename), mate
+
+def pair_files(filenames, unpaired=None):
+    '''
+    Yields (R1 filename, R2 filename) of paired-end files as soon as
+    both mates are found, matched by `mate_key`. Files without a mate,
+    or with a mate token shared by another file, are appended to
+    list `unpaired` if given
+    '''
+
+    pending = {}
+    for filename in filenames:
+        found = mate_key(filename)
+        if found is None:
+            if unpaired is not None:
+                unpaired.append(filename)
+            continue
+
+        key, mate = found
+        mates = pending.setdefault(key, {})
+        if mate in mates:
+            if unpaired is not None:
+                unpaired.append(filename)
+            continue
+        mates[mate] = filename
+        if len(mates) == 2:
+            del pending[key]
+            yield mates[1], mates[2]
+
+    if unpaired is not None:
+        for mates in pending.values():
+            unpaired.extend(mates.values())
+
+def get_histogram(filename, threads=compressed.DEFAULT_THREADS, engine=fastq_scan.DEFAULT_ENGINE):
+    '''
+    Scan file once, returning `LengthHistogram` of its sequence lengths.
+    Compressed files are decompressed on the fly, BGZF blocks by
+    `threads` in parallel. Chunks are scanned by `engine`, one of
+    `fastq_scan.ENGINES`
+    '''
+
+    with compressed.open_binary(filename, threads) as f:
+        return fastq_scan.length_histogram(f, engine=engine)
+
+def get_read_stats(filename, threads=compressed.DEFAULT_THREADS, engine=fastq_scan.DEFAULT_ENGINE):
+    '''
+    Scan file once, returning `ReadStats` of its read lengths, G/C and
+    N content and qualities by position
+    '''
+
+    with compressed.open_binary(filename, threads) as f:
+        return fastq_scan.read_stats(f, engine=engine)
+
+def get_pair_stats(r1_filename, r2_filename, threads=compressed.DEFAULT_THREADS):
+    '''
+    Scan paired-end files once, in lockstep, each read by its own thread,
+    returning `PairStats` of their mate lengths.
+    Raises `fastq_scan.PairingError` if their reads are not mates
+    '''
+
+    with compressed.open_binary(r1_filename, threads, read_ahead=True) as f1, \
+            compressed.open_binary(r2_filename, threads, read_ahead=True) as f2:
+        return fastq_scan.pair_stats(f1, f2)
+
+def count_gt_len(filename, nt_len, threads=compressed.DEFAULT_THREADS, engine=fastq_scan.DEFAULT_ENGINE):
+    '''
+    Count and return the total number of sequences and the
+    number of sequences greater than the requested nucleotide length
+    '''
+
+    histogram = get_histogram(filename, threads, engine)
+    return histogram.total(), histogram.count_gt(nt_len)
+
+def get_perc_gt_len(filename, nt_len, threads=compressed.DEFAULT_THREADS, engine=fastq_scan.DEFAULT_ENGINE):
     '''
     Calculate and return the percent of sequences greater
     than the requested nucleotide length
     '''
 
-    seq_total = 0  # Accumulator for all sequences
-    seq_gt_len = 0  # Accumulator for sequences greater than `nt_len`
+    return get_histogram(filename, threads, engine).perc_gt(nt_len)
+
+def _scan(filename, threads, qc, engine):
+    return get_read_stats(filename, threads, engine) if qc else get_histogram(filename, threads, engine)
+
+def _scan_file(job):
+    # Keys are taken here, in the worker, as checksums read whole files.
+    # A file whose key matches its cached key is not scanned, its
+    # result is None for the caller to take from the cache
+    filename, threads, qc, engine, checksum, cached_key = job
+    key = None
+    if checksum is not None:
+        key = file_key(filename, checksum)
+        if key == cached_key:
+            return filename, None, os.path.getsize(filename), key
+    return filename, _scan(filename, threads, qc, engine), os.path.getsize(filename), key
+
+def scan_files(filenames, jobs=1, order='input', threads=compressed.DEFAULT_THREADS, cache=None, qc=False,
+               engine=fastq_scan.DEFAULT_ENGINE):
+    '''
+    Scans each file once, yielding (filename, `LengthHistogram`, or
+    with `qc` `ReadStats`, file size in bytes).
+    With `jobs` > 1 files are spread across a process pool, and results
+    come in the order of `filenames` or, for `order` 'completion',
+    as soon as each file is finished.
+    Each compressed file is decompressed by up to `threads` threads.
+    Files unchanged since they were stored in `ScanCache` `cache` are
+    not scanned again, the files scanned are stored in it.
+    Chunks of each file are scanned by `engine`, see `get_histogram`
+    '''
+
+    def make_job(filename):
+        if cache is None:
+            return filename, threads, qc, engine, None, None
+        return filename, threads, qc, engine, cache.checksum, cache.cached_key(filename, qc)
+
+    jobs_iter = (make_job(filename) for filename in filenames)
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs)
+        imap = pool.imap if order == 'input' else pool.imap_unordered
+        results = imap(_scan_file, jobs_iter)
+    else:
+        pool = None
+        results = (_scan_file(job) for job in jobs_iter)
+
+    try:
+        for filename, scanned, num_bytes, key in results:
+            if cache is not None:
+                cached = cache.get(filename, key, qc)
+                if scanned is not None:
+                    # Stored under the key taken before scanning, so a file
+                    # changed meanwhile is scanned again next time
+                    cache.put(filename, key, scanned)
+                elif cached is not None:
+                    scanned = cached
+                else:
+                    # Cached result unreadable after all
+                    scanned = _scan(filename, threads, qc, engine)
+                    cache.put(filename, key, scanned)
+            yield filename, scanned, num_bytes
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def format_result(filename, histogram, nt_lens, percentiles=(), summary=False):
+    '''
+    Returns tab-separated line of file name, percent of sequences greater
+    than each of `nt_lens`, then length of each of `percentiles` and, for
+    `summary`, number of reads, mean length and N50
+    '''
+
+    columns = [filename]
+    columns.extend(histogram.perc_gt(nt_len) for nt_len in nt_lens)
+    columns.extend(histogram.percentile(perc) for perc in percentiles)
+    if summary:
+        columns.extend([histogram.total(), histogram.mean(), histogram.n50()])
+    return '\t'.join(map(str, columns))
+
+def _scan_pair(job):
+    r1_filename, r2_filename, threads = job
+    try:
+        stats = get_pair_stats(r1_filename, r2_filename, threads)
+    except fastq_scan.PairingError as e:
+        # Reported by the caller rather than ending the pool
+        stats = e
+    return (r1_filename, r2_filename), stats, os.path.getsize(r1_filename) + os.path.getsize(r2_filename)
+
+def scan_pairs(pairs, jobs=1, order='input', threads=compressed.DEFAULT_THREADS):
+    '''
+    Scans each pair of paired-end files once, in lockstep, yielding
+    ((R1 filename, R2 filename), `PairStats`, bytes of both files).
+    A pair whose reads are not mates yields its `PairingError` in place
+    of `PairStats`. `jobs` and `order` are as for `scan_files`
+    '''
+
+    jobs_iter = ((r1_filename, r2_filename, threads) for r1_filename, r2_filename in pairs)
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs)
+        imap = pool.imap if order == 'input' else pool.imap_unordered
+        results = imap(_scan_pair, jobs_iter)
+    else:
+        pool = None
+        results = (_scan_pair(job) for job in jobs_iter)
+
+    try:
+        for result in results:
+            yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def format_pair_result(filenames, pair_stats, nt_lens, summary=False):
+    '''
+    Returns tab-separated line of R1 and R2 file names, then for each of
+    `nt_lens` the percent of pairs with both mates longer than it and
+    the percent with either mate longer and, for `summary`, number of
+    pairs and mean length of R1 and of R2 reads
+    '''
+
+    columns = list(filenames)
+    for nt_len in nt_lens:
+        columns.extend([pair_stats.perc_both_gt(nt_len), pair_stats.perc_either_gt(nt_len)])
+    if summary:
+        columns.extend([pair_stats.total(), pair_stats.first.mean(), pair_stats.second.mean()])
+    return '\t'.join(map(str, columns))
+
+def format_qc(filename, read_stats, output_format='tsv'):
+    '''
+    Returns QC statistics of a file as a JSON object, or a tab-separated
+    line of file name, number of reads, bases, mean read length, percent
+    G/C and percent N bases, then comma-separated mean quality by position
+    '''
 
-    with open(filename, 'r') as f:
-        while True:
-            # Read 4 lines at a time, as per FASTQ specifications
-            seq_identifier = f.readline()
-            raw_seq = f.readline()
-            quality_identifier = f.readline()
-            quality_scores = f.readline()
+    summary = read_stats.summary()
+    if output_format == 'json':
+        summary['file'] = filename
+        return json.dumps(summary, sort_keys=True)
 
-            if not seq_identifier:
-                # End of file reached
-                if not seq_total:
-                    return 0.0
-                return float(seq_gt_len) / seq_total * 100
+    columns = [filename] + [summary[name] for name in QC_COLUMNS]
+    columns.append(','.join('{0:.2f}'.format(quality) for quality in summary['mean_quality_by_position']))
+    return '\t'.join(map(str, columns))
 
-            if len(raw_seq) > nt_len:
-                seq_gt_len += 1
-            seq_total += 1
+class Progress(object):
+    '''
+    Writes running totals of files, bytes and reads scanned,
+    with rates per second, to a stream (stderr)
+    '''
+
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+        self.started = time.time()
+        self.files = 0
+        self.bytes = 0
+        self.reads = 0
+
+    def update(self, num_bytes, num_reads):
+        self.files += 1
+        self.bytes += num_bytes
+        self.reads += num_reads
+        elapsed = max(time.time() - self.started, 1e-9)
+        self.stream.write('\r{0} files, {1:.1f} MB ({2:.1f} MB/s), {3} reads ({4:.0f} reads/s)'.format(
+            self.files, self.bytes / 1e6, self.bytes / 1e6 / elapsed, self.reads, self.reads / elapsed
+        ))
+        self.stream.flush()
+
+    def finish(self):
+        if self.files:
+            self.stream.write('\n')
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=task)
     parser.add_argument('base_dir', help='Base directory from which recursive search begins')
-    parser.add_argument('-l', '--length', type=int, 
-        help='Filter nucleotides greater than length. Defaults to {default_len}'.format(default_len=NT_DEFAULT_LENGTH)
+    parser.add_argument('-l', '--length', type=int, action='append',
+        help='Filter nucleotides greater than length. May be repeated, one column per length. Defaults to {default_len}'.format(default_len=NT_DEFAULT_LENGTH)
+    )
+    parser.add_argument('-p', '--percentile', type=float, action='append', default=[],
+        help='Also report the read length at this percentile. May be repeated'
+    )
+    parser.add_argument('--summary', action='store_true',
+        help='Also report number of reads, mean read length and N50'
+    )
+    parser.add_argument('--qc', choices=QC_FORMATS,
+        help='Report QC statistics of each file instead, from the same single pass: number of reads and bases, '
+             'mean read length, percent G/C and N bases and mean quality at each read position, '
+             'as a tab-separated line or a JSON object (also holding the read length histogram) per file. '
+             'Meant for the numpy engine, the python engine takes over twice as long'
+    )
+    parser.add_argument('--paired', action='store_true',
+        help='Pair R1/R2 files by name (e.g. Sample_R1.fastq and Sample_R2.fastq, or read1/ and read2/) and read '
+             'each pair in lockstep, checking mates share a read name. Reports, for each length, the percent of '
+             'pairs with both mates longer and with either mate longer'
+    )
+    parser.add_argument('--histograms',
+        help='Save the read length histogram of every file, as JSON keyed by file name, to this path'
     )
 
+    parser.add_argument('-i', '--include', action='append',
+        help='Glob of file names to scan. May be repeated. Defaults to {patterns}'.format(patterns=' '.join(FASTQ_PATTERNS))
+    )
+    parser.add_argument('-x', '--exclude', action='append', default=[],
+        help='Glob of file or directory names to skip, e.g. "Undetermined*". May be repeated'
+    )
+    parser.add_argument('--max-depth', type=int,
+        help='Only search this many directory levels below base_dir, 0 for its own files. Defaults to no limit'
+    )
+    parser.add_argument('--walk-threads', type=int, default=1,
+        help='Threads listing directories in parallel, for large trees on network filesystems. '
+             'Files are then found in no fixed order. Defaults to 1'
+    )
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+        help='Number of processes scanning files in parallel. Defaults to 1'
+    )
+    parser.add_argument('--order', choices=ORDERS, default=ORDERS[0],
+        help='Print results in file discovery order (input) or as each file finishes (completion). Defaults to input'
+    )
+    parser.add_argument('--engine', choices=fastq_scan.ENGINES, default=fastq_scan.DEFAULT_ENGINE,
+        help='Scan chunks of records with NumPy vectorized operations (numpy) or in pure Python (python). '
+             'Defaults to {engine}, numpy when installed'.format(engine=fastq_scan.DEFAULT_ENGINE)
+    )
+    parser.add_argument('-t', '--threads', type=int, default=compressed.DEFAULT_THREADS,
+        help='Threads decompressing each BGZF compressed file. Defaults to {threads}'.format(threads=compressed.DEFAULT_THREADS)
+    )
+    parser.add_argument('--progress', action='store_true',
+        help='Report bytes and reads scanned per second to stderr'
+    )
+    parser.add_argument('--cache',
+        help='Path to cache of scan results, created if missing. Files unchanged in path, size, modification time '
+             'and inode since the last run are not scanned again, entries of deleted or changed files are dropped'
+    )
+    parser.add_argument('--cache-checksum', action='store_true',
+        help='Also compare a checksum of each file\'s contents with the --cache, for filesystems with unreliable '
+             'modification times. Every file is read, but cached files are not parsed'
+    )
+    parser.add_argument('--stats', action='store_true',
+        help='Report time, records and throughput of each phase (discover, scan, output) and peak memory to stderr'
+    )
+    parser.add_argument('--stats-json', help='Write the --stats report as JSON to this path')
+    parser.add_argument('--profile', help='Profile the run with cProfile, saving its stats to this path')
+
     args = parser.parse_args()
+    if args.paired and (args.qc or args.cache or args.percentile):
+        parser.error('--paired cannot be combined with --qc, --cache or --percentile')
+    if args.engine == 'numpy' and fastq_scan.numpy is None:
+        parser.error('--engine numpy needs NumPy installed')
+    if args.qc and args.engine == 'python':
+        sys.stderr.write('--qc scans over twice as fast with {0}\n'.format(
+            'NumPy installed' if fastq_scan.numpy is None else '--engine=numpy'
+        ))
+
+    nt_lens = args.length or [NT_DEFAULT_LENGTH]
+    progress = Progress() if args.progress else None
+    histograms = {}
+    run_stats = RunStats('fastq_nt_gt_len', args.profile, child_processes=args.jobs > 1)
+    cache = ScanCache(args.cache, args.cache_checksum) if args.cache else None
+    num_reads = 0
+    num_bytes_scanned = 0
+
+    # Files are found as they are scanned, and scanned as results are
+    # written: time inside the scan includes discovery, split out after
+    started = time.time()
+    filenames = run_stats.timed(get_files(args.base_dir, args.include or FASTQ_PATTERNS, args.exclude,
+                                          args.max_depth, args.walk_threads), 'discover')
+    unpaired = []
+    if args.paired:
+        results = scan_pairs(pair_files(filenames, unpaired), args.jobs, args.order, args.threads)
+    else:
+        results = scan_files(filenames, args.jobs, args.order, args.threads, cache, qc=bool(args.qc),
+                             engine=args.engine)
+    for filename, scanned, num_bytes in run_stats.timed(results, 'scan'):
+        if args.paired:
+            if isinstance(scanned, fastq_scan.PairingError):
+                sys.stderr.write('Skipping {0} and {1}: {2}\n'.format(filename[0], filename[1], scanned))
+                continue
+            print(format_pair_result(filename, scanned, nt_lens, args.summary))
+            # Each mate file's own histogram, as if scanned alone
+            file_histograms = zip(filename, [scanned.first, scanned.second])
+            file_reads = scanned.total() * 2
+        else:
+            histogram = scanned.histogram if args.qc else scanned
+            if args.qc:
+                print(format_qc(filename, scanned, args.qc))
+            else:
+                print(format_result(filename, histogram, nt_lens, args.percentile, args.summary))
+            file_histograms = [(filename, histogram)]
+            file_reads = histogram.total()
+        if args.histograms:
+            for histogram_filename, histogram in file_histograms:
+                histograms[histogram_filename] = histogram.to_dict()
+        if progress:
+            progress.update(num_bytes, file_reads)
+        num_reads += file_reads
+        num_bytes_scanned += num_bytes
+    if progress:
+        progress.finish()
+    for filename in unpaired:
+        sys.stderr.write('No mate file found for {0}\n'.format(filename))
 
-    nt_len = args.length or NT_DEFAULT_LENGTH
+    if args.histograms:
+        with open(args.histograms, 'w') as f:
+            json.dump(histograms, f, sort_keys=True)
+    if cache is not None:
+        cache.save()
+        if args.stats:
+            sys.stderr.write('{0}\n'.format(cache))
 
-    for filename in get_files(args.base_dir):
-        print('\t'.join(map(str, [filename, get_perc_gt_len(filename, nt_len)])))
+    scan = run_stats.get_phase('scan')
+    run_stats.add('output', time.time() - started - scan.seconds, scan.records)
+    scan.seconds -= run_stats.get_phase('discover').seconds
+    scan.records = num_reads
+    scan.bytes = num_bytes_scanned
+    run_stats.finish(args.stats, args.stats_json)
 
@@ -0,0 +1,413 @@
+# Chunked byte-level FASTQ scanning.
+
+# Files are read in large binary chunks and split on newlines in one
+# C-level call per chunk; sequence lines are then picked out by slicing
+# every 4th line, so no per-record Python calls or str decoding are
+# involved. Records spanning chunk boundaries are handled by carrying
+# the incomplete last line, and the position within the 4-line record,
+# over to the next chunk.
+
+# QC statistics are gathered per chunk in the same C-level style:
+# G/C and N bases are counted by translating the chunk's joined
+# sequence lines to 0/1 bytes and counting the set bits of them read
+# as one integer. Qualities are summed by position by padding up to
+# `QUALITY_ROWS` quality lines to one length (unless they already are)
+# and joining them, so every position's column of qualities is one
+# strided slice of the rows. The lower 16 bits of the Adler-32 checksum
+# of a column are 1 plus the sum of its bytes modulo 65521, which is
+# its exact sum as `QUALITY_ROWS` qualities (< 128) sum to less.
+
+# Paired-end files are read in lockstep: each file's chunks yield its
+# header and sequence lines, buffered until both files have completed
+# the same number of records, so mates line up by position and are
+# checked to share a read name. Headers of mates usually differ only in
+# the mate number (@name/1 and @name/2, or @name 1:N:... and @name
+# 2:N:...), so each step's headers are joined and compared as one
+# string with the mate number swapped, read names being split out of
+# each header only if that comparison fails.
+
+# With NumPy installed, lengths and QC statistics are instead computed
+# a whole chunk at a time by vectorized operations (the 'numpy' engine):
+# newline offsets are located in the chunk, line lengths are the
+# differences of line end and start offsets, and the lengths of every
+# 4th line are binned into the histogram at once. For QC statistics
+# the sequence and quality lines are copied out as rows of a 2D array
+# (of overlapping windows of the chunk, zeroed past each line's end),
+# so G/C and N bases are counted by comparing every byte of it, and
+# qualities summed by position by adding up its columns. Without NumPy
+# the pure Python engine above ('python') is used.
+
+import zlib
+from collections import Counter
+
+try:
+    import numpy
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:
+    # Chunks are scanned by the pure Python engine
+    numpy = None
+
+from commands.structures.length_histogram import LengthHistogram
+from commands.structures.pair_stats import PairStats
+from commands.structures.read_stats import ReadStats
+
+# Bytes read from the file at a time. Kept small enough that a
+# chunk's split lines are still in CPU cache when they are counted
+CHUNK_SIZE = 1 << 17
+
+# Bytes read at a time by the numpy engine, large enough for the
+# per-chunk NumPy calls to be negligible, small enough to stay in cache
+NUMPY_CHUNK_SIZE = 1 << 20
+
+# Engines scanning chunks of records
+ENGINES = ('numpy', 'python')
+DEFAULT_ENGINE = 'numpy' if numpy is not None else 'python'
+
+# Lines of a record
+HEADER_LINE = 0
+SEQ_LINE = 1
+QUAL_LINE = 3
+
+# Quality lines summed at a time, by Adler-32 checksums of their columns
+QUALITY_ROWS = 512
+
+
+class PairingError(ValueError):
+    '''
+    Raised when the reads of paired-end files are not mates
+    '''
+
+
+def _byte_table(chars):
+    table = bytearray(256)
+    for char in chars:
+        table[ord(char)] = 1
+    return bytes(table)
+
+GC_TABLE = _byte_table('GCgc')
+N_TABLE = _byte_table('Nn')
+
+if hasattr(int, 'bit_count'):
+    def count_bytes(data, table):
+        '''
+        Returns number of bytes of `data` which `table` translates to 1
+        '''
+        return int.from_bytes(data.translate(table), 'little').bit_count()
+else:
+    def count_bytes(data, table):
+        return data.translate(table).count(b'\x01')
+
+
+def iter_record_lines(f, chunk_size=CHUNK_SIZE, offsets=(SEQ_LINE, QUAL_LINE)):
+    '''
+    Reads binary FASTQ stream `f` chunk by chunk, yielding a tuple per
+    chunk with, for each of `offsets` (lines of a record, 0-3), a list
+    of those lines completed in it (bytes, without line endings)
+    '''
+
+    leftover = b''
+    # Position within its record (0-3) of the first line of the next chunk
+    phase = 0
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+
+        buffer = leftover + chunk
+        lines = buffer.split(b'\n')
+        # Last line is incomplete, unless chunk ended with a newline (then empty)
+        leftover = lines.pop()
+
+        selected = tuple(lines[(offset - phase) % 4::4] for offset in offsets)
+        if b'\r' in buffer:
+            selected = tuple([line.rstrip(b'\r') for line in lines] for lines in selected)
+        phase = (phase + len(lines)) % 4
+        yield selected
+
+    # Final line when file does not end with a newline
+    if leftover and phase in offsets:
+        yield tuple([leftover.rstrip(b'\r')] if offset == phase else [] for offset in offsets)
+
+
+def iter_seq_lines(f, chunk_size=CHUNK_SIZE):
+    '''
+    Reads binary FASTQ stream `f` chunk by chunk, yielding a list per
+    chunk of the sequence lines completed in it (bytes, without line endings)
+    '''
+
+    for seq_lines, in iter_record_lines(f, chunk_size, (SEQ_LINE,)):
+        yield seq_lines
+
+
+def quality_sums(qual_lines):
+    '''
+    Returns list of the sums of quality characters at each position
+    of at most `QUALITY_ROWS` quality lines
+    '''
+
+    lengths = list(map(len, qual_lines))
+    width = max(lengths)
+    if min(lengths) == width:
+        rows = b''.join(qual_lines)
+    else:
+        rows = b''.join([line.ljust(width, b'\0') for line in qual_lines])
+    return [(zlib.adler32(rows[position::width]) & 0xffff) - 1 for position in range(width)]
+
+
+def read_stats(f, chunk_size=None, engine=DEFAULT_ENGINE):
+    '''
+    Returns `ReadStats` of binary FASTQ stream `f`: read lengths,
+    G/C and N bases and qualities by position, in a single pass by
+    `engine` in chunks of `chunk_size` bytes (defaults to the engine's own)
+    '''
+
+    check_engine(engine)
+    if engine == 'numpy':
+        return _numpy_read_stats(f, chunk_size or NUMPY_CHUNK_SIZE)
+
+    stats = ReadStats()
+    for seq_lines, qual_lines in iter_record_lines(f, chunk_size or CHUNK_SIZE):
+        stats.histogram.add_counts(Counter(map(len, seq_lines)))
+        bases = b''.join(seq_lines)
+        stats.gc_bases += count_bytes(bases, GC_TABLE)
+        if b'N' in bases or b'n' in bases:
+            stats.n_bases += count_bytes(bases, N_TABLE)
+        for start in range(0, len(qual_lines), QUALITY_ROWS):
+            stats.add_quality_sums(quality_sums(qual_lines[start:start + QUALITY_ROWS]))
+    return stats
+
+
+def check_engine(engine):
+    if engine not in ENGINES:
+        raise ValueError('Unknown engine {0}'.format(engine))
+    if engine == 'numpy' and numpy is None:
+        raise ValueError('The numpy engine needs NumPy installed')
+
+
+def length_histogram(f, chunk_size=None, engine=DEFAULT_ENGINE):
+    '''
+    Returns `LengthHistogram` of sequence lengths in binary FASTQ stream
+    `f`, scanned by `engine` in chunks of `chunk_size` bytes (defaults
+    to the engine's own)
+    '''
+
+    check_engine(engine)
+    if engine == 'numpy':
+        return _numpy_length_histogram(f, chunk_size or NUMPY_CHUNK_SIZE)
+
+    histogram = LengthHistogram()
+    for seq_lines in iter_seq_lines(f, chunk_size or CHUNK_SIZE):
+        histogram.add_counts(Counter(map(len, seq_lines)))
+    return histogram
+
+
+def count_gt_len(f, nt_len, chunk_size=None, engine=DEFAULT_ENGINE):
+    '''
+    Returns total number of sequences in binary FASTQ stream `f`,
+    and number of sequences longer than `nt_len` nucleotides
+    '''
+
+    histogram = length_histogram(f, chunk_size, engine)
+    return histogram.total(), histogram.count_gt(nt_len)
+
+
+def read_ids(headers):
+    '''
+    Returns read names of header lines, without '@', any comment, or
+    a trailing /1 or /2 mate number
+    '''
+
+    ids = [header.split(None, 1)[0][1:] if header else header for header in headers]
+    return [read_id[:-2] if read_id[-2:] in (b'/1', b'/2') else read_id for read_id in ids]
+
+
+def mates_match(headers1, headers2):
+    '''
+    Returns whether header lines `headers1` and `headers2` are of mates,
+    sharing read names at each position
+    '''
+
+    joined1 = b'\n'.join(headers1) + b'\n'
+    joined2 = b'\n'.join(headers2) + b'\n'
+    if joined1 == joined2 or joined1.replace(b'/1\n', b'/2\n').replace(b' 1:', b' 2:') == joined2:
+        return True
+    return read_ids(headers1) == read_ids(headers2)
+
+
+def iter_mate_lines(f1, f2, chunk_size=CHUNK_SIZE):
+    '''
+    Reads binary FASTQ streams `f1` and `f2` of paired-end reads in
+    lockstep, yielding per step two equally long lists of sequence
+    lines, mates at the same positions.
+    Raises `PairingError` if mates do not share a read name, or one
+    file has more reads than the other
+    '''
+
+    readers = [iter_record_lines(f, chunk_size, (HEADER_LINE, SEQ_LINE)) for f in (f1, f2)]
+    # Header and sequence lines read but not yet paired, of each file
+    pending = [([], []), ([], [])]
+    exhausted = [False, False]
+    paired = 0
+    while True:
+        complete = [min(len(headers), len(seqs)) for headers, seqs in pending]
+        # Read on in the file with fewer complete records
+        side = 0 if complete[0] <= complete[1] else 1
+        if exhausted[side]:
+            if complete[side] != complete[1 - side]:
+                break
+            # Same number so far, the other file must end too
+            side = 1 - side
+            if exhausted[side]:
+                break
+        try:
+            headers, seqs = next(readers[side])
+        except StopIteration:
+            exhausted[side] = True
+            continue
+        pending[side][0].extend(headers)
+        pending[side][1].extend(seqs)
+
+        complete = [min(len(headers), len(seqs)) for headers, seqs in pending]
+        num_pairs = min(complete)
+        if not num_pairs:
+            continue
+
+        (headers1, seqs1), (headers2, seqs2) = pending
+        if not mates_match(headers1[:num_pairs], headers2[:num_pairs]):
+            ids1, ids2 = read_ids(headers1[:num_pairs]), read_ids(headers2[:num_pairs])
+            if ids1 != ids2:
+                index = next(i for i, (id1, id2) in enumerate(zip(ids1, ids2)) if id1 != id2)
+                raise PairingError('Read {0} is not a mate pair: {1} and {2}'.format(
+                    paired + index + 1, ids1[index].decode('utf-8', 'replace'), ids2[index].decode('utf-8', 'replace')
+                ))
+        yield seqs1[:num_pairs], seqs2[:num_pairs]
+        paired += num_pairs
+        pending = [(headers[num_pairs:], seqs[num_pairs:]) for headers, seqs in pending]
+
+    if complete[0] != complete[1]:
+        raise PairingError('File {0} has more reads than its mate file, from read {1}'.format(
+            1 if complete[0] > complete[1] else 2, paired + min(complete) + 1
+        ))
+
+
+def pair_stats(f1, f2, chunk_size=CHUNK_SIZE):
+    '''
+    Returns `PairStats` of mate lengths of paired-end binary FASTQ
+    streams `f1` and `f2`, read in lockstep, see `iter_mate_lines`
+    '''
+
+    # Counted by pair of lengths, far fewer than pairs
+    length_pairs = Counter()
+    for seqs1, seqs2 in iter_mate_lines(f1, f2, chunk_size):
+        length_pairs.update(zip(map(len, seqs1), map(len, seqs2)))
+    return PairStats.from_length_pairs(length_pairs)
+
+
+def iter_line_offsets(f, chunk_size=NUMPY_CHUNK_SIZE):
+    '''
+    Reads binary FASTQ stream `f` chunk by chunk, yielding per chunk
+    (uint8 array of its complete lines, array of the offset each line
+    starts at, array of the offset each ends at without its line
+    ending, position within its record (0-3) of the first line).
+    Needs NumPy
+    '''
+
+    leftover = b''
+    phase = 0
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+
+        buffer = leftover + chunk
+        data = numpy.frombuffer(buffer, dtype=numpy.uint8)
+        ends = numpy.flatnonzero(data == ord('\n'))
+        if not len(ends):
+            leftover = buffer
+            continue
+        # Bytes after the last newline begin the next chunk
+        leftover = buffer[ends[-1] + 1:]
+
+        starts = numpy.empty_like(ends)
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+        if b'\r' in buffer:
+            ends = ends - ((ends > starts) & (data[ends - 1] == ord('\r')))
+        yield data, starts, ends, phase
+        phase = (phase + len(starts)) % 4
+
+    # Final line when file does not end with a newline
+    if leftover:
+        line = leftover.rstrip(b'\r')
+        yield (numpy.frombuffer(leftover, dtype=numpy.uint8), numpy.zeros(1, dtype=numpy.intp),
+               numpy.array([len(line)], dtype=numpy.intp), phase)
+
+
+def _add_totals(totals, counts):
+    # Adds array `counts` to `totals`, returning it grown to fit
+    if len(counts) > len(totals):
+        totals = numpy.concatenate([totals, numpy.zeros(len(counts) - len(totals), dtype=totals.dtype)])
+    totals[:len(counts)] += counts
+    return totals
+
+
+def _line_rows(padded, starts, lengths, width):
+    # Returns array of a row per line of its bytes, copied from
+    # overlapping windows of `padded` (`width` longer than the data),
+    # zeroed past the line's end unless all lines are `width` long
+    rows = sliding_window_view(padded, width)[starts]
+    if lengths.min() < width:
+        # ANDed with a mask row per distinct length, of 0xff bytes up to
+        # it, no more rows than lines, so no more bytes than `rows`
+        present = numpy.flatnonzero(numpy.bincount(lengths, minlength=width + 1))
+        mask_index = numpy.zeros(width + 1, dtype=numpy.intp)
+        mask_index[present] = numpy.arange(len(present))
+        masks = numpy.where(numpy.arange(width) < present[:, None], numpy.uint8(0xff), numpy.uint8(0))
+        numpy.bitwise_and(rows, masks.take(mask_index[lengths], axis=0), out=rows)
+    return rows
+
+
+def _numpy_length_histogram(f, chunk_size):
+    counts = numpy.zeros(0, dtype=numpy.int64)
+    for data, starts, ends, phase in iter_line_offsets(f, chunk_size):
+        first = (SEQ_LINE - phase) % 4
+        counts = _add_totals(counts, numpy.bincount(ends[first::4] - starts[first::4]))
+    return LengthHistogram(counts.tolist())
+
+
+def _numpy_read_stats(f, chunk_size):
+    stats = ReadStats()
+    length_counts = numpy.zeros(0, dtype=numpy.int64)
+    quality_sums = numpy.zeros(0, dtype=numpy.int64)
+    for data, starts, ends, phase in iter_line_offsets(f, chunk_size):
+        first = (SEQ_LINE - phase) % 4
+        seq_starts = starts[first::4]
+        seq_lengths = ends[first::4] - seq_starts
+        first = (QUAL_LINE - phase) % 4
+        qual_starts = starts[first::4]
+        qual_lengths = ends[first::4] - qual_starts
+
+        # Widest line selected, at least 1 so empty lines still have a row
+        width = max([1] + [int(lengths.max()) for lengths in (seq_lengths, qual_lengths) if len(lengths)])
+        padded = numpy.concatenate([data, numpy.zeros(width, dtype=numpy.uint8)])
+
+        if len(seq_starts):
+            length_counts = _add_totals(length_counts, numpy.bincount(seq_lengths))
+            bases = _line_rows(padded, seq_starts, seq_lengths, width)
+            matches = numpy.empty_like(bases, dtype=bool)
+            # Masking out bits 0x20 and 0x04 leaves 'C' of exactly 'C', 'G', 'c' and 'g'
+            numpy.equal(bases & 0xdb, ord('C'), out=matches)
+            stats.gc_bases += int(numpy.count_nonzero(matches))
+            numpy.equal(bases | 0x20, ord('n'), out=matches)
+            stats.n_bases += int(numpy.count_nonzero(matches))
+
+        if len(qual_starts):
+            qualities = _line_rows(padded, qual_starts, qual_lengths, width)
+            # Summed as 32 bits, faster and enough for 2**24 lines of bytes
+            dtype = numpy.uint32 if len(qual_starts) <= 1 << 24 else numpy.int64
+            sums = qualities.sum(axis=0, dtype=dtype)[:qual_lengths.max()].astype(numpy.int64)
+            quality_sums = _add_totals(quality_sums, sums)
+
+    stats.histogram = LengthHistogram(length_counts.tolist())
+    stats.quality_sums = quality_sums.tolist()
+    return stats
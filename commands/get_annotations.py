@@ -1,7 +1,23 @@
 #!/usr/bin/env python
 
 import argparse
-from structures.tree import GeneTree
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from itertools import groupby
+
+if not __package__:
+    # Run as a script: make the `commands` package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commands.gtf import ParseStats, parse_gtf
+from commands.profiling import RunStats
+from commands.structures.tree import GeneTree
+from commands.structures.gene_index import GeneIndex
+from commands.structures.index_file import IndexFileError, load_index, save_index
 
 task = '''
 Annotate Gene Names.
@@ -28,94 +44,539 @@ Annotated file of gene name that input position overlaps.
 # It first creates a cache of chromosomes loaded with
 # genes of introns/exons linked together into a single
 # continuous gene, dropping all data except for the gene name,
-# and the start/stop coordinates. It then finds the gene name
-# of the overlap region or returns an indication
-# of the gene not being found
+# and the start/stop coordinates. It then finds the names of all
+# genes overlapping the region (several genes may overlap a
+# single coordinate) or returns an indication of no gene being found
 
 # Returned when a chromosome|coordinate pair does not match records
 NOT_FOUND_MESSAGE = 'NO-ANNOTATION'
 
-def cache_chromosomes(filename):
+# Joins the names of overlapping genes into a single annotation
+GENE_SEPARATOR = ','
+
+# Joins a gene name and the number of bases of a BED region it overlaps
+OVERLAP_SEPARATOR = ':'
+
+# Distance column of --nearest when the chromosome has no genes
+MISSING_DISTANCE = 'NA'
+
+# BED lines that are not regions
+BED_HEADERS = ('#', 'track', 'browser')
+
+# Number of coordinate lines looked up together by `match_coords`
+BATCH_SIZE = 100000
+
+# Byte ranges the coordinate file is split into per worker process
+CHUNKS_PER_WORKER = 4
+
+# Per-chromosome gene structures `cache_chromosomes` can build:
+# `tree` links a node object per gene, `array` packs genes into
+# contiguous arrays and answers batches of lookups in one pass
+INDEX_TYPES = ('tree', 'array')
+DEFAULT_INDEX_TYPE = 'array'
+
+def load_chromosomes(filename, index_type=DEFAULT_INDEX_TYPE, features=None, stats=None):
     '''
     Iterates through GTF file and splits data hierarchically according to 
-    chromosome, then gene name within chromosome
+    chromosome, then gene name within chromosome.
+    Only rows of `features` types (e.g. gene, transcript) are read if given,
+    with throughput counted in `stats`, see `parse_gtf`.
+    Genes of each chromosome are then loaded into a `GeneTree`, or into
+    a `GeneIndex` if `index_type` is 'array'.
+    Raises IOError/OSError for a missing or unreadable file
     '''
 
     chromosomes = {}
+    for chromosome, gene_start_pos, gene_stop_pos, gene_name in parse_gtf(filename, features, stats):
+        genes = chromosomes.get(chromosome)
+        if genes is None:
+            genes = chromosomes[chromosome] = {}
+
+        gene = genes.get(gene_name)
+        if gene is None:
+            genes[gene_name] = [gene_start_pos, gene_stop_pos]
+        else:
+            # This gene has been encountered previously
+            # Extend gene's former start/stop coordinates with the newly 
+            # encountered additional section.
+            # Handles case where single gene broken across lines with
+            # other gene interspersed, and out of order
+            if gene_start_pos < gene[0]:
+                gene[0] = gene_start_pos
+            if gene_stop_pos > gene[1]:
+                gene[1] = gene_stop_pos
+
+    if index_type == 'array':
+        return convert_gene_index(chromosomes)
+    # Convert genes into balanced binary tree
+    # Performed now, tree will be balanced; not
+    # guaranteed if genes loaded individually
+    return convert_binary_tree(chromosomes)
+
+def cache_chromosomes(filename, index_type=DEFAULT_INDEX_TYPE, features=None, stats=None):
+    '''
+    Command line wrapper of `load_chromosomes`, exiting on a bad file
+    '''
+
     try:
-        with open(filename, 'r') as f:
-            for line in f:
-                data = line.split()
-
-                chromosome = data[0]
-                gene_start_pos = int(data[3])
-                gene_stop_pos = int(data[4])
-                gene_name = data[9].rstrip(';').strip('"')
-
-                if chromosomes.get(chromosome):
-                    if chromosomes.get(chromosome).get(gene_name):
-                        # This gene has been encountered previously
-                        # Extend gene's former start/stop coordinates with the newly 
-                        # encountered additional section.
-                        # Handles case where single gene broken across lines with
-                        # other gene interspersed, and out of order
-                        former_start_pos, former_stop_pos = chromosomes[chromosome][gene_name]
-                        chromosomes[chromosome][gene_name][0] = min(gene_start_pos, former_start_pos)
-                        chromosomes[chromosome][gene_name][1] = max(gene_stop_pos, former_stop_pos)
-                    else:
-                        chromosomes[chromosome][gene_name] = [gene_start_pos, gene_stop_pos]
-                else:
-                    chromosomes[chromosome] = {gene_name: [gene_start_pos, gene_stop_pos]}
-        # Convert genes into balanced binary tree
-        # Performed now, tree will be balanced; not
-        # guaranteed if genes loaded individually
-        return convert_binary_tree(chromosomes)
-    except IOError:
+        return load_chromosomes(filename, index_type, features, stats)
+    except (IOError, OSError):
         exit('Please provide a valid file')
 
+def load_index_file(filename, index_filename, verify_checksum=False, features=None, stats=None):
+    '''
+    Memory-maps the binary gene index stored at `index_filename`.
+    If missing, of an older version, out of date with the GTF file or
+    built from other `features`, the index is first rebuilt from the
+    GTF file and saved there
+    '''
+
+    try:
+        return load_index(index_filename, filename, verify_checksum, features)
+    except IndexFileError:
+        chromosomes = load_chromosomes(filename, 'array', features, stats)
+        save_index(index_filename, chromosomes, filename, features)
+        return load_index(index_filename, filename, features=features)
+
+def cache_index_file(filename, index_filename, verify_checksum=False, features=None, stats=None):
+    '''
+    Command line wrapper of `load_index_file`, exiting on a bad file
+    '''
+
+    try:
+        return load_index_file(filename, index_filename, verify_checksum, features, stats)
+    except (IOError, OSError):
+        exit('Please provide a valid file')
+
+def sort_genes(genes):
+    '''
+    Takes gene hash table of a chromosome, returning list of
+    [name, start, stop] genes sorted by start position
+    '''
+    return sorted([[gene, genes[gene][0], genes[gene][1]] for gene in genes.keys()], key=lambda g: g[1])
+
 def convert_binary_tree(chromosomes):
     '''
     Takes chromosome hash table, converting list of genes into binary tree
     '''
     for chromosome in chromosomes.keys():
-        genes_sorted = sorted([[gene, chromosomes[chromosome][gene][0], chromosomes[chromosome][gene][1]] for gene in chromosomes[chromosome].keys()], key=lambda g: g[1])
-        chromosomes[chromosome] = GeneTree.init_from_sorted_genes(genes_sorted)
+        chromosomes[chromosome] = GeneTree.init_from_sorted_genes(sort_genes(chromosomes[chromosome]))
+    return chromosomes
+
+def convert_gene_index(chromosomes):
+    '''
+    Takes chromosome hash table, converting list of genes into array-backed index
+    '''
+    for chromosome in chromosomes.keys():
+        chromosomes[chromosome] = GeneIndex.init_from_sorted_genes(sort_genes(chromosomes[chromosome]))
     return chromosomes
 
 def find_overlap(chromosome, coordinate, chromosomes):
     '''
-    Takes chromosome|coordinate pair and returns gene name
-    if coordinate located in binary tree
+    Takes chromosome|coordinate pair and returns the names of
+    all genes overlapping the coordinate, ordered by gene start
+    and joined by `GENE_SEPARATOR`, if coordinate located in binary tree
+    '''
+
+    if chromosome in chromosomes:
+        names = chromosomes[chromosome].find_names(coordinate)
+        if names:
+            return GENE_SEPARATOR.join(names)
+
+def find_batch(batch, chromosomes):
+    '''
+    Takes list of chromosome|coordinate pairs, looking up all coordinates
+    of a chromosome together, and returns list of tuples of the names of
+    overlapping genes in batch order
+    '''
+
+    positions = {}
+    for line_index, (chromosome, coordinate) in enumerate(batch):
+        positions.setdefault(chromosome, []).append(line_index)
+
+    found_names = [()] * len(batch)
+    for chromosome, line_indexes in positions.items():
+        if chromosome not in chromosomes:
+            continue
+        coordinates = [batch[line_index][1] for line_index in line_indexes]
+        found = chromosomes[chromosome].find_batch(coordinates)
+        for line_index, names in zip(line_indexes, found):
+            found_names[line_index] = names
+    return found_names
+
+def annotate_batch(batch, chromosomes):
+    '''
+    Takes list of chromosome|coordinate pairs and returns
+    list of annotations in batch order, see `find_batch`
+    '''
+
+    return [
+        GENE_SEPARATOR.join(names) if names else NOT_FOUND_MESSAGE
+        for names in find_batch(batch, chromosomes)
+    ]
+
+def find_nearest(chromosome, start, stop, chromosomes):
+    '''
+    Returns (tuple of names of nearest genes, distance in bases) for
+    the region, distance 0 for overlapping genes, or ((), None) if the
+    chromosome has no genes
+    '''
+
+    if chromosome not in chromosomes:
+        return (), None
+    return chromosomes[chromosome].find_nearest(start, stop)
+
+def format_nearest(nearest):
+    '''
+    Returns the nearest gene names and distance columns of `find_nearest` result
+    '''
+
+    names, distance = nearest
+    if distance is None:
+        return '\t'.join([NOT_FOUND_MESSAGE, MISSING_DISTANCE])
+    return '\t'.join([GENE_SEPARATOR.join(names), str(distance)])
+
+def annotate_lines(lines, chromosomes, nearest=False):
+    '''
+    Iterates through coordinate lines in batches of `BATCH_SIZE`,
+    handing data to `annotate_batch` and returning the results.
+    With `nearest`, the nearest genes and their distance are added
+    as two more columns
     '''
 
-    if chromosome in chromosomes.keys():
-        gene = chromosomes[chromosome].find(coordinate)
-        if gene:
-            return gene.get_name()
+    def format_batch(batch):
+        for (chromosome, coordinate), annotation in zip(batch, annotate_batch(batch, chromosomes)):
+            columns = [chromosome, str(coordinate), annotation]
+            if nearest:
+                columns.append(format_nearest(find_nearest(chromosome, coordinate, coordinate, chromosomes)))
+            yield '\t'.join(columns)
+
+    batch = []
+    for line in lines:
+        chromosome, coordinate = line.split()
+        batch.append((chromosome, int(coordinate)))
+        if len(batch) == BATCH_SIZE:
+            for result in format_batch(batch):
+                yield result
+            batch = []
+    for result in format_batch(batch):
+        yield result
 
-def match_coords(coord_filename, chromosomes):
+def match_coords(coord_filename, chromosomes, nearest=False):
     '''
-    Iterates through coordinate file, handing data to `find_overlap`
+    Iterates through coordinate file, handing lines to `annotate_lines`
     and returning the results
     '''
 
     with open(coord_filename, 'r') as f:
-        for line in f:
-            chromosome, coordinate = line.split()
-            coordinate = int(coordinate)
-            overlap = find_overlap(chromosome, coordinate, chromosomes)
-            annotation = overlap if overlap else NOT_FOUND_MESSAGE
+        for result in annotate_lines(f, chromosomes, nearest):
+            yield result
+
+def annotate_bed_lines(lines, chromosomes, nearest=False):
+    '''
+    Annotates BED lines (0-based, half-open regions) with the genes
+    each region overlaps and by how many bases, as GENE:bases entries,
+    following the line's own columns. Header, track and browser lines
+    are skipped. With `nearest`, the nearest genes and their distance
+    are added as two more columns
+    '''
+
+    for line in lines:
+        if not line.strip() or line.startswith(BED_HEADERS):
+            continue
+        line = line.rstrip('\r\n')
+        fields = line.split()
+        chromosome = fields[0]
+        # To 1-based inclusive, as genes are stored; an empty region
+        # (an insertion point) is taken as the base following it
+        start = int(fields[1]) + 1
+        stop = max(int(fields[2]), start)
+
+        found = chromosomes[chromosome].find_range(start, stop) if chromosome in chromosomes else ()
+        annotation = GENE_SEPARATOR.join(
+            '{0}{1}{2}'.format(name, OVERLAP_SEPARATOR, overlap) for name, overlap in found
+        ) or NOT_FOUND_MESSAGE
+        columns = [line, annotation]
+        if nearest:
+            columns.append(format_nearest(find_nearest(chromosome, start, stop, chromosomes)))
+        yield '\t'.join(columns)
+
+def match_bed(bed_filename, chromosomes, nearest=False):
+    '''
+    Streams through BED file, handing lines to `annotate_bed_lines`
+    and returning the results
+    '''
+
+    with open(bed_filename, 'r') as f:
+        for result in annotate_bed_lines(f, chromosomes, nearest):
+            yield result
+
+def sweep_lines(lines, chromosomes):
+    '''
+    Annotates coordinate lines sorted by chromosome then coordinate,
+    each chromosome's run of lines in one linear sweep through its
+    `GeneIndex`, with constant memory per chromosome.
+    Lines out of order are still annotated correctly, at the cost
+    of a binary search each
+    '''
+
+    def parse(line):
+        chromosome, coordinate = line.split()
+        return chromosome, int(coordinate)
+
+    warned = False
+    for chromosome, pairs in groupby((parse(line) for line in lines), key=lambda pair: pair[0]):
+        coordinates = (coordinate for _, coordinate in pairs)
+        if chromosome in chromosomes:
+            found = chromosomes[chromosome].sweep(coordinates)
+        else:
+            found = ((coordinate, ()) for coordinate in coordinates)
+
+        previous = None
+        for coordinate, names in found:
+            if previous is not None and coordinate < previous and not warned:
+                sys.stderr.write('Coordinate file is not sorted, unsorted lines fall back to binary search\n')
+                warned = True
+            previous = coordinate
+
+            annotation = GENE_SEPARATOR.join(names) if names else NOT_FOUND_MESSAGE
             yield '\t'.join(map(str, [chromosome, coordinate, annotation]))
 
+def match_sorted_coords(coord_filename, chromosomes):
+    '''
+    Streams through coordinate file sorted by chromosome then coordinate,
+    handing lines to `sweep_lines` and returning the results
+    '''
+
+    with open(coord_filename, 'r') as f:
+        for result in sweep_lines(f, chromosomes):
+            yield result
+
+def split_file(filename, num_chunks):
+    '''
+    Returns list of (start, stop) byte ranges covering the file,
+    about `num_chunks` of them, each beginning at the start of a line
+    '''
+
+    size = os.path.getsize(filename)
+    offsets = [0]
+    with open(filename, 'rb') as f:
+        for chunk in range(1, num_chunks):
+            # Move forward to the start of the following line
+            f.seek(size * chunk // num_chunks)
+            f.readline()
+            if offsets[-1] < f.tell() < size:
+                offsets.append(f.tell())
+    offsets.append(size)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+# Gene index of each worker process, memory-mapped from a shared index file
+_worker_chromosomes = None
+
+def _init_worker(anno_filename, index_filename, features):
+    global _worker_chromosomes
+    _worker_chromosomes = load_index(index_filename, anno_filename, features=features)
+
+def _annotate_range(job):
+    coord_filename, start, stop, sorted_input, bed, nearest = job
+    with open(coord_filename, 'rb') as f:
+        f.seek(start)
+        lines = f.read(stop - start).decode('utf-8').splitlines()
+    if bed:
+        results = annotate_bed_lines(lines, _worker_chromosomes, nearest)
+    elif sorted_input:
+        results = sweep_lines(lines, _worker_chromosomes)
+    else:
+        results = annotate_lines(lines, _worker_chromosomes, nearest)
+    return ''.join(result + '\n' for result in results)
+
+def match_coords_parallel(coord_filename, anno_filename, workers, index_filename=None, sorted_input=False,
+                          features=None, stats=None, bed=False, nearest=False, verify_checksum=False):
+    '''
+    Splits coordinate file (or BED file with `bed`) into line-aligned
+    byte ranges, annotated in `workers` processes, yielding each range's
+    output text in file order. Workers memory-map the gene index file,
+    so they share one copy of the index; without `index_filename` a
+    temporary index file is built. An existing index file is checked
+    as by `load_index_file`, with `verify_checksum` against a checksum
+    of the annotation file
+    '''
+
+    temp_dir = None
+    try:
+        if index_filename:
+            # Builds or refreshes the index file before workers map it
+            cache_index_file(anno_filename, index_filename, verify_checksum, features, stats)
+        else:
+            temp_dir = tempfile.mkdtemp()
+            index_filename = os.path.join(temp_dir, 'annotations.gidx')
+            chromosomes = cache_chromosomes(anno_filename, 'array', features, stats)
+            save_index(index_filename, chromosomes, anno_filename, features)
+
+        # Several ranges per worker keep all workers busy until the end
+        ranges = split_file(coord_filename, workers * CHUNKS_PER_WORKER)
+        jobs = [(coord_filename, start, stop, sorted_input, bed, nearest) for start, stop in ranges]
+
+        pool = multiprocessing.Pool(workers, _init_worker, (anno_filename, index_filename, features))
+        try:
+            for text in pool.imap(_annotate_range, jobs):
+                yield text
+        finally:
+            pool.terminate()
+    except (IOError, OSError):
+        exit('Please provide a valid file')
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir)
+
+class GeneAnnotator(object):
+    '''
+    Gene lookups against an annotation file loaded once, for use in
+    a long-running process: load with `from_gtf` or `from_index_file`,
+    then query any number of times. Errors reading files are raised
+    as IOError/OSError rather than exiting
+    '''
+
+    def __init__(self, chromosomes):
+        self.chromosomes = chromosomes
+
+    @classmethod
+    def from_gtf(cls, filename, index_type=DEFAULT_INDEX_TYPE, features=None, stats=None):
+        return cls(load_chromosomes(filename, index_type, features, stats))
+
+    @classmethod
+    def from_index_file(cls, filename, index_filename, verify_checksum=False, features=None, stats=None):
+        return cls(load_index_file(filename, index_filename, verify_checksum, features, stats))
+
+    def find(self, chromosome, coordinate):
+        '''
+        Returns tuple of names of genes overlapping the coordinate
+        '''
+        if chromosome not in self.chromosomes:
+            return ()
+        return self.chromosomes[chromosome].find_names(coordinate)
+
+    def find_batch(self, pairs):
+        '''
+        Returns list of tuples of gene names for a list of
+        chromosome|coordinate pairs, see `find_batch`
+        '''
+        return find_batch(pairs, self.chromosomes)
+
+    def find_range(self, chromosome, start, stop):
+        '''
+        Returns tuple of (name, bases overlapped) of genes overlapping
+        the 1-based, inclusive region
+        '''
+        if chromosome not in self.chromosomes:
+            return ()
+        return self.chromosomes[chromosome].find_range(start, stop)
+
+    def find_nearest(self, chromosome, start, stop=None):
+        '''
+        Returns (tuple of names of nearest genes, distance) of the
+        coordinate or region, see `find_nearest`
+        '''
+        return find_nearest(chromosome, start, start if stop is None else stop, self.chromosomes)
+
+    def annotate_lines(self, lines, sorted_input=False, nearest=False):
+        '''
+        Yields output line for each Chr<tab>Position line, as the
+        command line does. `sorted_input` needs an array index
+        '''
+        if sorted_input:
+            return sweep_lines(lines, self.chromosomes)
+        return annotate_lines(lines, self.chromosomes, nearest)
+
+    def annotate_bed_lines(self, lines, nearest=False):
+        '''
+        Yields output line for each BED line, as the command line does with --bed
+        '''
+        return annotate_bed_lines(lines, self.chromosomes, nearest)
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=task)
     parser.add_argument('coord_file', help='Path to coordinate file')
     parser.add_argument('anno_file', help='Path to annotation file, GTF formatted')
+    parser.add_argument('--index', choices=INDEX_TYPES, default=DEFAULT_INDEX_TYPE,
+        help='Gene structure used for lookups. Defaults to {index_type}'.format(index_type=DEFAULT_INDEX_TYPE)
+    )
+    parser.add_argument('--index-file',
+        help='Path to binary gene index of the annotation file, built there if missing or out of date. Implies --index=array'
+    )
+    parser.add_argument('--verify-index', action='store_true',
+        help='Check the index file against a checksum of the annotation file, not only its size and modification time'
+    )
+    parser.add_argument('--sorted', action='store_true',
+        help='Coordinate file is sorted by chromosome then coordinate: annotate in a single streaming sweep. Implies --index=array'
+    )
+    parser.add_argument('--bed', action='store_true',
+        help='Coordinate file is BED formatted: annotate each region with the genes it overlaps and by how many bases'
+    )
+    parser.add_argument('--nearest', action='store_true',
+        help='Add columns of the nearest genes to each coordinate or region and their distance in bases, 0 if overlapping'
+    )
+    parser.add_argument('-w', '--workers', type=int, default=1,
+        help='Number of processes annotating the coordinate file in parallel, sharing one array index. Defaults to 1'
+    )
+    parser.add_argument('-f', '--feature', action='append', dest='features',
+        help='Only read GTF rows of this feature type, e.g. gene or transcript. May be repeated. Defaults to all rows'
+    )
+    parser.add_argument('--stats', action='store_true',
+        help='Report GTF parsing throughput, time, records and throughput of each phase '
+             '(GTF parse, index build, lookup, output) and peak memory to stderr'
+    )
+    parser.add_argument('--stats-json', help='Write the --stats report as JSON to this path')
+    parser.add_argument('--profile', help='Profile the run with cProfile, saving its stats to this path')
     args = parser.parse_args()
+    if args.sorted and (args.bed or args.nearest):
+        parser.error('--sorted cannot be combined with --bed or --nearest')
+    if args.workers > 1 and args.index == 'tree':
+        # Workers share one memory-mapped array index
+        parser.error('--workers cannot be combined with --index=tree')
+
+    stats = ParseStats() if args.stats or args.stats_json else None
+    run_stats = RunStats('get_annotations', args.profile, child_processes=args.workers > 1)
+    coord_bytes = os.path.getsize(args.coord_file) if os.path.isfile(args.coord_file) else 0
+
+    started = time.time()
+    if args.workers > 1:
+        # Workers look up and format their lines, only writing is left here
+        num_lines = 0
+        for text in run_stats.timed(match_coords_parallel(args.coord_file, args.anno_file, args.workers,
+                                                          args.index_file, args.sorted, args.features, stats,
+                                                          args.bed, args.nearest, args.verify_index),
+                                    'lookup'):
+            sys.stdout.write(text)
+            num_lines += text.count('\n')
+        lookup = run_stats.get_phase('lookup')
+        lookup.records = num_lines
+    else:
+        # Create cache of chromosomes from annotation file
+        if args.index_file:
+            chromosomes = cache_index_file(args.anno_file, args.index_file, args.verify_index, args.features, stats)
+        else:
+            chromosomes = cache_chromosomes(args.anno_file, 'array' if args.sorted else args.index, args.features, stats)
+        if stats is not None and stats.lines:
+            run_stats.add('gtf parse', stats.seconds, stats.lines, os.path.getsize(args.anno_file))
+            run_stats.add('index build', time.time() - started - stats.seconds)
+        else:
+            run_stats.add('index load', time.time() - started)
+
+        started = time.time()
+        if args.bed:
+            results = match_bed(args.coord_file, chromosomes, args.nearest)
+        elif args.sorted:
+            results = match_sorted_coords(args.coord_file, chromosomes)
+        else:
+            results = match_coords(args.coord_file, chromosomes, args.nearest)
+        for result in run_stats.timed(results, 'lookup'):
+            print(result)
+        lookup = run_stats.get_phase('lookup')
 
-    # Create cache of chromosomes from annotation file
-    chromosomes = cache_chromosomes(args.anno_file)
-    
-    for result in match_coords(args.coord_file, chromosomes):
-        print(result)
+    lookup.bytes = coord_bytes
+    run_stats.add('output', time.time() - started - lookup.seconds, lookup.records)
 
+    if stats is not None and stats.lines:
+        sys.stderr.write('{0}\n'.format(stats))
+    run_stats.finish(args.stats, args.stats_json)
@@ -0,0 +1,101 @@
+import gzip
+import time
+
+from commands.compressed import GZIP_MAGIC
+
+# Attribute keys tried in order for a feature's gene name
+GENE_NAME_KEYS = ('gene_name', 'gene_id')
+
+
+class ParseStats(object):
+    '''
+    Counts lines and records handed out by `parse_gtf`, and the time
+    from reading the first line to the last
+    '''
+
+    def __init__(self):
+        self.lines = 0
+        self.records = 0
+        self.seconds = 0.0
+
+    def lines_per_sec(self):
+        return self.lines / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return 'Parsed {0} GTF lines ({1} records) in {2:.3f}s, {3:.0f} lines/sec'.format(
+            self.lines, self.records, self.seconds, self.lines_per_sec()
+        )
+
+
+def open_text(filename):
+    '''
+    Opens plain text or gzip/bgzip compressed file for reading as text
+    '''
+
+    with open(filename, 'rb') as f:
+        compressed = f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+    if compressed:
+        return gzip.open(filename, 'rt')
+    return open(filename, 'r')
+
+
+def get_attribute(attributes, keys=GENE_NAME_KEYS):
+    '''
+    Returns value of the first of `keys` present in a GTF attribute
+    column (`key "value"; ...`), or None
+    '''
+
+    for key in keys:
+        start = attributes.find(key + ' "')
+        # Must be a whole key, not the tail of a longer one
+        while start > 0 and attributes[start - 1] not in ' ;\t':
+            start = attributes.find(key + ' "', start + 1)
+        if start >= 0:
+            start += len(key) + 2
+            return attributes[start:attributes.index('"', start)]
+
+
+def parse_gtf(filename, features=None, stats=None):
+    '''
+    Streams through GTF file (optionally gzip/bgzip compressed), yielding
+    (chromosome, start, stop, gene name) for every feature row,
+    or only rows whose feature type is in `features` (e.g. gene, transcript).
+    Only the needed columns are split out, and the gene name is found
+    by attribute key, falling back to the gene id if there is no name.
+    Counts are added to `stats`, a `ParseStats`, if given
+    '''
+
+    # Fast path for the usual attribute, others looked up by `get_attribute`
+    name_key = GENE_NAME_KEYS[0] + ' "'
+
+    started = time.time()
+    lines = records = 0
+    try:
+        with open_text(filename) as f:
+            for line in f:
+                lines += 1
+                if line[0] in '#\n':  # Comment or blank line
+                    continue
+
+                # Attributes are searched for within the unsplit remainder,
+                # score/strand/frame never hold a `key "value"` pair
+                chromosome, _, feature, start, stop, rest = line.split('\t', 5)
+                if features and feature not in features:
+                    continue
+
+                name_start = rest.find(name_key)
+                if name_start > 0 and rest[name_start - 1] in ' ;\t':
+                    name_start += len(name_key)
+                    gene_name = rest[name_start:rest.index('"', name_start)]
+                else:
+                    gene_name = get_attribute(rest)
+                    if gene_name is None:
+                        continue
+
+                records += 1
+                yield chromosome, int(start), int(stop), gene_name
+    finally:
+        if stats is not None:
+            stats.lines += lines
+            stats.records += records
+            stats.seconds += time.time() - started
@@ -0,0 +1,160 @@
+import cProfile
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Unix only, peak memory is not reported on Windows
+    resource = None
+
+
+def peak_rss_mb(who='self'):
+    '''
+    Returns peak resident memory in MB of this process, or with `who`
+    'children' of its largest finished child process, e.g. a pool worker
+    '''
+
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if who == 'children' else resource.RUSAGE_SELF)
+    # Bytes on macOS, KB elsewhere
+    return usage.ru_maxrss / float(1 << 20) if sys.platform == 'darwin' else usage.ru_maxrss / 1024.0
+
+
+class Phase(object):
+    '''
+    Time taken by one phase of a run, with the records and bytes it handled
+    '''
+
+    def __init__(self, name, seconds=0.0, records=0, num_bytes=0):
+        self.name = name
+        self.seconds = seconds
+        self.records = records
+        self.bytes = num_bytes
+
+    def to_dict(self):
+        seconds = self.seconds
+        return {
+            'name': self.name,
+            'seconds': seconds,
+            'records': self.records,
+            'bytes': self.bytes,
+            'records_per_sec': self.records / seconds if seconds > 0 else 0.0,
+            'mb_per_sec': self.bytes / 1e6 / seconds if seconds > 0 else 0.0,
+        }
+
+
+class RunStats(object):
+    '''
+    Times the phases of a command's run (e.g. parse, lookup, output),
+    reporting each phase's time, records, bytes and throughput with
+    the run's peak memory, to stderr and/or as JSON.
+    With `profile_filename` the run is also profiled by cProfile,
+    its stats dumped there for `python -m pstats`. With
+    `child_processes`, for runs using worker processes, their peak
+    memory is reported too
+    '''
+
+    def __init__(self, command, profile_filename=None, child_processes=False):
+        self.command = command
+        self.child_processes = child_processes
+        self.phases = []
+        self.started = time.time()
+        self.profile_filename = profile_filename
+        self.profiler = None
+        if profile_filename:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def get_phase(self, name):
+        for phase in self.phases:
+            if phase.name == name:
+                return phase
+        phase = Phase(name)
+        self.phases.append(phase)
+        return phase
+
+    def add(self, name, seconds, records=0, num_bytes=0):
+        phase = self.get_phase(name)
+        phase.seconds += seconds
+        phase.records += records
+        phase.bytes += num_bytes
+        return phase
+
+    @contextmanager
+    def phase(self, name):
+        '''
+        Times the enclosed block as phase `name`, handing out its
+        `Phase` for records and bytes to be added to
+        '''
+        phase = self.get_phase(name)
+        started = time.time()
+        try:
+            yield phase
+        finally:
+            phase.seconds += time.time() - started
+
+    def timed(self, iterable, name):
+        '''
+        Yields from `iterable`, counting the time spent producing each
+        item, and the items, as phase `name`. Time the consumer spends
+        between items is not counted
+        '''
+        return self._timed(iter(iterable), self.get_phase(name))
+
+    def _timed(self, iterator, phase):
+        while True:
+            started = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                phase.seconds += time.time() - started
+                return
+            phase.seconds += time.time() - started
+            phase.records += 1
+            yield item
+
+    def total_seconds(self):
+        return time.time() - self.started
+
+    def to_dict(self):
+        return {
+            'command': self.command,
+            'total_seconds': self.total_seconds(),
+            'phases': [phase.to_dict() for phase in self.phases],
+            'peak_rss_mb': peak_rss_mb(),
+            'peak_children_rss_mb': peak_rss_mb('children') if self.child_processes else None,
+        }
+
+    def __str__(self):
+        data = self.to_dict()
+        lines = ['{0}: {1:.3f}s total'.format(self.command, data['total_seconds'])]
+        for phase in data['phases']:
+            line = '  {name:<16} {seconds:>9.3f}s'.format(**phase)
+            if phase['records']:
+                line += '  {records} records, {records_per_sec:.0f}/sec'.format(**phase)
+            if phase['bytes']:
+                line += '  {0:.1f} MB, {1:.1f} MB/sec'.format(phase['bytes'] / 1e6, phase['mb_per_sec'])
+            lines.append(line)
+        if data['peak_rss_mb'] is not None:
+            lines.append('  peak memory {0:.1f} MB'.format(data['peak_rss_mb']))
+        if data['peak_children_rss_mb'] is not None:
+            lines.append('  peak child process memory {0:.1f} MB'.format(data['peak_children_rss_mb']))
+        return '\n'.join(lines)
+
+    def finish(self, report=False, json_filename=None, stream=sys.stderr):
+        '''
+        Ends the run: dumps the cProfile stats, if profiling, then
+        writes the report to `stream` and/or JSON to `json_filename`
+        '''
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_filename)
+        if report:
+            stream.write('{0}\n'.format(self))
+        if json_filename:
+            with open(json_filename, 'w') as f:
+                json.dump(self.to_dict(), f, indent=2, sort_keys=True)
@@ -0,0 +1,154 @@
+import json
+import os
+import zlib
+
+from commands.structures.length_histogram import LengthHistogram
+from commands.structures.read_stats import ReadStats
+
+# Persistent results of FASTQ scans, so reruns over the same
+# directories only scan new or changed files.
+#
+# Saved as JSON: {'version': CACHE_VERSION, 'files': {absolute path:
+# {'key': file key, 'histogram': LengthHistogram.to_dict(), and for
+# files scanned for QC statistics 'read_stats': ReadStats.to_dict()}}}.
+# A file's key is its size, modification time (ns) and inode, plus a
+# crc32 of its contents when checksums are requested; any difference
+# means the file is scanned again. Caches of another version, or
+# unreadable ones, are started over rather than failing the run.
+CACHE_VERSION = 1
+
+
+def file_key(filename, checksum=False):
+    '''
+    Returns [size, mtime in ns, inode, crc32] identifying the file
+    contents. The crc32 is only computed when `checksum` requested,
+    otherwise None
+    '''
+
+    stat = os.stat(filename)
+    crc = None
+    if checksum:
+        crc = 0
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                crc = zlib.crc32(chunk, crc)
+        crc &= 0xffffffff
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino, crc]
+
+
+class ScanCache(object):
+    '''
+    `LengthHistogram` (or `ReadStats`) of each file scanned, keyed on
+    the file's path and identity (see `file_key`). Look files up with
+    `get` before scanning (or compare their key with `cached_key`
+    wherever the file is read), `put` what was scanned, then `save`,
+    which also evicts entries of files since deleted or changed
+    '''
+
+    def __init__(self, filename, checksum=False):
+        self.filename = filename
+        self.checksum = checksum
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        # Paths looked up or stored this run, known to be current
+        self.current = set()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.filename) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get('version') == CACHE_VERSION:
+            self.entries = data.get('files', {})
+
+    def key(self, filename):
+        return file_key(filename, self.checksum)
+
+    def cached_key(self, filename, qc=False):
+        '''
+        Returns the key the file's `LengthHistogram`, or with `qc` its
+        `ReadStats`, was stored under, or None if not cached. Compared
+        with the file's current key to skip scanning it
+        '''
+        entry = self.entries.get(os.path.abspath(filename))
+        if entry is None or (qc and 'read_stats' not in entry):
+            return None
+        return entry['key']
+
+    def get(self, filename, key, qc=False):
+        '''
+        Returns cached `LengthHistogram` of the file, or with `qc` its
+        `ReadStats`, if its `key` is unchanged, else None, dropping the
+        out of date entry
+        '''
+        path = os.path.abspath(filename)
+        entry = self.entries.get(path)
+        if entry is not None and entry['key'] == key:
+            try:
+                if qc:
+                    result = ReadStats.from_dict(entry['read_stats'])
+                else:
+                    result = LengthHistogram.from_dict(entry['histogram'])
+            except (ValueError, KeyError):
+                result = None
+            if result is not None:
+                self.hits += 1
+                self.current.add(path)
+                return result
+
+        self.entries.pop(path, None)
+        self.misses += 1
+        return None
+
+    def put(self, filename, key, result):
+        '''
+        Stores `LengthHistogram` or `ReadStats` of the file as scanned
+        when it had `key`
+        '''
+        path = os.path.abspath(filename)
+        if isinstance(result, ReadStats):
+            entry = {'key': key, 'histogram': result.histogram.to_dict(), 'read_stats': result.to_dict()}
+        else:
+            entry = {'key': key, 'histogram': result.to_dict()}
+        self.entries[path] = entry
+        self.current.add(path)
+
+    def evict_stale(self):
+        '''
+        Drops entries of files not seen this run that no longer exist
+        or have changed, returning the number dropped. Contents are not
+        checksummed here, changed contents are caught on lookup
+        '''
+        stale = []
+        for path, entry in self.entries.items():
+            if path in self.current:
+                continue
+            try:
+                key = file_key(path)
+            except OSError:
+                stale.append(path)
+                continue
+            if key[:3] != entry['key'][:3]:
+                stale.append(path)
+        for path in stale:
+            del self.entries[path]
+        return len(stale)
+
+    def save(self):
+        '''
+        Evicts stale entries, then writes the cache to a temporary file
+        moved into place, so an interrupted run never leaves it half written
+        '''
+        self.evict_stale()
+        temp_filename = '{0}.{1}.tmp'.format(self.filename, os.getpid())
+        with open(temp_filename, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'files': self.entries}, f, sort_keys=True)
+        os.replace(temp_filename, self.filename)
+
+    def __str__(self):
+        return 'Scan cache: {0} files cached, {1} scanned, {2} entries'.format(
+            self.hits, self.misses, len(self.entries)
+        )
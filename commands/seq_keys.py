@@ -0,0 +1,56 @@
+import hashlib
+
+# Compact keys for counting sequences.
+#
+# `packed`: sequences of only A, C, G and T are packed 2 bits per base
+# into bytes, behind a leading 1 bit so leading A's (0 bits) are kept.
+# Any other sequence (IUPAC codes such as N, lower case bases) is kept
+# as its str, never equal to a bytes key, so unpacking is always exact.
+#
+# `digest`: sequences are replaced by a 128-bit digest. Digests cannot
+# be unpacked, the sequences behind them are found again by digesting
+# the file a second time (see `seq_mode.top_digested_sequences`).
+# Sequences are digested as UTF-8, so distinct sequences never share
+# their encoded form.
+
+BASES = 'ACGT'
+
+# str.translate tables: bases to base-4 digits, and bases deleted
+TO_DIGITS = dict((ord(base), str(digit)) for digit, base in enumerate(BASES))
+DELETE_BASES = dict((ord(base), None) for base in BASES)
+
+# Two bits of a packed sequence to its base
+FROM_BITS = dict(('{0:02b}'.format(digit), base) for digit, base in enumerate(BASES))
+
+DIGEST_SIZE = 16
+
+KEY_TYPES = ('str', 'packed', 'digest')
+
+
+def pack(seq):
+    '''
+    Returns bytes of the sequence packed 2 bits per base, or the
+    sequence itself if it holds anything other than A, C, G and T
+    '''
+    if seq.translate(DELETE_BASES):
+        return seq
+    packed = int('1' + seq.translate(TO_DIGITS), 4)
+    return packed.to_bytes((packed.bit_length() + 7) // 8, 'big')
+
+
+def unpack(key):
+    '''
+    Returns the sequence a key from `pack` was made from
+    '''
+    if not isinstance(key, bytes):
+        return key
+    # Drop '0b1', the marker bit, then read bases 2 bits at a time
+    bits = bin(int.from_bytes(key, 'big'))[3:]
+    return ''.join([FROM_BITS[bits[i:i + 2]] for i in range(0, len(bits), 2)])
+
+
+def digest(seq):
+    '''
+    Returns 128-bit digest of the sequence
+    '''
+    return hashlib.blake2b(seq.encode('utf-8'), digest_size=DIGEST_SIZE).digest()
@@ -1,10 +1,42 @@
 #!/usr/bin/env python
 
+import os
 import sys
 import argparse
+import heapq
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+if not __package__:
+    # Run as a script: make the `commands` package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commands import seq_keys
+from commands.fasta import read_sequences
+from commands.profiling import RunStats
+from commands.structures.digest_counter import DigestCounter
+from commands.structures.space_saving import SpaceSaving
 
 DEFAULT_NUM_SEQS = 10
 
+# Sequences held at once by the approximate counter
+DEFAULT_CAPACITY = 100000
+
+# Counting in memory takes about this many times the bytes the
+# sequences take in a bucket file, when every sequence is distinct
+BUCKET_EXPANSION = 2
+# Most bucket files open at once by --max-memory
+MAX_BUCKETS = 512
+
+# Functions making the hash table key of a sequence, see `seq_keys`
+KEY_ENCODERS = {
+    'str': None,
+    'packed': seq_keys.pack,
+    'digest': seq_keys.digest,
+}
+
 task = '''
 FASTA Top Occurring Sequences.
 
@@ -13,49 +45,338 @@ sequences (the sequence modes) and return the sequence and their
 counts in the file. Default top sequences is {num_seqs}
 '''.format(num_seqs=DEFAULT_NUM_SEQS)
 
-def hash_file(filename):
+def count_sequences(seqs, keys='str'):
     '''
     Returns a newly created hash table of the sequences with
-    the number of occurrences
+    the number of occurrences.
+    Sequences are keyed as `str`, or more compactly as 2-bit `packed`
+    ints, or as 128-bit `digest`s counted in a `DigestCounter`
+    (see `seq_keys`)
     '''
 
-    seq = ''
-    seq_hash = {}
+    encode = KEY_ENCODERS[keys]
+    if encode is not None:
+        seqs = map(encode, seqs)
 
-    try:
-        with open(filename, 'r') as f:
-            for line in f:
-                if line[0] == '>':  # Beginning of new sequence
-                    if seq:
-                        if seq_hash.get(seq):
-                            seq_hash[seq] += 1
-                        else:
-                            seq_hash[seq] = 1
-                    # Start of new sequence, reset accumulator
-                    seq = ''
-                else:
-                    # In case sequences broken apart multiple lines,
-                    # accumulate raw sequence until next new sequence begins
-                    seq += line.strip()
+    if keys == 'digest':
+        seq_hash = DigestCounter()
+        for seq in seqs:
+            seq_hash.add(seq)
+        return seq_hash
 
-        # Add final sequence at end of file
-        if seq_hash.get(seq):
+    seq_hash = {}
+    for seq in seqs:
+        if seq in seq_hash:
             seq_hash[seq] += 1
         else:
             seq_hash[seq] = 1
-    except IOError:
-        exit('Please specify a valid FASTA file')
+    return seq_hash
+
+def hash_file(filename, keys='str', run_stats=None):
+    '''
+    Returns a newly created hash table of the sequences in the
+    FASTA file with the number of occurrences, see `count_sequences`.
+    A `DigestCounter` records the file as its source, for `top_sequences`.
+    Time spent reading and counting is added to `run_stats` phases
+    'read' and 'count', if given
+    '''
+
+    with open(filename, 'r') as f:
+        if run_stats is None:
+            seq_hash = count_sequences(read_sequences(f), keys)
+        else:
+            started = time.time()
+            seq_hash = count_sequences(run_stats.timed(read_sequences(f), 'read'), keys)
+            read = run_stats.add('read', 0, num_bytes=os.path.getsize(filename))
+            run_stats.add('count', time.time() - started - read.seconds, read.records)
+
+    if keys == 'digest':
+        seq_hash.source = filename
+    return seq_hash
+
+def split_records(filename, num_chunks):
+    '''
+    Returns list of (start, stop) byte ranges covering the FASTA file,
+    about `num_chunks` of them, each after the first beginning at
+    a '>' header line, so no sequence is split between ranges
+    '''
+
+    size = os.path.getsize(filename)
+    offsets = [0]
+    with open(filename, 'rb') as f:
+        for chunk in range(1, num_chunks):
+            # Move forward to the start of the following record
+            f.seek(size * chunk // num_chunks)
+            f.readline()
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line or line[:1] == b'>':
+                    break
+            if offsets[-1] < offset < size:
+                offsets.append(offset)
+    offsets.append(size)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+def _count_range(job):
+    filename, start, stop, keys, last = job
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        lines = f.read(stop - start).decode('utf-8').splitlines(True)
+    seqs = read_sequences(lines)
+    if not last:
+        # Only the end of the file ends with a sequence when empty
+        seqs = (seq for seq in seqs if seq)
+    return count_sequences(seqs, keys)
+
+def hash_file_parallel(filename, workers, keys='str'):
+    '''
+    Returns the same hash table as `hash_file`, counted by `workers`
+    processes each taking a record-aligned byte range of the file.
+    Range tables are merged in file order, so sequences keep their
+    first-seen order and ties break exactly as when counted serially
+    '''
+
+    ranges = split_records(filename, workers)
+    jobs = [
+        (filename, start, stop, keys, stop == ranges[-1][1])
+        for start, stop in ranges
+    ]
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        partials = pool.imap(_count_range, jobs)
+        seq_hash = next(partials)
+        for partial in partials:
+            if keys == 'digest':
+                for key, count in partial.items():
+                    seq_hash.add(key, count)
+                continue
+            for key, count in partial.items():
+                seq_hash[key] = seq_hash.get(key, 0) + count
+    finally:
+        pool.terminate()
 
+    if keys == 'digest':
+        seq_hash.source = filename
     return seq_hash
 
+def sketch_file(filename, capacity):
+    '''
+    Returns a `SpaceSaving` sketch of the sequences, approximately counting
+    the most frequent ones while holding at most `capacity` sequences
+    '''
+
+    sketch = SpaceSaving(capacity)
+
+    with open(filename, 'r') as f:
+        for seq in read_sequences(f):
+            sketch.add(seq)
+
+    return sketch
+
+def top_sequences(seq_hash, num_seqs):
+    '''
+    Returns list of (sequence, count) of the top-occurring sequences
+    of a hash table from `count_sequences`, with any keys. Sequences
+    of a `DigestCounter` are found in its `source` FASTA file, see
+    `top_digested_sequences`
+    '''
+
+    if isinstance(seq_hash, DigestCounter):
+        if seq_hash.source is None:
+            raise ValueError('Digests can only be turned back into sequences with the FASTA file they were counted from')
+        return top_digested_sequences(seq_hash.source, seq_hash, num_seqs)
+
+    # Partial selection of the top sequences; same order as a full sort
+    # (ties keep first-seen order) without sorting every sequence
+    # Packed keys are unpacked, str keys returned as they are
+    return [
+        (seq_keys.unpack(seq), seq_hash[seq])
+        for seq in heapq.nlargest(num_seqs, seq_hash, key=seq_hash.get)
+    ]
+
 def get_top_sequences(seq_hash, num_seqs):
     '''
     Returns the top-occurring sequences from the sequence hash table
     '''
 
-    # Loop through a sorted list of the otherwise unsorted hashed data
-    for seq in sorted(seq_hash, key=seq_hash.get, reverse=True)[:num_seqs]:
-        yield '\t'.join(map(str, [seq, seq_hash[seq]]))
+    for seq, count in top_sequences(seq_hash, num_seqs):
+        yield '\t'.join(map(str, [seq, count]))
+
+def top_digested_sequences(filename, seq_hash, num_seqs):
+    '''
+    Returns list of (sequence, count) of the top-occurring sequences
+    of a hash table keyed by sequence digests, finding the sequences
+    behind the top digests in a second pass over the FASTA file
+    '''
+
+    top = heapq.nlargest(num_seqs, seq_hash.items(), key=lambda item: item[1])
+    wanted = set(key for key, count in top)
+    found = {}
+
+    with open(filename, 'r') as f:
+        for seq in read_sequences(f):
+            key = seq_keys.digest(seq)
+            if key in wanted and key not in found:
+                found[key] = seq
+                if len(found) == len(wanted):
+                    break
+
+    return [(found[key], count) for key, count in top]
+
+def get_top_digested_sequences(filename, seq_hash, num_seqs):
+    '''
+    Returns the top-occurring sequences from a hash table keyed by
+    sequence digests, see `top_digested_sequences`
+    '''
+
+    for seq, count in top_digested_sequences(filename, seq_hash, num_seqs):
+        yield '\t'.join(map(str, [seq, count]))
+
+def bucket_count(size, max_memory):
+    '''
+    Returns number of buckets spreading `size` bytes of sequences so
+    each bucket is counted in about `max_memory` bytes, at most `MAX_BUCKETS`
+    '''
+
+    return min(max(-(-size * BUCKET_EXPANSION // max_memory), 1), MAX_BUCKETS)
+
+def partition_records(records, num_buckets, temp_dir, level=0):
+    '''
+    Writes each (index in the file, sequence) of `records` to one of
+    `num_buckets` files in `temp_dir` chosen by the sequence's hash, so
+    all copies of a sequence land in the same bucket. Each `level` of
+    re-partitioning hashes differently, splitting the records a bucket
+    of the level above shared. Returns list of bucket filenames
+    '''
+
+    bucket_filenames = [os.path.join(temp_dir, 'bucket_{0}.txt'.format(i)) for i in range(num_buckets)]
+    buckets = [open(bucket_filename, 'w') for bucket_filename in bucket_filenames]
+    try:
+        for index, seq in records:
+            # Sequences hold no tabs, so the salted strings stay distinct
+            key = hash('{0}\t{1}'.format(level, seq)) if level else hash(seq)
+            buckets[key % num_buckets].write('{0}\t{1}\n'.format(index, seq))
+    finally:
+        for bucket in buckets:
+            bucket.close()
+    return bucket_filenames
+
+def partition_file(filename, num_buckets, temp_dir):
+    '''
+    Writes each sequence of the FASTA file, after its index in the
+    file, to one of `num_buckets` files in `temp_dir`, see
+    `partition_records`. Returns list of bucket filenames
+    '''
+
+    with open(filename, 'r') as f:
+        return partition_records(enumerate(read_sequences(f)), num_buckets, temp_dir)
+
+def read_bucket(bucket_filename):
+    '''
+    Yields (index in the file, sequence) of a bucket file written by `partition_records`
+    '''
+
+    with open(bucket_filename, 'r') as f:
+        for line in f:
+            index, seq = line.rstrip('\n').split('\t', 1)
+            yield int(index), seq
+
+def count_bucket(bucket_filename, num_seqs):
+    '''
+    Returns the top `num_seqs` (count, -first index, sequence) tuples
+    of a bucket file written by `partition_records`
+    '''
+
+    seq_hash = {}
+    first_seen = {}
+    for index, seq in read_bucket(bucket_filename):
+        if seq in seq_hash:
+            seq_hash[seq] += 1
+        else:
+            seq_hash[seq] = 1
+            first_seen[seq] = index
+
+    return [
+        (seq_hash[seq], -first_seen[seq], seq)
+        for seq in heapq.nlargest(num_seqs, seq_hash, key=seq_hash.get)
+    ]
+
+def single_sequence(bucket_filename):
+    '''
+    Returns whether a bucket file written by `partition_records` holds
+    copies of one sequence only, reading it through in constant memory
+    '''
+
+    seqs = (seq for _, seq in read_bucket(bucket_filename))
+    first = next(seqs, None)
+    return all(seq == first for seq in seqs)
+
+def count_buckets(bucket_filenames, num_seqs, max_memory, temp_dir, level=0, min_buckets=1):
+    '''
+    Returns the top `num_seqs` (count, -first index, sequence) tuples of
+    each bucket file, removing them. A bucket still too large to count
+    in about `max_memory` bytes is partitioned again, with the hash of
+    the next level, into at least `min_buckets` buckets of its own,
+    counted the same way. A bucket that is not split by that (all its
+    records hashed alike) is partitioned again into twice as many
+    buckets, unless it holds copies of one sequence only, which take
+    the memory of that one sequence to count
+    '''
+
+    tops = []
+    for bucket_filename in bucket_filenames:
+        size = os.path.getsize(bucket_filename)
+        num_buckets = bucket_count(size, max_memory)
+        if num_buckets == 1 or single_sequence(bucket_filename):
+            tops.extend(count_bucket(bucket_filename, num_seqs))
+            os.remove(bucket_filename)
+            continue
+
+        num_buckets = max(num_buckets, min_buckets)
+        sub_dir = tempfile.mkdtemp(dir=temp_dir)
+        try:
+            sub_filenames = partition_records(read_bucket(bucket_filename), num_buckets, sub_dir, level + 1)
+            os.remove(bucket_filename)
+            for sub_filename in sub_filenames:
+                # Unsplit buckets are hashed again into more buckets
+                retry_buckets = min(2 * num_buckets, MAX_BUCKETS) if os.path.getsize(sub_filename) == size else 1
+                tops.extend(count_buckets([sub_filename], num_seqs, max_memory, sub_dir, level + 1, retry_buckets))
+        finally:
+            shutil.rmtree(sub_dir, ignore_errors=True)
+    return tops
+
+def get_top_external_sequences(filename, num_seqs, max_memory, temp_dir=None):
+    '''
+    Returns the top-occurring sequences counting in about `max_memory`
+    bytes: sequences are hash-partitioned into bucket files under
+    `temp_dir`, each bucket counted on its own (partitioned again while
+    too large, see `count_buckets`) and the bucket top sequences merged.
+    Ties break on first occurrence in the file, the same as
+    `get_top_sequences`
+    '''
+
+    num_buckets = bucket_count(os.path.getsize(filename), max_memory)
+
+    bucket_dir = tempfile.mkdtemp(dir=temp_dir)
+    try:
+        bucket_filenames = partition_file(filename, num_buckets, bucket_dir)
+        bucket_tops = count_buckets(bucket_filenames, num_seqs, max_memory, bucket_dir)
+    finally:
+        shutil.rmtree(bucket_dir, ignore_errors=True)
+
+    for count, first, seq in heapq.nlargest(num_seqs, bucket_tops):
+        yield '\t'.join(map(str, [seq, count]))
+
+def get_top_sketched_sequences(sketch, num_seqs):
+    '''
+    Returns the top-occurring sequences from a `SpaceSaving` sketch,
+    with their estimated counts
+    '''
+
+    for seq, count, error in sketch.top(num_seqs):
+        yield '\t'.join(map(str, [seq, count]))
 
 
 if __name__ == '__main__':
@@ -66,8 +387,64 @@ if __name__ == '__main__':
     parser.add_argument('-n', '--num_seqs', type=int,
         help='Number of top results to return. Defaults to {num_seqs}'.format(num_seqs=DEFAULT_NUM_SEQS)
     )
+    parser.add_argument('-a', '--approximate', action='store_true',
+        help='Count approximately in fixed memory (Space-Saving), holding at most --capacity sequences'
+    )
+    parser.add_argument('-c', '--capacity', type=int, default=DEFAULT_CAPACITY,
+        help='Sequences held at once by --approximate. Defaults to {capacity}'.format(capacity=DEFAULT_CAPACITY)
+    )
+    parser.add_argument('-w', '--workers', type=int, default=1,
+        help='Count exactly in this many processes, each taking a part of the file. Defaults to 1'
+    )
+    parser.add_argument('-m', '--max-memory', type=int,
+        help='Count exactly in about this many MB, spilling sequences to bucket files on disk'
+    )
+    parser.add_argument('--temp-dir',
+        help='Directory for --max-memory bucket files. Defaults to the system temporary directory'
+    )
+    parser.add_argument('-k', '--keys', choices=seq_keys.KEY_TYPES, default='str',
+        help='Store sequences as str, 2-bit packed bytes, or 128-bit digests (second pass recovers top sequences). Defaults to str'
+    )
+    parser.add_argument('--stats', action='store_true',
+        help='Report time, records and throughput of each phase (read, count, top, output) and peak memory to stderr'
+    )
+    parser.add_argument('--stats-json', help='Write the --stats report as JSON to this path')
+    parser.add_argument('--profile', help='Profile the run with cProfile, saving its stats to this path')
     args = parser.parse_args()
+    if args.max_memory and (args.keys != 'str' or args.workers > 1):
+        parser.error('--max-memory cannot be combined with --keys or --workers')
+
+    num_seqs = args.num_seqs or DEFAULT_NUM_SEQS
+    run_stats = RunStats('seq_mode', args.profile, child_processes=args.workers > 1)
+    num_bytes = os.path.getsize(args.filename) if os.path.isfile(args.filename) else 0
+
+    # The functions raise on a file they cannot read, reported here
+    try:
+        if args.approximate or args.max_memory or args.workers > 1:
+            # These modes read and count together
+            with run_stats.phase('count') as phase:
+                phase.bytes = num_bytes
+                if args.approximate:
+                    results = get_top_sketched_sequences(sketch_file(args.filename, max(args.capacity, num_seqs)), num_seqs)
+                elif args.max_memory:
+                    # A generator, counting buckets only as it is consumed
+                    results = list(get_top_external_sequences(args.filename, num_seqs, args.max_memory << 20, args.temp_dir))
+                else:
+                    seq_hash = hash_file_parallel(args.filename, args.workers, args.keys)
+        else:
+            seq_hash = hash_file(args.filename, args.keys, run_stats)
+
+        with run_stats.phase('top'):
+            if args.approximate:
+                results = list(results)
+            elif not args.max_memory:
+                results = list(get_top_sequences(seq_hash, num_seqs))
+    except (IOError, OSError):
+        exit('Please specify a valid FASTA file')
+
+    with run_stats.phase('output') as phase:
+        for seq in results:
+            print(seq)
+        phase.records = len(results)
 
-    seqs_hashed = hash_file(args.filename)
-    for seq in get_top_sequences(seqs_hashed, args.num_seqs or DEFAULT_NUM_SEQS):
-        print(seq)
+    run_stats.finish(args.stats, args.stats_json)
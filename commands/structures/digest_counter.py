@@ -0,0 +1,95 @@
+import struct
+from array import array
+
+# 128-bit digest as two 64-bit halves
+DIGEST = struct.Struct('<QQ')
+
+
+class DigestCounter(object):
+    '''
+    Hash table counting 128-bit digests, held in flat arrays rather than
+    a dict of objects: 20 bytes per slot plus 4 per distinct digest.
+    Slots stay between `MIN_LOAD` and `MAX_LOAD` full, so a distinct
+    digest takes 31 to 44 bytes, against about 190 for a dict keyed by
+    100 bp strings.
+
+    Open addressing with linear probing, keyed on the digest's high half
+    (already uniformly distributed). A count of 0 marks an empty slot.
+    `order` lists the slot of each digest in the order first added, so
+    ties between counts keep first-seen order, as with a dict.
+    `source` is the FASTA file the digests were counted from, if any,
+    read again to find the sequences behind them
+    '''
+
+    # Table grows by GROWTH once this fraction of slots is in use,
+    # leaving it MIN_LOAD (MAX_LOAD / GROWTH) full
+    MAX_LOAD = 0.75
+    GROWTH = 1.5
+    MIN_LOAD = MAX_LOAD / GROWTH
+
+    def __init__(self, size=1024, source=None):
+        self._allocate(max(size, 1))
+        self.order = array('I')
+        self.source = source
+
+    def _allocate(self, num_slots):
+        self.num_slots = num_slots
+        self.highs = array('Q', [0]) * num_slots
+        self.lows = array('Q', [0]) * num_slots
+        self.counts = array('I', [0]) * num_slots
+        self.max_used = int(num_slots * self.MAX_LOAD)
+
+    def _find_slot(self, high, low):
+        # Slot holding the digest, or the empty slot it belongs in
+        num_slots = self.num_slots
+        slot = high % num_slots
+        while self.counts[slot] and (self.highs[slot] != high or self.lows[slot] != low):
+            slot += 1
+            if slot == num_slots:
+                slot = 0
+        return slot
+
+    def add(self, digest, count=1):
+        high, low = DIGEST.unpack(digest)
+        slot = self._find_slot(high, low)
+        if self.counts[slot]:
+            self.counts[slot] += count
+            return
+
+        self.highs[slot] = high
+        self.lows[slot] = low
+        self.counts[slot] = count
+        self.order.append(slot)
+        if len(self.order) > self.max_used:
+            self._grow()
+
+    def _grow(self):
+        highs, lows, counts, order = self.highs, self.lows, self.counts, self.order
+        self._allocate(int(self.num_slots * self.GROWTH) + 1)
+        self.order = array('I')
+        for slot in order:
+            new_slot = self._find_slot(highs[slot], lows[slot])
+            self.highs[new_slot] = highs[slot]
+            self.lows[new_slot] = lows[slot]
+            self.counts[new_slot] = counts[slot]
+            self.order.append(new_slot)
+
+    def get(self, digest, default=None):
+        slot = self._find_slot(*DIGEST.unpack(digest))
+        return self.counts[slot] if self.counts[slot] else default
+
+    def items(self):
+        '''
+        Yields (digest, count) pairs in first-seen order
+        '''
+        for slot in self.order:
+            yield DIGEST.pack(self.highs[slot], self.lows[slot]), self.counts[slot]
+
+    def __len__(self):
+        return len(self.order)
+
+    def memory_size(self):
+        '''
+        Returns bytes held by the table's arrays
+        '''
+        return sum(values.itemsize * len(values) for values in (self.highs, self.lows, self.counts, self.order))
@@ -0,0 +1,221 @@
+from array import array
+from bisect import bisect_right
+
+from commands.structures.tree import nearest_genes
+
+try:
+    import numpy
+except ImportError:
+    # Batch lookups fall back to `bisect` one coordinate at a time
+    numpy = None
+
+# Array typecodes: positions may exceed 32 bits, ids will not
+POSITION_TYPE = 'q'
+ID_TYPE = 'i'
+
+
+class GeneIndex(object):
+    '''
+    Array-backed gene index for a single chromosome.
+
+    Genes are held in contiguous arrays sorted by start position
+    (`starts`, `stops`, `name_ids` into `names`), with no per-gene objects.
+
+    For point lookups the chromosome is also cut into segments at every
+    gene start and stop, with each segment labelled by the set of genes
+    overlapping it. Segment `i` covers `bounds[i]` up to (not including)
+    `bounds[i + 1]` and holds label `segment_labels[i]`; the genes of
+    label `l` are `label_genes[label_offsets[l]:label_offsets[l + 1]]`.
+    Label 0 is always the empty set. A lookup is then a single binary
+    search, which NumPy can run over a whole batch of coordinates at once
+    '''
+
+    def __init__(self, names, starts, stops, name_ids,
+                 bounds, segment_labels, label_offsets, label_genes):
+        self.names = names
+        self.starts = starts
+        self.stops = stops
+        self.name_ids = name_ids
+        self.bounds = bounds
+        self.segment_labels = segment_labels
+        self.label_offsets = label_offsets
+        self.label_genes = label_genes
+        self.num_genes = len(starts)
+        # Gene name tuples built on demand, one per distinct label
+        self._label_names = {}
+
+    @classmethod
+    def init_from_sorted_genes(cls, sorted_genes):
+        '''
+        Builds the index from [name, start, stop] genes sorted by start,
+        the same input taken by `GeneTree.init_from_sorted_genes`
+        '''
+
+        names = []
+        name_lookup = {}
+        starts = array(POSITION_TYPE)
+        stops = array(POSITION_TYPE)
+        name_ids = array(ID_TYPE)
+
+        # Gene boundaries as (position, is_start, gene); a gene covers
+        # its stop position, so it closes at the following position
+        events = []
+        for gene_id, (name, start, stop) in enumerate(sorted_genes):
+            if name not in name_lookup:
+                name_lookup[name] = len(names)
+                names.append(name)
+            starts.append(start)
+            stops.append(stop)
+            name_ids.append(name_lookup[name])
+            events.append((start, True, gene_id))
+            events.append((stop + 1, False, gene_id))
+        events.sort()
+
+        bounds = array(POSITION_TYPE)
+        segment_labels = array(ID_TYPE)
+        label_offsets = array(ID_TYPE, [0, 0])
+        label_genes = array(ID_TYPE)
+        label_lookup = {(): 0}
+
+        active = set()
+        event_index = 0
+        while event_index < len(events):
+            position = events[event_index][0]
+            # Apply every event at this position before labelling the segment
+            while event_index < len(events) and events[event_index][0] == position:
+                _, is_start, gene_id = events[event_index]
+                if is_start:
+                    active.add(gene_id)
+                else:
+                    active.discard(gene_id)
+                event_index += 1
+
+            label = tuple(sorted(active))
+            if label not in label_lookup:
+                label_lookup[label] = len(label_lookup)
+                label_genes.extend(label)
+                label_offsets.append(len(label_genes))
+
+            if segment_labels and segment_labels[-1] == label_lookup[label]:
+                # Same genes as the previous segment, extend it instead
+                continue
+            bounds.append(position)
+            segment_labels.append(label_lookup[label])
+
+        return cls(names, starts, stops, name_ids,
+                   bounds, segment_labels, label_offsets, label_genes)
+
+    def get_label(self, coordinate):
+        '''
+        Returns the label id of the segment holding the coordinate
+        '''
+        segment = bisect_right(self.bounds, coordinate) - 1
+        if segment < 0:
+            return 0
+        return self.segment_labels[segment]
+
+    def get_label_names(self, label):
+        '''
+        Returns tuple of gene names, ordered by gene start, for a label id
+        '''
+        label_names = self._label_names.get(label)
+        if label_names is None:
+            first, last = self.label_offsets[label], self.label_offsets[label + 1]
+            label_names = tuple(
+                self.names[self.name_ids[gene_id]]
+                for gene_id in self.label_genes[first:last]
+            )
+            self._label_names[label] = label_names
+        return label_names
+
+    def find_names(self, coordinate):
+        '''
+        Returns tuple of names of all genes overlapping the coordinate
+        '''
+        return self.get_label_names(self.get_label(coordinate))
+
+    def find_batch(self, coordinates):
+        '''
+        Returns a tuple of overlapping gene names for each coordinate,
+        looking the whole batch up in one vectorized pass when NumPy is present
+        '''
+
+        if numpy is None or not self.bounds:
+            labels = [self.get_label(coordinate) for coordinate in coordinates]
+        else:
+            bounds = numpy.frombuffer(self.bounds, dtype=numpy.int64)
+            segment_labels = numpy.frombuffer(self.segment_labels, dtype=numpy.int32)
+            segments = numpy.searchsorted(
+                bounds, numpy.asarray(coordinates, dtype=numpy.int64), side='right'
+            ) - 1
+            labels = numpy.where(
+                segments >= 0, segment_labels[segments.clip(0)], 0
+            ).tolist()
+
+        return [self.get_label_names(label) for label in labels]
+
+    def _label_gene_ids(self, label):
+        return self.label_genes[self.label_offsets[label]:self.label_offsets[label + 1]]
+
+    def find_range(self, start, stop):
+        '''
+        Returns tuple of (name, overlap length) of all genes overlapping
+        positions start..stop (inclusive), ordered by gene start: the
+        genes covering the start, then those starting within the range
+        '''
+        gene_ids = list(self._label_gene_ids(self.get_label(start)))
+        gene_ids.extend(range(bisect_right(self.starts, start), bisect_right(self.starts, stop)))
+        return tuple(
+            (self.names[self.name_ids[gene_id]],
+             min(stop, self.stops[gene_id]) - max(start, self.starts[gene_id]) + 1)
+            for gene_id in gene_ids
+        )
+
+    def find_nearest(self, start, stop=None):
+        '''
+        Returns (tuple of names, distance) of the genes nearest positions
+        start..stop (a single position without `stop`), as
+        `GeneTree.find_nearest`. Outside of any gene, the gap holding
+        the region is one segment, bounded by the nearest genes
+        '''
+        if stop is None:
+            stop = start
+        overlapping = self.find_range(start, stop)
+        if overlapping:
+            return tuple(name for name, _ in overlapping), 0
+        if not self.bounds:
+            return (), None
+
+        segment = bisect_right(self.bounds, start) - 1
+        upstream_stop = self.bounds[segment] - 1 if segment > 0 else None
+        downstream_start = self.bounds[segment + 1] if segment + 1 < len(self.bounds) else None
+
+        def genes_at(position, at_stop):
+            positions = self.stops if at_stop else self.starts
+            return [
+                self.names[self.name_ids[gene_id]]
+                for gene_id in self._label_gene_ids(self.get_label(position))
+                if positions[gene_id] == position
+            ]
+
+        return nearest_genes(start, stop, upstream_stop, downstream_start, genes_at)
+
+    def sweep(self, coordinates):
+        '''
+        Yields (coordinate, tuple of overlapping gene names) for each
+        coordinate of a sorted stream, advancing through the segments in a single linear
+        pass instead of searching for every coordinate.
+        A coordinate lower than its predecessor is looked up by binary
+        search instead, so unsorted input is still annotated correctly
+        '''
+
+        bounds = self.bounds
+        num_bounds = len(bounds)
+        segment = -1
+        for coordinate in coordinates:
+            if segment >= 0 and coordinate < bounds[segment]:
+                segment = bisect_right(bounds, coordinate) - 1
+            else:
+                while segment + 1 < num_bounds and bounds[segment + 1] <= coordinate:
+                    segment += 1
+            yield coordinate, self.get_label_names(self.segment_labels[segment] if segment >= 0 else 0)
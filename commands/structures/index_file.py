@@ -0,0 +1,168 @@
+import mmap
+import os
+import struct
+import zlib
+from array import array
+
+from commands.structures.gene_index import GeneIndex, POSITION_TYPE, ID_TYPE
+
+# Binary layout, all little-endian:
+#   header     MAGIC, VERSION, GTF size, GTF mtime (ns), GTF crc32, chromosome count,
+#              length of feature list, comma-separated GTF feature types read
+#              (empty when all rows were read)
+#   directory  per chromosome: name length, name, then (offset, count)
+#              for each entry of `ARRAYS`
+#   data       arrays, each starting on an 8 byte boundary
+# Loading memory-maps the file and views the arrays in place, so
+# processes loading the same index share its pages
+MAGIC = b'GIDX'
+VERSION = 2
+HEADER = struct.Struct('<4sIQQIII')
+NAME_LENGTH = struct.Struct('<I')
+ARRAY_ENTRY = struct.Struct('<QQ')
+ALIGNMENT = 8
+
+# GeneIndex arrays in file order, with their typecodes.
+# Gene names are stored as one newline-separated UTF-8 blob
+ARRAYS = (
+    ('names', 'B'),
+    ('starts', POSITION_TYPE),
+    ('stops', POSITION_TYPE),
+    ('name_ids', ID_TYPE),
+    ('bounds', POSITION_TYPE),
+    ('segment_labels', ID_TYPE),
+    ('label_offsets', ID_TYPE),
+    ('label_genes', ID_TYPE),
+)
+
+
+class IndexFileError(ValueError):
+    '''
+    Raised when an index file is unreadable, of another version,
+    or out of date with its GTF file
+    '''
+
+
+def gtf_key(gtf_filename, checksum=False):
+    '''
+    Returns (size, mtime in ns, crc32) identifying the GTF file contents.
+    The crc32 is only computed when `checksum` requested, otherwise 0
+    '''
+
+    stat = os.stat(gtf_filename)
+    crc = 0
+    if checksum:
+        with open(gtf_filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                crc = zlib.crc32(chunk, crc)
+    return stat.st_size, stat.st_mtime_ns, crc & 0xffffffff
+
+
+def encode_features(features):
+    return ','.join(sorted(features or ())).encode('utf-8')
+
+
+def save_index(index_filename, chromosomes, gtf_filename, features=None):
+    '''
+    Writes hash table of chromosome `GeneIndex`es to `index_filename`,
+    keyed to the GTF file and feature types they were built from.
+    Written to a temporary file first, then moved into place, so
+    readers never see a partially written index
+    '''
+
+    size, mtime_ns, crc = gtf_key(gtf_filename, checksum=True)
+    feature_list = encode_features(features)
+
+    chromosome_arrays = []
+    for chromosome in sorted(chromosomes):
+        gene_index = chromosomes[chromosome]
+        arrays = []
+        for name, typecode in ARRAYS:
+            if name == 'names':
+                arrays.append(array('B', '\n'.join(gene_index.names).encode('utf-8')))
+            else:
+                arrays.append(array(typecode, getattr(gene_index, name)))
+        chromosome_arrays.append((chromosome.encode('utf-8'), arrays))
+
+    # Directory size is known up front, data offsets follow it
+    offset = HEADER.size + len(feature_list) + sum(
+        NAME_LENGTH.size + len(name) + ARRAY_ENTRY.size * len(ARRAYS)
+        for name, arrays in chromosome_arrays
+    )
+    directory = []
+    for name, arrays in chromosome_arrays:
+        entries = []
+        for values in arrays:
+            offset += -offset % ALIGNMENT
+            entries.append((offset, len(values)))
+            offset += len(values) * values.itemsize
+        directory.append((name, entries))
+
+    temp_filename = '{0}.{1}.tmp'.format(index_filename, os.getpid())
+    with open(temp_filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, size, mtime_ns, crc, len(directory), len(feature_list)))
+        f.write(feature_list)
+        for name, entries in directory:
+            f.write(NAME_LENGTH.pack(len(name)))
+            f.write(name)
+            for entry in entries:
+                f.write(ARRAY_ENTRY.pack(*entry))
+        for (name, entries), (_, arrays) in zip(directory, chromosome_arrays):
+            for (array_offset, count), values in zip(entries, arrays):
+                f.write(b'\0' * (array_offset - f.tell()))
+                f.write(values.tobytes())
+    os.replace(temp_filename, index_filename)
+
+
+def load_index(index_filename, gtf_filename, verify_checksum=False, features=None):
+    '''
+    Memory-maps `index_filename`, returning hash table of chromosome
+    `GeneIndex`es viewing the mapped arrays.
+    Raises `IndexFileError` if the index does not match `gtf_filename`
+    by size and mtime, or by crc32 when `verify_checksum` requested,
+    or was built from other GTF feature types than `features`
+    '''
+
+    try:
+        with open(index_filename, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError) as e:
+        raise IndexFileError('Cannot map index file: {0}'.format(e))
+
+    if len(mapped) < HEADER.size:
+        raise IndexFileError('Index file truncated')
+    magic, version, size, mtime_ns, crc, num_chromosomes, features_length = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise IndexFileError('Not a gene index file')
+    if version != VERSION:
+        raise IndexFileError('Index file version {0}, expected {1}'.format(version, VERSION))
+
+    gtf_size, gtf_mtime_ns, gtf_crc = gtf_key(gtf_filename, checksum=verify_checksum)
+    if (size, mtime_ns) != (gtf_size, gtf_mtime_ns) or (verify_checksum and crc != gtf_crc):
+        raise IndexFileError('Index file out of date with {0}'.format(gtf_filename))
+
+    view = memoryview(mapped)
+    position = HEADER.size + features_length
+    if bytes(view[HEADER.size:position]) != encode_features(features):
+        raise IndexFileError('Index file built from other GTF feature types')
+
+    chromosomes = {}
+    for _ in range(num_chromosomes):
+        name_length, = NAME_LENGTH.unpack_from(mapped, position)
+        position += NAME_LENGTH.size
+        chromosome = bytes(view[position:position + name_length]).decode('utf-8')
+        position += name_length
+
+        arrays = {}
+        for name, typecode in ARRAYS:
+            offset, count = ARRAY_ENTRY.unpack_from(mapped, position)
+            position += ARRAY_ENTRY.size
+            itemsize = array(typecode).itemsize
+            if offset + count * itemsize > len(mapped):
+                raise IndexFileError('Index file truncated')
+            arrays[name] = view[offset:offset + count * itemsize].cast(typecode)
+
+        names = bytes(arrays.pop('names')).decode('utf-8')
+        arrays['names'] = names.split('\n') if names else []
+        chromosomes[chromosome] = GeneIndex(**arrays)
+    return chromosomes
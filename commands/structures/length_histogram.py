@@ -0,0 +1,122 @@
+import json
+
+# Serialized histograms of another version are not read
+HISTOGRAM_VERSION = 1
+
+
+class LengthHistogram(object):
+    '''
+    Counts of reads by sequence length, `counts[length]` reads of
+    each length, built in a single pass over a file.
+    Answers any number of length thresholds and summary statistics
+    without rereading the file
+    '''
+
+    def __init__(self, counts=None):
+        self.counts = list(counts or [])
+
+    def add_counts(self, length_counts):
+        '''
+        Adds mapping of length to number of reads, e.g. a `Counter` of lengths
+        '''
+        if not length_counts:
+            return
+        longest = max(length_counts)
+        if longest >= len(self.counts):
+            self.counts.extend([0] * (longest + 1 - len(self.counts)))
+        for length, count in length_counts.items():
+            self.counts[length] += count
+
+    def merge(self, other):
+        '''
+        Adds the reads counted by another histogram
+        '''
+        self.add_counts(dict((length, count) for length, count in enumerate(other.counts) if count))
+
+    def total(self):
+        return sum(self.counts)
+
+    def total_bases(self):
+        return sum(length * count for length, count in enumerate(self.counts))
+
+    def count_gt(self, nt_len):
+        '''
+        Returns number of reads longer than `nt_len` nucleotides
+        '''
+        return sum(self.counts[max(nt_len + 1, 0):])
+
+    def perc_gt(self, nt_len):
+        '''
+        Returns percent of reads longer than `nt_len` nucleotides
+        '''
+        total = self.total()
+        if not total:
+            return 0.0
+        return float(self.count_gt(nt_len)) / total * 100
+
+    def mean(self):
+        total = self.total()
+        if not total:
+            return 0.0
+        return float(self.total_bases()) / total
+
+    def percentile(self, perc):
+        '''
+        Returns smallest read length with at least `perc` percent
+        of reads no longer than it
+        '''
+        needed = self.total() * perc / 100.0
+        seen = 0
+        for length, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= needed:
+                return length
+        return 0
+
+    def n50(self):
+        '''
+        Returns length of the shortest read among the longest reads
+        holding at least half of all bases
+        '''
+        needed = self.total_bases() / 2.0
+        seen = 0
+        for length in range(len(self.counts) - 1, 0, -1):
+            seen += length * self.counts[length]
+            if self.counts[length] and seen >= needed:
+                return length
+        return 0
+
+    def to_dict(self):
+        # Sparse, lengths as strings for JSON object keys
+        return {
+            'version': HISTOGRAM_VERSION,
+            'counts': dict((str(length), count) for length, count in enumerate(self.counts) if count),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != HISTOGRAM_VERSION:
+            raise ValueError('Unsupported histogram version {0}'.format(data.get('version')))
+        histogram = cls()
+        histogram.add_counts(dict((int(length), count) for length, count in data['counts'].items()))
+        return histogram
+
+    def dumps(self):
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    @classmethod
+    def loads(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    def __eq__(self, other):
+        return isinstance(other, LengthHistogram) and self.counts[:self._used()] == other.counts[:other._used()]
+
+    def __ne__(self, other):
+        return not self == other
+
+    def _used(self):
+        # Length of `counts` without trailing zeros
+        used = len(self.counts)
+        while used and not self.counts[used - 1]:
+            used -= 1
+        return used
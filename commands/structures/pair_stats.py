@@ -0,0 +1,62 @@
+from commands.structures.length_histogram import LengthHistogram
+
+
+class PairStats(object):
+    '''
+    Read lengths of the mate pairs of paired-end files, built in a
+    single pass over both: a `LengthHistogram` of each file's reads,
+    and of the shorter and the longer mate of each pair. Both mates
+    are longer than a length exactly when the shorter one is, and
+    either is when the longer one is, so any number of lengths are
+    answered per pair without rereading the files
+    '''
+
+    def __init__(self, first=None, second=None, shorter=None, longer=None):
+        self.first = first if first is not None else LengthHistogram()
+        self.second = second if second is not None else LengthHistogram()
+        self.shorter = shorter if shorter is not None else LengthHistogram()
+        self.longer = longer if longer is not None else LengthHistogram()
+
+    @classmethod
+    def from_length_pairs(cls, length_pairs):
+        '''
+        Returns `PairStats` of mapping of (R1 length, R2 length) to
+        number of pairs, e.g. a `Counter` of mate lengths
+        '''
+        counts = [{}, {}, {}, {}]
+        for (length1, length2), count in length_pairs.items():
+            lengths = (length1, length2, min(length1, length2), max(length1, length2))
+            for histogram_counts, length in zip(counts, lengths):
+                histogram_counts[length] = histogram_counts.get(length, 0) + count
+
+        stats = cls()
+        for histogram, histogram_counts in zip(stats.histograms(), counts):
+            histogram.add_counts(histogram_counts)
+        return stats
+
+    def histograms(self):
+        return [self.first, self.second, self.shorter, self.longer]
+
+    def total(self):
+        '''
+        Returns number of pairs
+        '''
+        return self.shorter.total()
+
+    def perc_both_gt(self, nt_len):
+        '''
+        Returns percent of pairs with both mates longer than `nt_len` nucleotides
+        '''
+        return self.shorter.perc_gt(nt_len)
+
+    def perc_either_gt(self, nt_len):
+        '''
+        Returns percent of pairs with at least one mate longer than `nt_len` nucleotides
+        '''
+        return self.longer.perc_gt(nt_len)
+
+    def __eq__(self, other):
+        return isinstance(other, PairStats) and self.histograms() == other.histograms()
+
+    def __ne__(self, other):
+        return not self == other
@@ -0,0 +1,126 @@
+from commands.structures.length_histogram import LengthHistogram
+
+# Serialized stats of another version are not read
+READ_STATS_VERSION = 1
+
+# Quality characters are Phred scores plus this offset (Sanger/Illumina 1.8+)
+PHRED_OFFSET = 33
+
+
+class ReadStats(object):
+    '''
+    QC statistics of the reads of a file, built in the same single pass
+    as their `LengthHistogram`: G/C and N base counts, and the sum of
+    quality characters at each read position, `quality_sums[i]` for
+    position i of all reads long enough to have one
+    '''
+
+    def __init__(self, histogram=None, gc_bases=0, n_bases=0, quality_sums=None):
+        self.histogram = histogram if histogram is not None else LengthHistogram()
+        self.gc_bases = gc_bases
+        self.n_bases = n_bases
+        self.quality_sums = list(quality_sums or [])
+
+    def add_quality_sums(self, sums):
+        '''
+        Adds sequence of quality sums by position
+        '''
+        if len(sums) > len(self.quality_sums):
+            self.quality_sums.extend([0] * (len(sums) - len(self.quality_sums)))
+        for position, total in enumerate(sums):
+            self.quality_sums[position] += total
+
+    def merge(self, other):
+        '''
+        Adds the reads counted by another `ReadStats`
+        '''
+        self.histogram.merge(other.histogram)
+        self.gc_bases += other.gc_bases
+        self.n_bases += other.n_bases
+        self.add_quality_sums(other.quality_sums)
+
+    def total(self):
+        return self.histogram.total()
+
+    def total_bases(self):
+        return self.histogram.total_bases()
+
+    def gc_content(self):
+        '''
+        Returns percent of bases that are G or C
+        '''
+        total_bases = self.total_bases()
+        if not total_bases:
+            return 0.0
+        return float(self.gc_bases) / total_bases * 100
+
+    def n_rate(self):
+        '''
+        Returns percent of bases that are N
+        '''
+        total_bases = self.total_bases()
+        if not total_bases:
+            return 0.0
+        return float(self.n_bases) / total_bases * 100
+
+    def coverage(self):
+        '''
+        Returns number of reads reaching each position, longest read first position last
+        '''
+        counts = self.histogram.counts
+        reads = []
+        remaining = self.total()
+        for length in range(len(counts) - 1):
+            remaining -= counts[length]
+            reads.append(remaining)
+        # Positions reached by no read are dropped
+        while reads and not reads[-1]:
+            reads.pop()
+        return reads
+
+    def mean_qualities(self, offset=PHRED_OFFSET):
+        '''
+        Returns mean Phred quality at each read position
+        '''
+        return [
+            float(total) / reads - offset
+            for total, reads in zip(self.quality_sums, self.coverage())
+        ]
+
+    def to_dict(self):
+        return {
+            'version': READ_STATS_VERSION,
+            'histogram': self.histogram.to_dict(),
+            'gc_bases': self.gc_bases,
+            'n_bases': self.n_bases,
+            'quality_sums': self.quality_sums,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != READ_STATS_VERSION:
+            raise ValueError('Unsupported read stats version {0}'.format(data.get('version')))
+        return cls(LengthHistogram.from_dict(data['histogram']), data['gc_bases'], data['n_bases'],
+                   data['quality_sums'])
+
+    def summary(self):
+        '''
+        Returns dict of the QC statistics, as reported per file
+        '''
+        return {
+            'reads': self.total(),
+            'bases': self.total_bases(),
+            'mean_length': self.histogram.mean(),
+            'gc_percent': self.gc_content(),
+            'n_percent': self.n_rate(),
+            'mean_quality_by_position': self.mean_qualities(),
+            'length_histogram': self.histogram.to_dict()['counts'],
+        }
+
+    def __eq__(self, other):
+        return (isinstance(other, ReadStats) and self.histogram == other.histogram
+                and (self.gc_bases, self.n_bases) == (other.gc_bases, other.n_bases)
+                and self.quality_sums == other.quality_sums)
+
+    def __ne__(self, other):
+        return not self == other
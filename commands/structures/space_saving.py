@@ -0,0 +1,71 @@
+import heapq
+
+
+class SpaceSaving(object):
+    '''
+    Space-Saving heavy hitters sketch (Metwally et al., 2005).
+    Counts at most `capacity` distinct items at once: a new item
+    arriving when full replaces an item of the lowest count, inheriting
+    that count as its possible overestimate (`errors`).
+    Any item occurring more than total / capacity times is guaranteed
+    to be held, with a count no lower than its true count.
+
+    Items are grouped into buckets by count, so the lowest count item
+    is found and items incremented in O(1)
+    '''
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('Capacity must be at least 1')
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # Count -> items with that count, as dict keys to keep insertion order
+        self.buckets = {}
+        self.min_count = 0
+        self.total = 0
+
+    def _move(self, item, count, new_count):
+        bucket = self.buckets[count]
+        del bucket[item]
+        if not bucket:
+            del self.buckets[count]
+            if count == self.min_count:
+                self.min_count = new_count
+        self.buckets.setdefault(new_count, {})[item] = None
+        self.counts[item] = new_count
+
+    def add(self, item):
+        self.total += 1
+        count = self.counts.get(item)
+        if count is not None:
+            self._move(item, count, count + 1)
+            return
+
+        if len(self.counts) < self.capacity:
+            self.counts[item] = 1
+            self.errors[item] = 0
+            self.buckets.setdefault(1, {})[item] = None
+            self.min_count = 1
+            return
+
+        # Replace the longest held of the lowest count items
+        bucket = self.buckets[self.min_count]
+        victim = next(iter(bucket))
+        count = self.counts.pop(victim)
+        del self.errors[victim]
+        del bucket[victim]
+        bucket[item] = None
+        self.counts[item] = count
+        self.errors[item] = count
+        self._move(item, count, count + 1)
+
+    def top(self, num_items):
+        '''
+        Returns up to `num_items` (item, count, overestimate) tuples,
+        highest count first
+        '''
+        return [
+            (item, count, self.errors[item])
+            for item, count in heapq.nlargest(num_items, self.counts.items(), key=lambda pair: pair[1])
+        ]
@@ -19,6 +19,9 @@ class GeneNode(object):
         self.name = name
         self.left = None
         self.right = None
+        # Greatest stop position within this node's subtree,
+        # lets searches skip branches that end before a coordinate
+        self.max_stop = self.coordinates.stop_pos
 
     def get_name(self):
         return self.name
@@ -32,10 +35,14 @@ class GeneNode(object):
 
 class GeneTree(object):
     '''
-    Binary search tree with genes as nodes.
+    Binary search tree with genes as nodes, keyed on start position.
     Loaded from top-down order.
     Tree is balanced if fed a sorted array to
     `create_from_sorted_list`
+    Each node tracks the greatest stop position of its subtree
+    (augmented interval tree), so every gene overlapping a coordinate
+    can be found in O(log n + k), including long or nested genes
+    sitting in the opposite branch
     Builds on top of add/find functionality taken from
     http://stackoverflow.com/questions/2598437/how-to-implement-a-binary-tree-in-python
     '''
@@ -80,6 +87,9 @@ class GeneTree(object):
         self.num_genes += 1
     
     def _add(self, name, coordinates, gene_node):
+        # Every node on the path to the new gene now spans its stop
+        gene_node.max_stop = max(gene_node.max_stop, coordinates[1])
+
         if coordinates[0] < gene_node.get_start():
             if gene_node.left is not None:
                 self._add(name, coordinates, gene_node.left)
@@ -92,14 +102,130 @@ class GeneTree(object):
                 gene_node.right = GeneNode(name, coordinates)
 
     def find(self, coordinate):
-        if self.root is not None:
-            return self._find(coordinate, self.root)
-
-    def _find(self, coordinate, gene_node):
-        if coordinate >= gene_node.get_start() and coordinate <= gene_node.get_stop():
-            # The gene was found
+        '''
+        Returns the first gene (by start position) overlapping
+        the coordinate, or None
+        '''
+        for gene_node in self._overlaps(coordinate, coordinate):
             return gene_node
-        elif coordinate < gene_node.get_start() and gene_node.left is not None:
-            return self._find(coordinate, gene_node.left)
-        elif coordinate > gene_node.get_stop() and gene_node.right is not None:
-            return self._find(coordinate, gene_node.right)
+
+    def find_all(self, coordinate):
+        '''
+        Returns all genes overlapping the coordinate, ordered by start position
+        '''
+        return list(self._overlaps(coordinate, coordinate))
+
+    def _overlaps(self, start, stop):
+        # In-order walk over genes overlapping start..stop, pruning
+        # subtrees which cannot hold one:
+        # - whole subtree ends before the start (`max_stop`)
+        # - right subtree starts after the stop (keyed on start)
+        stack = []
+        gene_node = self.root
+        while stack or gene_node is not None:
+            while gene_node is not None and gene_node.max_stop >= start:
+                stack.append(gene_node)
+                gene_node = gene_node.left
+
+            if not stack:
+                return
+
+            gene_node = stack.pop()
+            if stop < gene_node.get_start():
+                # Remaining nodes all start beyond the stop
+                return
+            if start <= gene_node.get_stop():
+                yield gene_node
+            gene_node = gene_node.right
+
+    def find_names(self, coordinate):
+        '''
+        Returns tuple of names of all genes overlapping the coordinate
+        '''
+        return tuple(gene_node.get_name() for gene_node in self._overlaps(coordinate, coordinate))
+
+    def find_batch(self, coordinates):
+        '''
+        Returns a tuple of overlapping gene names for each coordinate
+        '''
+        return [self.find_names(coordinate) for coordinate in coordinates]
+
+    def find_range(self, start, stop):
+        '''
+        Returns tuple of (name, overlap length) of all genes overlapping
+        positions start..stop (inclusive), ordered by gene start
+        '''
+        return tuple(
+            (gene_node.get_name(), min(stop, gene_node.get_stop()) - max(start, gene_node.get_start()) + 1)
+            for gene_node in self._overlaps(start, stop)
+        )
+
+    def find_nearest(self, start, stop=None):
+        '''
+        Returns (tuple of names, distance) of the genes nearest positions
+        start..stop (a single position without `stop`): overlapping genes
+        at distance 0, else the genes ending closest before the start or
+        starting closest after the stop, both if equally near.
+        Returns ((), None) for a tree without genes
+        '''
+        if stop is None:
+            stop = start
+        overlapping = tuple(gene_node.get_name() for gene_node in self._overlaps(start, stop))
+        if overlapping:
+            return overlapping, 0
+
+        # Upstream: greatest stop among genes starting before the region,
+        # none of which reach it
+        upstream_stop = None
+        gene_node = self.root
+        while gene_node is not None:
+            if gene_node.get_start() < start:
+                candidates = [gene_node.get_stop()]
+                if gene_node.left is not None:
+                    candidates.append(gene_node.left.max_stop)
+                if upstream_stop is not None:
+                    candidates.append(upstream_stop)
+                upstream_stop = max(candidates)
+                gene_node = gene_node.right
+            else:
+                gene_node = gene_node.left
+
+        # Downstream: least start after the region
+        downstream_start = None
+        gene_node = self.root
+        while gene_node is not None:
+            if gene_node.get_start() > stop:
+                downstream_start = gene_node.get_start()
+                gene_node = gene_node.left
+            else:
+                gene_node = gene_node.right
+
+        def genes_at(position, at_stop):
+            return [
+                gene_node.get_name() for gene_node in self._overlaps(position, position)
+                if (gene_node.get_stop() if at_stop else gene_node.get_start()) == position
+            ]
+
+        return nearest_genes(start, stop, upstream_stop, downstream_start, genes_at)
+
+
+def nearest_genes(start, stop, upstream_stop, downstream_start, genes_at):
+    '''
+    Returns (tuple of names, distance) of the nearer of the genes ending
+    at `upstream_stop` before `start` and those starting at
+    `downstream_start` after `stop` (either None if there are none).
+    `genes_at(position, at_stop)` lists names of genes stopping, or
+    starting, at a position. Shared by `GeneTree` and `GeneIndex`
+    '''
+    upstream = start - upstream_stop if upstream_stop is not None else None
+    downstream = downstream_start - stop if downstream_start is not None else None
+    if upstream is None and downstream is None:
+        return (), None
+
+    distance = min(distance for distance in (upstream, downstream) if distance is not None)
+    names = []
+    if upstream == distance:
+        names.extend(genes_at(upstream_stop, True))
+    if downstream == distance:
+        names.extend(name for name in genes_at(downstream_start, False) if name not in names)
+    return tuple(names), distance
@@ -0,0 +1,108 @@
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+from commands import annotation_server
+from commands import get_annotations as annot
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        http.client.HTTPConnection.__init__(self, 'localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+class TestAnnotationServer(unittest.TestCase):
+    def setUp(self):
+        self.gtf_file = './tests/test_files/gtf/test_3.gtf'
+        with open('./tests/test_files/annotate/coordinates_to_annotate.txt') as f:
+            self.lines = f.read().splitlines()
+        self.annotator = annot.GeneAnnotator.from_gtf(self.gtf_file)
+
+    def serve(self, **kwargs):
+        server = annotation_server.make_server(self.annotator, port=0, **kwargs)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def request(self, connection, method, path, body=None, headers=None):
+        connection.request(method, path, body, headers or {})
+        response = connection.getresponse()
+        return response.status, response.read().decode('utf-8'), response
+
+    def test_annotates_lines_like_command_line(self):
+        server = self.serve()
+        connection = http.client.HTTPConnection(*server.server_address)
+        status, text, response = self.request(connection, 'POST', '/annotate', '\n'.join(self.lines))
+
+        self.assertEqual(status, 200)
+        self.assertEqual(text.splitlines(), list(self.annotator.annotate_lines(self.lines)))
+        self.assertTrue(float(response.getheader('X-Annotation-Time-Ms')) >= 0)
+
+    def test_annotates_json_batches_and_reports_stats(self):
+        server = self.serve()
+        connection = http.client.HTTPConnection(*server.server_address)
+        pairs = [[line.split()[0], int(line.split()[1])] for line in self.lines]
+        for _ in range(3):
+            status, text, _ = self.request(connection, 'POST', '/annotate', json.dumps({'coordinates': pairs}),
+                                           {'Content-Type': 'application/json'})
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(text)['genes'], [list(names) for names in self.annotator.find_batch(pairs)])
+
+        status, text, _ = self.request(connection, 'POST', '/annotate', 'chr1\tnot_a_position')
+        self.assertEqual(status, 400)
+
+        status, text, _ = self.request(connection, 'GET', '/stats')
+        stats = json.loads(text)
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['coordinates'], 3 * len(pairs))
+        self.assertEqual(stats['errors'], 1)
+        self.assertTrue(stats['latency_ms']['p50'] <= stats['latency_ms']['max'])
+
+    def test_answers_concurrent_clients(self):
+        server = self.serve()
+        expected = list(self.annotator.annotate_lines(self.lines))
+        results = []
+
+        def client():
+            connection = http.client.HTTPConnection(*server.server_address)
+            for _ in range(5):
+                results.append(self.request(connection, 'POST', '/annotate', '\n'.join(self.lines))[1].splitlines())
+
+        threads = [threading.Thread(target=client) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [expected] * 20)
+
+    @unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'Unix sockets not supported')
+    def test_serves_on_unix_socket(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, temp_dir)
+        socket_path = os.path.join(temp_dir, 'annotations.sock')
+        self.serve(socket_path=socket_path)
+        status, text, _ = self.request(UnixHTTPConnection(socket_path), 'GET', '/health')
+        self.assertEqual((status, text), (200, 'ok\n'))
+
+    @unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'Unix sockets not supported')
+    def test_keeps_file_that_is_not_a_socket(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, temp_dir)
+        path = os.path.join(temp_dir, 'genes.gtf')
+        with open(path, 'w') as f:
+            f.write('data\n')
+        self.addCleanup(os.remove, path)
+        with self.assertRaises(OSError):
+            annotation_server.make_server(self.annotator, socket_path=path)
+        with open(path) as f:
+            self.assertEqual(f.read(), 'data\n')
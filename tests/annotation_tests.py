@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 
 from commands import get_annotations as annot
@@ -30,13 +32,13 @@ class TestGetAnnotations(unittest.TestCase):
         # gene for improved performance
         # Single chromosome:
         start, stop = 134196546, 134204162
-        chromosomes = annot.cache_chromosomes(self.gtf_files[0])
+        chromosomes = annot.cache_chromosomes(self.gtf_files[0], 'tree')
         gene = chromosomes.get('chr3').find((start + stop) / 2)
         self.assertEqual(start, gene.get_start())
         self.assertEqual(stop, gene.get_stop())
 
         # 2 chromosomes:
-        chromosomes = annot.cache_chromosomes(self.gtf_files[1])
+        chromosomes = annot.cache_chromosomes(self.gtf_files[1], 'tree')
 
         start, stop = 136333462, 136335910
         gene = chromosomes.get('chr9').find((start + stop) / 2)
@@ -48,8 +50,18 @@ class TestGetAnnotations(unittest.TestCase):
         self.assertEqual(start, gene.get_start())
         self.assertEqual(stop, gene.get_stop())
 
+    def test_cache_chromosomes_reads_only_requested_features(self):
+        # Final intron no longer extends the gene
+        chromosomes = annot.cache_chromosomes(self.gtf_files[0], 'tree', features={'exon'})
+        gene = chromosomes.get('chr3').find(134200000)
+        self.assertEqual(gene.get_start(), 134196546)
+        self.assertEqual(gene.get_stop(), 134201774)
+
+        chromosomes = annot.cache_chromosomes(self.gtf_files[0], features={'gene'})
+        self.assertEqual(chromosomes, {})
+
     def test_cache_chromosomes_joins_out_of_order_gene(self):
-        chromosomes = annot.cache_chromosomes(self.gtf_files[0])
+        chromosomes = annot.cache_chromosomes(self.gtf_files[0], 'tree')
         gene = chromosomes.get('chr3').find(134200000)
         self.assertEqual(gene.get_start(), 134196546)
         self.assertEqual(gene.get_stop(), 134204162)
@@ -112,6 +124,25 @@ class TestGetAnnotations(unittest.TestCase):
         result = annot.find_overlap(chromosome, after, chromosomes)
         self.assertNotEqual(result, gene_name)
     
+    def test_find_overlap_finds_all_overlapping_genes(self):
+        chromosome = 'chr7'
+        genes = [
+            ['OUTER', 100, 10000],
+            ['FIRST', 200, 300],
+            ['SECOND', 250, 400],
+            ['LATER', 5000, 6000],
+        ]
+
+        chromosomes = {chromosome: GeneTree.init_from_sorted_genes(genes)}
+        result = annot.find_overlap(chromosome, 275, chromosomes)
+        self.assertEqual(result, 'OUTER,FIRST,SECOND')
+
+        result = annot.find_overlap(chromosome, 5500, chromosomes)
+        self.assertEqual(result, 'OUTER,LATER')
+
+        result = annot.find_overlap(chromosome, 10001, chromosomes)
+        self.assertEqual(result, None)
+
     def test_match_coords_finds_correct_genes(self):
         CHR_12_GENE = 'FRUGAL'
         CHR_5_GENE = 'CRUCIAL'
@@ -136,3 +167,151 @@ class TestGetAnnotations(unittest.TestCase):
             else:
                 self.assertIn(gene_name, [CHR_12_GENE, CHR_5_GENE])
 
+    def test_cache_chromosomes_array_index_matches_tree(self):
+        for gtf_file in self.gtf_files:
+            trees = annot.cache_chromosomes(gtf_file, 'tree')
+            indexes = annot.cache_chromosomes(gtf_file, 'array')
+            self.assertEqual(sorted(trees), sorted(indexes))
+
+            # Probe around every feature boundary in the file
+            with open(gtf_file) as f:
+                for line in f:
+                    data = line.split()
+                    chromosome, start, stop = data[0], int(data[3]), int(data[4])
+                    for coordinate in [start - 1, start, stop, stop + 1]:
+                        self.assertEqual(
+                            annot.find_overlap(chromosome, coordinate, trees),
+                            annot.find_overlap(chromosome, coordinate, indexes)
+                        )
+
+    def test_match_coords_with_array_index(self):
+        genes = {
+            'chr12': {'FRUGAL': [20000000, 30000000]},
+            'chr5': {'CRUCIAL': [70000000, 80000000]},
+        }
+        chromosomes = annot.convert_gene_index(genes)
+
+        results = [match.split() for match in annot.match_coords(self.coord_files[0], chromosomes)]
+        self.assertEqual(results, [
+            ['chr12', '20704380', 'FRUGAL'],
+            ['chr12', '20704379', 'FRUGAL'],
+            ['chr5', '71146882', 'CRUCIAL'],
+            ['chr8', '38283717', annot.NOT_FOUND_MESSAGE],
+        ])
+
+    def test_match_sorted_coords_matches_match_coords(self):
+        genes = {
+            'chr1': {'OUTER': [100, 10000], 'INNER': [200, 300], 'LATER': [5000, 6000]},
+            'chr2': {'ONLY': [50, 60]},
+        }
+        chromosomes = annot.convert_gene_index(genes)
+
+        fd, coord_file = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            for chromosome, coordinate in [('chr1', 99), ('chr1', 100), ('chr1', 250), ('chr1', 250),
+                                           ('chr1', 5500), ('chr1', 20000), ('chr2', 55), ('chr3', 1)]:
+                f.write('{0}\t{1}\n'.format(chromosome, coordinate))
+        try:
+            self.assertEqual(
+                list(annot.match_sorted_coords(coord_file, chromosomes)),
+                list(annot.match_coords(coord_file, chromosomes))
+            )
+        finally:
+            os.remove(coord_file)
+
+    def test_match_coords_nearest_adds_nearest_genes_and_distance(self):
+        genes = {
+            'chr12': {'FRUGAL': [20000000, 20704379]},
+            'chr5': {'CRUCIAL': [70000000, 80000000]},
+        }
+        chromosomes = annot.convert_gene_index(genes)
+
+        results = [match.split('\t') for match in annot.match_coords(self.coord_files[0], chromosomes, nearest=True)]
+        self.assertEqual(results, [
+            ['chr12', '20704380', annot.NOT_FOUND_MESSAGE, 'FRUGAL', '1'],
+            ['chr12', '20704379', 'FRUGAL', 'FRUGAL', '0'],
+            ['chr5', '71146882', 'CRUCIAL', 'CRUCIAL', '0'],
+            ['chr8', '38283717', annot.NOT_FOUND_MESSAGE, annot.NOT_FOUND_MESSAGE, annot.MISSING_DISTANCE],
+        ])
+
+    def test_annotate_bed_lines_reports_overlap_per_gene(self):
+        genes = {
+            'chr1': {'OUTER': [100, 10000], 'INNER': [200, 300], 'LATER': [12000, 13000]},
+        }
+        lines = [
+            'track name=regions\n',
+            '# comment\n',
+            'chr1\t149\t250\tregion1\t0\t+\n',
+            'chr1\t10000\t10100\n',
+            'chr1\t199\t199\n',
+            'chr2\t0\t10\n',
+        ]
+        trees = {'chr1': GeneTree.init_from_sorted_genes([['OUTER', 100, 10000], ['INNER', 200, 300],
+                                                          ['LATER', 12000, 13000]])}
+        for chromosomes in [trees, annot.convert_gene_index(genes)]:
+            results = list(annot.annotate_bed_lines(lines, chromosomes, nearest=True))
+            self.assertEqual(results, [
+                'chr1\t149\t250\tregion1\t0\t+\tOUTER:101,INNER:51\tOUTER,INNER\t0',
+                'chr1\t10000\t10100\t{0}\tOUTER\t1'.format(annot.NOT_FOUND_MESSAGE),
+                'chr1\t199\t199\tOUTER:1,INNER:1\tOUTER,INNER\t0',
+                'chr2\t0\t10\t{0}\t{0}\t{1}'.format(annot.NOT_FOUND_MESSAGE, annot.MISSING_DISTANCE),
+            ])
+
+    def test_match_coords_parallel_annotates_bed(self):
+        gtf_file = self.gtf_files[2]
+        fd, bed_file = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f, open(gtf_file) as gtf:
+            for line in gtf:
+                data = line.split()
+                f.write('{0}\t{1}\t{2}\n'.format(data[0], int(data[3]) - 20, int(data[3]) + 20))
+        try:
+            expected = ''.join(result + '\n' for result in
+                               annot.match_bed(bed_file, annot.cache_chromosomes(gtf_file), nearest=True))
+            results = ''.join(annot.match_coords_parallel(bed_file, gtf_file, 3, bed=True, nearest=True))
+            self.assertEqual(results, expected)
+        finally:
+            os.remove(bed_file)
+
+    def test_split_file_covers_file_on_line_boundaries(self):
+        coord_file = './tests/test_files/annotate/coordinates_to_annotate.txt'
+        with open(coord_file, 'rb') as f:
+            data = f.read()
+
+        for num_chunks in [1, 2, 3, 10]:
+            ranges = annot.split_file(coord_file, num_chunks)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], len(data))
+            for (_, stop), (start, _) in zip(ranges, ranges[1:]):
+                self.assertEqual(stop, start)
+                self.assertEqual(data[start - 1:start], b'\n')
+
+    def test_match_coords_parallel_keeps_input_order(self):
+        gtf_file = self.gtf_files[2]
+        fd, coord_file = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f, open(gtf_file) as gtf:
+            for line in gtf:
+                data = line.split()
+                for coordinate in [int(data[3]) - 1, int(data[3]), int(data[4]) + 1]:
+                    f.write('{0}\t{1}\n'.format(data[0], coordinate))
+        try:
+            expected = ''.join(result + '\n' for result in
+                               annot.match_coords(coord_file, annot.cache_chromosomes(gtf_file)))
+            results = ''.join(annot.match_coords_parallel(coord_file, gtf_file, 3))
+            self.assertEqual(results, expected)
+        finally:
+            os.remove(coord_file)
+
+    def test_gene_annotator_reuses_loaded_index(self):
+        annotator = annot.GeneAnnotator.from_gtf(self.gtf_files[2])
+        chromosomes = annot.cache_chromosomes(self.gtf_files[2], 'array')
+        with open(self.coord_files[0]) as f:
+            lines = f.readlines()
+
+        self.assertEqual(list(annotator.annotate_lines(lines)), list(annot.annotate_lines(lines, chromosomes)))
+        pairs = [(line.split()[0], int(line.split()[1])) for line in lines]
+        self.assertEqual(annotator.find_batch(pairs), [annotator.find(*pair) for pair in pairs])
+        self.assertEqual(annotator.find('chrUnknown', 100), ())
+
+    def test_gene_annotator_raises_on_missing_file(self):
+        with self.assertRaises(IOError):
+            annot.GeneAnnotator.from_gtf('./tests/wrong_filename.gtf')
@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks import generators
+from commands import fastq_nt_gt_len, get_annotations as annot, seq_mode
+
+class TestBenchmarkGenerators(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def path(self, name):
+        return os.path.join(self.temp_dir, name)
+
+    def read(self, filename):
+        with open(filename) as f:
+            return f.read()
+
+    def test_generators_are_deterministic(self):
+        for generate in [generators.write_fastq, generators.write_fasta]:
+            generate(self.path('a'), 20000, seed=3)
+            generate(self.path('b'), 20000, seed=3)
+            self.assertEqual(self.read(self.path('a')), self.read(self.path('b')))
+            self.assertTrue(20000 <= os.path.getsize(self.path('a')) < 40000)
+
+    def test_fastq_and_fasta_readable_by_commands(self):
+        num_reads = generators.write_fastq(self.path('reads.fastq'), 50000)
+        self.assertEqual(fastq_nt_gt_len.count_gt_len(self.path('reads.fastq'), 0)[0], num_reads)
+
+        num_records = generators.write_fasta(self.path('reads.fasta'), 50000, distinct=100)
+        seq_hash = seq_mode.hash_file(self.path('reads.fasta'))
+        self.assertEqual(sum(seq_hash.values()), num_records)
+        self.assertTrue(len(seq_hash) <= 100)
+
+    def test_coordinates_fall_in_annotated_genes(self):
+        lengths = generators.write_gtf(self.path('genes.gtf'), 50000)
+        num_lines = generators.write_coordinates(self.path('coordinates.txt'), 20000, lengths)
+        chromosomes = annot.cache_chromosomes(self.path('genes.gtf'), 'array')
+        results = list(annot.match_coords(self.path('coordinates.txt'), chromosomes))
+
+        self.assertEqual(len(results), num_lines)
+        self.assertTrue(any(not result.endswith(annot.NOT_FOUND_MESSAGE) for result in results))
@@ -166,3 +166,55 @@ class TestBinaryTree(unittest.TestCase):
         self.assertEqual(gene_node, None)
         gene_node = gt.find(0)
         self.assertEqual(gene_node, None)
+
+    def test_tree_find_all_returns_overlapping_genes(self):
+        genes = [
+            ['LONG', 10, 500],  # Spans genes in the right branch
+            ['AB', 20, 30],
+            ['CD', 40, 50],
+            ['EF', 45, 60],
+            ['GH', 70, 80],
+        ]
+
+        gt = GeneTree.init_from_sorted_genes(genes)
+
+        names = [gene_node.get_name() for gene_node in gt.find_all(47)]
+        self.assertEqual(names, ['LONG', 'CD', 'EF'])
+
+        # Long gene found from the opposite branch of the root
+        names = [gene_node.get_name() for gene_node in gt.find_all(75)]
+        self.assertEqual(names, ['LONG', 'GH'])
+
+        gene_node = gt.find(400)
+        self.assertEqual(gene_node.get_name(), 'LONG')
+
+        self.assertEqual(gt.find_all(501), [])
+        self.assertEqual(gt.find_all(9), [])
+
+    def test_tree_find_range_and_nearest_match_gene_index(self):
+        genes = [
+            ['LONG', 10, 500],
+            ['AB', 20, 30],
+            ['CD', 40, 50],
+            ['EF', 45, 60],
+            ['GH', 70, 80],
+            ['IJ', 600, 700],
+        ]
+
+        gt = GeneTree.init_from_sorted_genes(genes)
+
+        self.assertEqual(gt.find_range(45, 75), (('LONG', 31), ('CD', 6), ('EF', 16), ('GH', 6)))
+        self.assertEqual(gt.find_range(501, 599), ())
+        self.assertEqual(gt.find_nearest(47), (('LONG', 'CD', 'EF'), 0))
+        self.assertEqual(gt.find_nearest(550), (('LONG', 'IJ'), 50))
+        self.assertEqual(gt.find_nearest(505, 595), (('LONG', 'IJ'), 5))
+        self.assertEqual(gt.find_nearest(5), (('LONG',), 5))
+        self.assertEqual(gt.find_nearest(800), (('IJ',), 100))
+        self.assertEqual(GeneTree().find_nearest(5), ((), None))
+
+    def test_tree_tracks_max_stop_of_subtree(self):
+        gt = GeneTree.init_from_sorted_genes(sorted(self.genes, key=lambda gene: gene[1]))
+
+        self.assertEqual(gt.root.max_stop, 98)
+        self.assertEqual(gt.root.left.max_stop, 48)
+        self.assertEqual(gt.root.right.left.max_stop, 73)
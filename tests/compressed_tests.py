@@ -0,0 +1,67 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from commands import compressed
+
+class TestCompressed(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        with open('./tests/test_files/fastq_other/test_4.fastq', 'rb') as f:
+            # Enough data for several BGZF blocks
+            self.data = f.read() * 200
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read_all(self, filename, threads, size):
+        pieces = []
+        with compressed.open_binary(filename, threads) as f:
+            while True:
+                piece = f.read(size)
+                if not piece:
+                    return b''.join(pieces)
+                pieces.append(piece)
+
+    def test_open_binary_reads_plain_file(self):
+        filename = os.path.join(self.temp_dir, 'plain.fastq')
+        with open(filename, 'wb') as f:
+            f.write(self.data)
+
+        self.assertEqual(self.read_all(filename, 2, 1000), self.data)
+
+    def test_open_binary_reads_bgzf_in_parallel(self):
+        filename = os.path.join(self.temp_dir, 'blocked.fastq.gz')
+        compressed.write_bgzf(filename, self.data)
+
+        with compressed.open_binary(filename, 4) as f:
+            self.assertTrue(isinstance(f, compressed.BgzfReader))
+        for size in [7, 1000, 1 << 20]:
+            self.assertEqual(self.read_all(filename, 4, size), self.data)
+        # Readable by plain gzip too
+        with gzip.open(filename, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_open_binary_reads_multi_member_gzip(self):
+        filename = os.path.join(self.temp_dir, 'members.fastq.gz')
+        middle = len(self.data) // 2
+        with open(filename, 'wb') as f:
+            f.write(gzip.compress(self.data[:middle]))
+            f.write(gzip.compress(self.data[middle:]))
+
+        with compressed.open_binary(filename, 2) as f:
+            self.assertTrue(isinstance(f, compressed.ReadAheadReader))
+        self.assertEqual(self.read_all(filename, 2, 999), self.data)
+
+    def test_bgzf_block_with_bad_crc_raises(self):
+        filename = os.path.join(self.temp_dir, 'corrupt.fastq.gz')
+        compressed.write_bgzf(filename, self.data[:1000])
+        with open(filename, 'r+b') as f:
+            # CRC32 of the first (only data) block sits 8 bytes before the EOF block
+            f.seek(-len(compressed.BGZF_EOF) - 8, os.SEEK_END)
+            f.write(b'\0\0\0\0')
+
+        with self.assertRaises(IOError):
+            self.read_all(filename, 2, 100)
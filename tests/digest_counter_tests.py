@@ -0,0 +1,29 @@
+import unittest
+
+from commands import seq_keys
+from commands.structures.digest_counter import DigestCounter
+
+class TestDigestCounter(unittest.TestCase):
+    def test_counts_digests(self):
+        counter = DigestCounter()
+        for seq in ['ACGT', 'ACGN', 'ACGT']:
+            counter.add(seq_keys.digest(seq))
+
+        self.assertEqual(len(counter), 2)
+        self.assertEqual(counter.get(seq_keys.digest('ACGT')), 2)
+        self.assertEqual(counter.get(seq_keys.digest('ACGN')), 1)
+        self.assertEqual(counter.get(seq_keys.digest('TTTT')), None)
+
+    def test_grows_keeping_counts_and_first_seen_order(self):
+        counter = DigestCounter(size=4)
+        digests = [seq_keys.digest(str(i)) for i in range(1000)]
+        for digest in digests:
+            counter.add(digest)
+        for digest in digests[::2]:
+            counter.add(digest)
+
+        self.assertEqual(len(counter), 1000)
+        self.assertEqual(
+            list(counter.items()),
+            [(digest, 2 if i % 2 == 0 else 1) for i, digest in enumerate(digests)]
+        )
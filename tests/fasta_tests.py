@@ -0,0 +1,25 @@
+import unittest
+
+from commands import fasta
+
+class TestFasta(unittest.TestCase):
+    def test_read_records_joins_wrapped_lines(self):
+        lines = ['>one first\n', 'ACGT\n', 'AC\n', '>two\n', 'GG\n', '>empty\n']
+        self.assertEqual(
+            list(fasta.read_records(lines)),
+            [('one first', 'ACGTAC'), ('two', 'GG'), ('empty', '')]
+        )
+
+    def test_read_records_keeps_lines_before_first_header(self):
+        self.assertEqual(list(fasta.read_records(['AC\n', '>one\n', 'GT\n'])), [(None, 'AC'), ('one', 'GT')])
+        self.assertEqual(list(fasta.read_records([])), [])
+
+    def test_read_sequences_skips_empty_records(self):
+        lines = ['>one\n', '>two\n', 'AC\r\n', ' GT \n', '\n', '>three\n', 'A\n']
+        self.assertEqual(list(fasta.read_sequences(lines)), ['ACGT', 'A'])
+
+    def test_read_sequences_from_file(self):
+        with open('./tests/test_files/fasta/test_2.fasta', 'r') as f:
+            seqs = list(fasta.read_sequences(f))
+        self.assertEqual(len(set(seqs)), 1)
+        self.assertTrue(len(seqs[0]) > 0)
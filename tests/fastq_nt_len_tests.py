@@ -1,5 +1,11 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
+from commands import compressed
 from commands import fastq_nt_gt_len as fastq
 
 class TestFastqNtLen(unittest.TestCase):
@@ -34,3 +40,112 @@ class TestFastqNtLen(unittest.TestCase):
         # Sequences no sequences longer than absurd number
         result = fastq.get_perc_gt_len(self.fastq_files[0], 3000000)
         self.assertEqual(result, 0.0)
+
+    def test_scan_files_matches_get_perc_gt_len(self):
+        results = list(fastq.scan_files(self.fastq_files))
+
+        self.assertEqual([r[0] for r in results], self.fastq_files)
+        for filename, histogram, num_bytes in results:
+            self.assertEqual(histogram.perc_gt(30), fastq.get_perc_gt_len(filename, 30))
+            self.assertEqual(num_bytes, os.path.getsize(filename))
+        self.assertEqual(results[0][1].total(), 5)
+
+    def test_scan_files_in_parallel_keeps_input_order(self):
+        serial = list(fastq.scan_files(self.fastq_files))
+        parallel = list(fastq.scan_files(self.fastq_files, jobs=2))
+        self.assertEqual(parallel, serial)
+
+        completed = list(fastq.scan_files(self.fastq_files, jobs=2, order='completion'))
+        self.assertEqual(sorted(completed, key=lambda r: r[0]), sorted(serial, key=lambda r: r[0]))
+
+    def test_format_result_answers_many_lengths_from_one_scan(self):
+        histogram = fastq.get_histogram(self.fastq_files[0])
+
+        line = fastq.format_result('test_4.fastq', histogram, [30, 80], [50], summary=True)
+        self.assertEqual(line.split('\t'), ['test_4.fastq', '60.0', '20.0', '70', '5', '61.0', '70'])
+
+    def test_get_perc_gt_len_reads_compressed_files(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            with open(self.fastq_files[0], 'rb') as f:
+                data = f.read()
+            gzip_file = os.path.join(temp_dir, 'test_4.fastq.gz')
+            with gzip.open(gzip_file, 'wb') as f:
+                f.write(data)
+            bgzf_file = os.path.join(temp_dir, 'test_4_blocked.fastq.gz')
+            compressed.write_bgzf(bgzf_file, data)
+
+            self.assertEqual(sorted(fastq.get_files(temp_dir)), [gzip_file, bgzf_file])
+            for filename in [gzip_file, bgzf_file]:
+                self.assertEqual(fastq.get_perc_gt_len(filename, 30), 60.0)
+                self.assertEqual(fastq.get_perc_gt_len(filename, 80), 20.0)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_files_filters_by_globs_and_depth(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            paths = ['a.fastq', 'b.fq', 'c.fq.gz', 'd.txt', 'sub/e.fastq.gz', 'sub/Undetermined.fq',
+                     'sub/deeper/f.fq', 'Undetermined/g.fq']
+            for path in paths:
+                filename = os.path.join(temp_dir, path)
+                if not os.path.isdir(os.path.dirname(filename)):
+                    os.makedirs(os.path.dirname(filename))
+                open(filename, 'w').close()
+
+            def found(**kwargs):
+                return sorted(os.path.relpath(f, temp_dir) for f in fastq.get_files(temp_dir, **kwargs))
+
+            expected = sorted(path for path in paths if path != 'd.txt')
+            self.assertEqual(found(), expected)
+            self.assertEqual(found(threads=4), expected)
+            self.assertEqual(found(exclude=['Undetermined*']), ['a.fastq', 'b.fq', 'c.fq.gz', 'sub/deeper/f.fq', 'sub/e.fastq.gz'])
+            self.assertEqual(found(max_depth=0), ['a.fastq', 'b.fq', 'c.fq.gz'])
+            self.assertEqual(found(patterns=['*.txt'], max_depth=1, threads=2), ['d.txt'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_files_in_threads_finds_same_files(self):
+        self.assertEqual(sorted(fastq.get_files('./tests', threads=4)), sorted(fastq.get_files('./tests')))
+
+    def test_scan_files_qc_reports_read_stats(self):
+        results = list(fastq.scan_files(self.fastq_files[:2], qc=True))
+        for filename, read_stats, _ in results:
+            self.assertEqual(read_stats.histogram, fastq.get_histogram(filename))
+
+        line = fastq.format_qc('test_4.fastq', results[0][1]).split('\t')
+        self.assertEqual(line[:3], ['test_4.fastq', '5', '305'])
+        self.assertEqual(len(line[-1].split(',')), 151)
+        summary = json.loads(fastq.format_qc('test_4.fastq', results[0][1], 'json'))
+        self.assertEqual((summary['file'], summary['reads']), ('test_4.fastq', 5))
+
+    def test_pair_files_matches_mates_by_name(self):
+        filenames = [
+            'run/S1_L001_R2_001.fastq.gz', 'run/S1_L001_R1_001.fastq.gz',
+            'srr/SRR01_1.fastq', 'srr/SRR01_2.fastq',
+            'read1/Sample.fastq', 'read2/Sample.fastq',
+            'other/Single.fastq', 'other/Lone_R1.fastq',
+        ]
+        unpaired = []
+        pairs = list(fastq.pair_files(filenames, unpaired))
+        self.assertEqual(pairs, [
+            ('run/S1_L001_R1_001.fastq.gz', 'run/S1_L001_R2_001.fastq.gz'),
+            ('srr/SRR01_1.fastq', 'srr/SRR01_2.fastq'),
+            ('read1/Sample.fastq', 'read2/Sample.fastq'),
+        ])
+        self.assertEqual(sorted(unpaired), ['other/Lone_R1.fastq', 'other/Single.fastq'])
+
+    def test_scan_pairs_reports_pair_level_lengths(self):
+        pairs = list(fastq.pair_files(fastq.get_files('./sample_files')))
+        self.assertEqual(len(pairs), 1)
+
+        (names, pair_stats, num_bytes), = list(fastq.scan_pairs(pairs))
+        self.assertEqual(names, pairs[0])
+        self.assertEqual(pair_stats.first, fastq.get_histogram(pairs[0][0]))
+        self.assertEqual(pair_stats.second, fastq.get_histogram(pairs[0][1]))
+        self.assertTrue(pair_stats.perc_both_gt(30) <= min(fastq.get_perc_gt_len(name, 30) for name in names))
+        self.assertEqual(num_bytes, sum(os.path.getsize(name) for name in names))
+
+        # Files that are not mates are reported, not raised
+        (_, error, _), = list(fastq.scan_pairs([(self.fastq_files[1], self.fastq_files[2])]))
+        self.assertTrue(isinstance(error, ValueError))
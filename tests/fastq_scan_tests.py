@@ -0,0 +1,125 @@
+import io
+import tracemalloc
+import unittest
+
+from commands import fastq_scan
+
+# Engines that can run here, numpy only when installed
+ENGINES = [engine for engine in fastq_scan.ENGINES if engine != 'numpy' or fastq_scan.numpy is not None]
+
+class TestFastqScan(unittest.TestCase):
+    def setUp(self):
+        self.seq_lens = [151, 6, 70, 0, 8, 33]
+        self.data = b''.join(
+            '@read_{0}\n{1}\n+\n{2}\n'.format(i, 'A' * n, 'F' * n).encode('ascii')
+            for i, n in enumerate(self.seq_lens)
+        )
+
+    def seq_lens_read(self, data, chunk_size):
+        f = io.BytesIO(data)
+        return [len(seq) for seq_lines in fastq_scan.iter_seq_lines(f, chunk_size) for seq in seq_lines]
+
+    def test_iter_seq_lines_handles_records_across_chunks(self):
+        for chunk_size in [1, 2, 3, 7, 50, fastq_scan.CHUNK_SIZE]:
+            self.assertEqual(self.seq_lens_read(self.data, chunk_size), self.seq_lens)
+
+    def test_iter_seq_lines_handles_missing_final_newline(self):
+        for chunk_size in [1, 5, fastq_scan.CHUNK_SIZE]:
+            self.assertEqual(self.seq_lens_read(self.data[:-1], chunk_size), self.seq_lens)
+
+    def test_iter_seq_lines_strips_carriage_returns(self):
+        data = self.data.replace(b'\n', b'\r\n')
+        for chunk_size in [1, 4, fastq_scan.CHUNK_SIZE]:
+            self.assertEqual(self.seq_lens_read(data, chunk_size), self.seq_lens)
+
+    def test_count_gt_len_excludes_line_ending(self):
+        # Sequences of exactly `nt_len` are not greater than it
+        self.assertEqual(fastq_scan.count_gt_len(io.BytesIO(self.data), 70), (6, 1))
+        self.assertEqual(fastq_scan.count_gt_len(io.BytesIO(self.data), 69), (6, 2))
+        self.assertEqual(fastq_scan.count_gt_len(io.BytesIO(b''), 30), (0, 0))
+
+    def test_length_histogram_engines_agree(self):
+        for engine in ENGINES:
+            for chunk_size in [1, 2, 7, 50, None]:
+                for data in [self.data, self.data[:-1], self.data.replace(b'\n', b'\r\n')]:
+                    histogram = fastq_scan.length_histogram(io.BytesIO(data), chunk_size, engine)
+                    self.assertEqual(histogram.total(), 6)
+                    self.assertEqual(histogram.counts[151], 1)
+                    self.assertEqual(histogram.total_bases(), sum(self.seq_lens))
+            self.assertEqual(fastq_scan.count_gt_len(io.BytesIO(b''), 30, engine=engine), (0, 0))
+
+    def test_length_histogram_rejects_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            fastq_scan.length_histogram(io.BytesIO(self.data), engine='fortran')
+
+    def test_read_stats_counts_bases_and_qualities_by_position(self):
+        data = b'@r1\nACGTN\n+\n!!+5I\n@r2\nGGC\n+\nIII\n@r3\n\n+\n\n@r4\nnacg\n+\n####\n'
+        for engine, chunk_size in [(engine, size) for engine in ENGINES for size in [1, 3, 7, None]]:
+            for records in [data, data[:-1], data.replace(b'\n', b'\r\n')]:
+                stats = fastq_scan.read_stats(io.BytesIO(records), chunk_size, engine)
+                self.assertEqual(stats.total(), 4)
+                self.assertEqual(stats.histogram.counts, [1, 0, 0, 1, 1, 1])
+                self.assertEqual((stats.gc_bases, stats.n_bases), (7, 2))
+                self.assertEqual(stats.quality_sums, [33 + 73 + 35, 33 + 73 + 35, 43 + 73 + 35, 53 + 35, 73])
+
+    @unittest.skipIf(fastq_scan.numpy is None, 'NumPy not installed')
+    def test_numpy_read_stats_match_python(self):
+        records = b''.join(
+            '@read_{0}\n{1}\n+\n{2}\n'.format(
+                i, ''.join('ACGTNacgtn'[(i * 3 + j) % 10] for j in range(i % 60)),
+                ''.join(chr(33 + (i * 7 + j) % 42) for j in range(i % 60))
+            ).encode('ascii')
+            for i in range(500)
+        )
+        expected = fastq_scan.read_stats(io.BytesIO(records), engine='python')
+        for chunk_size in [5, 100, 4096, None]:
+            self.assertEqual(fastq_scan.read_stats(io.BytesIO(records), chunk_size, 'numpy'), expected)
+
+    def test_read_stats_of_long_reads_needs_memory_linear_in_length(self):
+        # Reads of 10 kb, some shorter, as of nanopore runs
+        records = b''.join(
+            b'@read_' + str(i).encode('ascii') + b'\n' + b'ACGT' * (2500 - i) + b'\n+\n' + b'I' * (10000 - 4 * i) + b'\n'
+            for i in range(20)
+        )
+        for engine in ENGINES:
+            tracemalloc.start()
+            try:
+                stats = fastq_scan.read_stats(io.BytesIO(records), engine=engine)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            self.assertEqual((stats.total(), stats.gc_bases), (20, sum(2 * (2500 - i) for i in range(20))))
+            self.assertLess(peak, 20 * len(records), engine)
+
+    def test_quality_sums_adds_rows_of_any_length(self):
+        lines = [bytes(bytearray((33 + (i * 7 + j) % 94) for j in range(i % 40))) for i in range(fastq_scan.QUALITY_ROWS)]
+        expected = [sum(line[position] for line in lines if len(line) > position) for position in range(39)]
+        self.assertEqual(list(fastq_scan.quality_sums(lines)), expected)
+        self.assertEqual(list(fastq_scan.quality_sums([b'I' * 10] * 3)), [73 * 3] * 10)
+        # Largest sums, still exact modulo 65521
+        self.assertEqual(fastq_scan.quality_sums([b'\x7f' * 3] * fastq_scan.QUALITY_ROWS), [127 * fastq_scan.QUALITY_ROWS] * 3)
+
+    def test_pair_stats_reads_mates_in_lockstep(self):
+        lens2 = [100, 50, 70, 20, 0, 40]
+        data2 = b''.join(
+            '@read_{0}/2\n{1}\n+\n{2}\n'.format(i, 'C' * n, 'F' * n).encode('ascii')
+            for i, n in enumerate(lens2)
+        )
+        for chunk_size in [1, 5, 64, fastq_scan.CHUNK_SIZE]:
+            stats = fastq_scan.pair_stats(io.BytesIO(self.data), io.BytesIO(data2), chunk_size)
+            self.assertEqual(stats.total(), 6)
+            self.assertEqual(stats.first.total(), 6)
+            self.assertEqual(stats.shorter.counts[:9], [2, 0, 0, 0, 0, 0, 1, 0, 0])
+            # Both mates longer than 30: read_0 (151, 100), read_2 (70, 70), read_5 (33, 40)
+            self.assertEqual(stats.perc_both_gt(30), 50.0)
+            self.assertEqual(stats.perc_either_gt(30), 4 / 6.0 * 100)
+
+    def test_pair_stats_rejects_reads_that_are_not_mates(self):
+        renamed = self.data.replace(b'@read_3', b'@other_3')
+        with self.assertRaises(fastq_scan.PairingError):
+            fastq_scan.pair_stats(io.BytesIO(self.data), io.BytesIO(renamed), 7)
+
+        shorter = self.data[:self.data.index(b'@read_5')]
+        for f1, f2 in [(self.data, shorter), (shorter, self.data)]:
+            with self.assertRaises(fastq_scan.PairingError):
+                fastq_scan.pair_stats(io.BytesIO(f1), io.BytesIO(f2), 7)
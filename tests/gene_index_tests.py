@@ -0,0 +1,88 @@
+import unittest
+
+from commands.structures.gene_index import GeneIndex
+
+class TestGeneIndex(unittest.TestCase):
+    def setUp(self):
+        # GENE_NAME, start_pos, stop_pos; sorted by start
+        self.genes = [
+            ['LONG', 10, 500],
+            ['AB', 20, 30],
+            ['CD', 40, 50],
+            ['EF', 45, 60],
+            ['GH', 70, 80],
+            ['IJ', 600, 700],
+        ]
+
+    def test_index_holds_genes_in_arrays(self):
+        gi = GeneIndex.init_from_sorted_genes(self.genes)
+
+        self.assertEqual(gi.num_genes, len(self.genes))
+        self.assertEqual(list(gi.starts), [10, 20, 40, 45, 70, 600])
+        self.assertEqual(list(gi.stops), [500, 30, 50, 60, 80, 700])
+        self.assertEqual([gi.names[name_id] for name_id in gi.name_ids], [gene[0] for gene in self.genes])
+
+    def test_find_names_returns_all_overlapping_genes(self):
+        gi = GeneIndex.init_from_sorted_genes(self.genes)
+
+        self.assertEqual(gi.find_names(47), ('LONG', 'CD', 'EF'))
+        self.assertEqual(gi.find_names(75), ('LONG', 'GH'))
+        self.assertEqual(gi.find_names(400), ('LONG',))
+
+    def test_find_names_includes_start_and_stop(self):
+        gi = GeneIndex.init_from_sorted_genes(self.genes)
+
+        self.assertEqual(gi.find_names(600), ('IJ',))
+        self.assertEqual(gi.find_names(700), ('IJ',))
+        self.assertEqual(gi.find_names(500), ('LONG',))
+
+    def test_find_names_outside_genes_is_empty(self):
+        gi = GeneIndex.init_from_sorted_genes(self.genes)
+
+        self.assertEqual(gi.find_names(9), ())
+        self.assertEqual(gi.find_names(501), ())
+        self.assertEqual(gi.find_names(701), ())
+        self.assertEqual(gi.find_names(-5), ())
+
+    def test_find_batch_matches_single_lookups(self):
+        gi = GeneIndex.init_from_sorted_genes(self.genes)
+
+        coordinates = list(range(0, 750, 3))
+        self.assertEqual(gi.find_batch(coordinates), [gi.find_names(c) for c in coordinates])
+
+    def test_empty_index_finds_nothing(self):
+        gi = GeneIndex.init_from_sorted_genes([])
+
+        self.assertEqual(gi.num_genes, 0)
+        self.assertEqual(gi.find_batch([1, 2, 3]), [(), (), ()])
+
+    def test_sweep_matches_single_lookups(self):
+        gi = GeneIndex.init_from_sorted_genes(self.genes)
+
+        coordinates = list(range(0, 750, 3))
+        self.assertEqual(list(gi.sweep(coordinates)), [(c, gi.find_names(c)) for c in coordinates])
+
+    def test_sweep_handles_unsorted_coordinates(self):
+        gi = GeneIndex.init_from_sorted_genes(self.genes)
+
+        coordinates = [650, 47, 9, 75, 600, 25, 501]
+        self.assertEqual(list(gi.sweep(coordinates)), [(c, gi.find_names(c)) for c in coordinates])
+
+    def test_find_range_returns_overlap_lengths(self):
+        gi = GeneIndex.init_from_sorted_genes(self.genes)
+
+        self.assertEqual(gi.find_range(45, 75), (('LONG', 31), ('CD', 6), ('EF', 16), ('GH', 6)))
+        self.assertEqual(gi.find_range(490, 610), (('LONG', 11), ('IJ', 11)))
+        self.assertEqual(gi.find_range(501, 599), ())
+        self.assertEqual(gi.find_range(47, 47), tuple((name, 1) for name in gi.find_names(47)))
+
+    def test_find_nearest_returns_closest_genes_and_distance(self):
+        gi = GeneIndex.init_from_sorted_genes(self.genes)
+
+        self.assertEqual(gi.find_nearest(47), (('LONG', 'CD', 'EF'), 0))
+        self.assertEqual(gi.find_nearest(520), (('LONG',), 20))
+        self.assertEqual(gi.find_nearest(550), (('LONG', 'IJ'), 50))
+        self.assertEqual(gi.find_nearest(505, 595), (('LONG', 'IJ'), 5))
+        self.assertEqual(gi.find_nearest(5), (('LONG',), 5))
+        self.assertEqual(gi.find_nearest(800), (('IJ',), 100))
+        self.assertEqual(GeneIndex.init_from_sorted_genes([]).find_nearest(5), ((), None))
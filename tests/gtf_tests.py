@@ -0,0 +1,60 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from commands import gtf
+
+class TestGtf(unittest.TestCase):
+    def setUp(self):
+        self.gtf_file = './tests/test_files/gtf/test_1.gtf'
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_gtf(self, lines):
+        filename = os.path.join(self.temp_dir, 'custom.gtf')
+        with open(filename, 'w') as f:
+            f.write(''.join(lines))
+        return filename
+
+    def test_parse_gtf_yields_every_row(self):
+        records = list(gtf.parse_gtf(self.gtf_file))
+        self.assertEqual(len(records), 4)
+        self.assertEqual(records[0], ('chr3', 134196546, 134197558, 'ANAPC13'))
+
+    def test_parse_gtf_filters_features(self):
+        records = list(gtf.parse_gtf(self.gtf_file, features={'intron'}))
+        self.assertEqual(records, [
+            ('chr3', 134197558, 134201648, 'ANAPC13'),
+            ('chr3', 134201774, 134204162, 'ANAPC13'),
+        ])
+
+    def test_parse_gtf_finds_gene_name_by_key(self):
+        filename = self.write_gtf([
+            '#!genome-build GRCh38\n',
+            'chr1\tHAVANA\tgene\t11869\t14409\t.\t+\t.\tgene_id "ENSG00000223972"; gene_type "lncRNA"; gene_name "DDX11L1";\n',
+            'chr1\tHAVANA\tgene\t14404\t29570\t.\t-\t.\tgene_name "WASH7P"; gene_id "ENSG00000227232";\n',
+            'chr1\tHAVANA\tgene\t29554\t31109\t.\t+\t.\tgene_id "ENSG00000243485"; havana_gene "OTTHUMG00000000959";\n',
+            '\n',
+        ])
+
+        records = list(gtf.parse_gtf(filename))
+        self.assertEqual([record[3] for record in records], ['DDX11L1', 'WASH7P', 'ENSG00000243485'])
+
+    def test_parse_gtf_reads_gzip(self):
+        filename = os.path.join(self.temp_dir, 'test_1.gtf.gz')
+        with open(self.gtf_file, 'rb') as f_in, gzip.open(filename, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+
+        self.assertEqual(list(gtf.parse_gtf(filename)), list(gtf.parse_gtf(self.gtf_file)))
+
+    def test_parse_gtf_counts_stats(self):
+        stats = gtf.ParseStats()
+        list(gtf.parse_gtf(self.gtf_file, features={'exon'}, stats=stats))
+
+        self.assertEqual(stats.lines, 4)
+        self.assertEqual(stats.records, 2)
+        self.assertTrue(stats.seconds >= 0)
@@ -0,0 +1,87 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from commands import get_annotations as annot
+from commands.structures import index_file
+
+class TestIndexFile(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        # Copied so modification times can be altered freely
+        self.gtf_file = os.path.join(self.temp_dir, 'test_3.gtf')
+        shutil.copy('./tests/test_files/gtf/test_3.gtf', self.gtf_file)
+        self.index_file = os.path.join(self.temp_dir, 'test_3.gidx')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_load_index_matches_built_index(self):
+        chromosomes = annot.cache_chromosomes(self.gtf_file, 'array')
+        index_file.save_index(self.index_file, chromosomes, self.gtf_file)
+        loaded = index_file.load_index(self.index_file, self.gtf_file, verify_checksum=True)
+
+        self.assertEqual(sorted(loaded), sorted(chromosomes))
+        for chromosome, gene_index in chromosomes.items():
+            self.assertEqual(loaded[chromosome].names, gene_index.names)
+            self.assertEqual(list(loaded[chromosome].starts), list(gene_index.starts))
+            self.assertEqual(list(loaded[chromosome].stops), list(gene_index.stops))
+
+            coordinates = list(range(gene_index.starts[0] - 10, gene_index.stops[-1] + 10, 97))
+            self.assertEqual(loaded[chromosome].find_batch(coordinates), gene_index.find_batch(coordinates))
+            for coordinate in coordinates:
+                self.assertEqual(loaded[chromosome].find_range(coordinate, coordinate + 500),
+                                 gene_index.find_range(coordinate, coordinate + 500))
+                self.assertEqual(loaded[chromosome].find_nearest(coordinate), gene_index.find_nearest(coordinate))
+
+    def test_load_index_rejects_modified_gtf(self):
+        chromosomes = annot.cache_chromosomes(self.gtf_file, 'array')
+        index_file.save_index(self.index_file, chromosomes, self.gtf_file)
+
+        stat = os.stat(self.gtf_file)
+        os.utime(self.gtf_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        with self.assertRaises(index_file.IndexFileError):
+            index_file.load_index(self.index_file, self.gtf_file)
+
+    def test_load_index_rejects_other_version(self):
+        chromosomes = annot.cache_chromosomes(self.gtf_file, 'array')
+        index_file.save_index(self.index_file, chromosomes, self.gtf_file)
+
+        with open(self.index_file, 'r+b') as f:
+            f.seek(len(index_file.MAGIC))
+            f.write(struct.pack('<I', index_file.VERSION + 1))
+
+        with self.assertRaises(index_file.IndexFileError):
+            index_file.load_index(self.index_file, self.gtf_file)
+
+    def test_cache_index_file_builds_missing_index(self):
+        self.assertFalse(os.path.exists(self.index_file))
+
+        chromosomes = annot.cache_index_file(self.gtf_file, self.index_file)
+
+        self.assertTrue(os.path.exists(self.index_file))
+        self.assertEqual(annot.find_overlap('chr3', 134200000, chromosomes), 'ANAPC13')
+
+    def test_match_coords_parallel_verifies_index_checksum(self):
+        chromosomes = annot.cache_chromosomes(self.gtf_file, 'array')
+        index_file.save_index(self.index_file, chromosomes, self.gtf_file)
+        coord_file = os.path.join(self.temp_dir, 'coordinates.txt')
+        with open(coord_file, 'w') as f:
+            f.write('chr3\t134200000\n')
+
+        # Same size and modification time, only a checksum tells them apart
+        stat = os.stat(self.gtf_file)
+        with open(self.gtf_file) as f:
+            data = f.read()
+        with open(self.gtf_file, 'w') as f:
+            f.write(data.replace('ANAPC13', 'ANAPC99'))
+        os.utime(self.gtf_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        stale = ''.join(annot.match_coords_parallel(coord_file, self.gtf_file, 2, self.index_file))
+        self.assertEqual(stale, 'chr3\t134200000\tANAPC13\n')
+        verified = ''.join(annot.match_coords_parallel(coord_file, self.gtf_file, 2, self.index_file,
+                                                       verify_checksum=True))
+        self.assertEqual(verified, 'chr3\t134200000\tANAPC99\n')
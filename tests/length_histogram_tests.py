@@ -0,0 +1,54 @@
+import unittest
+
+from commands.structures.length_histogram import LengthHistogram
+
+class TestLengthHistogram(unittest.TestCase):
+    def setUp(self):
+        # Read lengths 151, 6, 70, 70, 8
+        self.histogram = LengthHistogram()
+        self.histogram.add_counts({151: 1, 6: 1, 70: 2})
+        self.histogram.add_counts({8: 1})
+
+    def test_counts_indexed_by_length(self):
+        self.assertEqual(len(self.histogram.counts), 152)
+        self.assertEqual(self.histogram.counts[70], 2)
+        self.assertEqual(self.histogram.total(), 5)
+        self.assertEqual(self.histogram.total_bases(), 305)
+
+    def test_answers_many_thresholds(self):
+        self.assertEqual(self.histogram.perc_gt(30), 60.0)
+        self.assertEqual(self.histogram.perc_gt(80), 20.0)
+        self.assertEqual(self.histogram.perc_gt(70), 20.0)
+        self.assertEqual(self.histogram.perc_gt(69), 60.0)
+        self.assertEqual(self.histogram.perc_gt(0), 100.0)
+        self.assertEqual(self.histogram.perc_gt(151), 0.0)
+
+    def test_summary_statistics(self):
+        self.assertEqual(self.histogram.mean(), 61.0)
+        self.assertEqual(self.histogram.percentile(50), 70)
+        self.assertEqual(self.histogram.percentile(20), 6)
+        self.assertEqual(self.histogram.percentile(100), 151)
+        # 151 holds 151 of 305 bases, 151 + 70 reach half
+        self.assertEqual(self.histogram.n50(), 70)
+
+    def test_empty_histogram(self):
+        histogram = LengthHistogram()
+        self.assertEqual(histogram.perc_gt(30), 0.0)
+        self.assertEqual(histogram.mean(), 0.0)
+        self.assertEqual(histogram.n50(), 0)
+        self.assertEqual(histogram.percentile(50), 0)
+
+    def test_serialization_round_trip(self):
+        loaded = LengthHistogram.loads(self.histogram.dumps())
+        self.assertEqual(loaded, self.histogram)
+        self.assertEqual(loaded.perc_gt(30), 60.0)
+
+        with self.assertRaises(ValueError):
+            LengthHistogram.from_dict({'version': 0, 'counts': {}})
+
+    def test_merge(self):
+        other = LengthHistogram()
+        other.add_counts({200: 3})
+        other.merge(self.histogram)
+        self.assertEqual(other.total(), 8)
+        self.assertEqual(other.count_gt(150), 4)
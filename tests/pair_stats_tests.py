@@ -0,0 +1,23 @@
+import unittest
+
+from commands.structures.pair_stats import PairStats
+
+class TestPairStats(unittest.TestCase):
+    def setUp(self):
+        # Mate lengths (40, 20), (10, 50), (60, 60)
+        self.stats = PairStats()
+        self.stats.first.add_counts({40: 1, 10: 1, 60: 1})
+        self.stats.second.add_counts({20: 1, 50: 1, 60: 1})
+        self.stats.shorter.add_counts({20: 1, 10: 1, 60: 1})
+        self.stats.longer.add_counts({40: 1, 50: 1, 60: 1})
+
+    def test_answers_both_and_either_mate_longer(self):
+        self.assertEqual(self.stats.total(), 3)
+        self.assertEqual(self.stats.perc_both_gt(15), 2 / 3.0 * 100)
+        self.assertEqual(self.stats.perc_both_gt(30), 1 / 3.0 * 100)
+        self.assertEqual(self.stats.perc_either_gt(30), 100.0)
+        self.assertEqual(self.stats.perc_either_gt(55), 1 / 3.0 * 100)
+        self.assertEqual(PairStats().perc_both_gt(30), 0.0)
+
+    def test_from_length_pairs_builds_all_histograms(self):
+        self.assertEqual(PairStats.from_length_pairs({(40, 20): 1, (10, 50): 1, (60, 60): 1}), self.stats)
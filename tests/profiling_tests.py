@@ -0,0 +1,62 @@
+import json
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+from commands import profiling, seq_mode
+
+class TestRunStats(unittest.TestCase):
+    def test_phases_count_time_records_and_bytes(self):
+        run_stats = profiling.RunStats('test')
+        with run_stats.phase('work') as phase:
+            time.sleep(0.01)
+            phase.records = 10
+            phase.bytes = 2000000
+        run_stats.add('work', 0.5, records=5)
+
+        data = run_stats.to_dict()['phases'][0]
+        self.assertEqual((data['name'], data['records'], data['bytes']), ('work', 15, 2000000))
+        self.assertTrue(data['seconds'] >= 0.51)
+        self.assertAlmostEqual(data['records_per_sec'], 15 / data['seconds'])
+
+    def test_timed_counts_items_not_consumer_time(self):
+        run_stats = profiling.RunStats('test')
+        for item in run_stats.timed(range(5), 'produce'):
+            time.sleep(0.01)
+
+        phase = run_stats.get_phase('produce')
+        self.assertEqual(phase.records, 5)
+        self.assertTrue(phase.seconds < 0.01)
+
+    def test_child_process_memory_reported_only_with_child_processes(self):
+        self.assertIsNone(profiling.RunStats('test').to_dict()['peak_children_rss_mb'])
+        self.assertNotIn('child process', str(profiling.RunStats('test')))
+        if profiling.resource is not None:
+            self.assertIsNotNone(profiling.RunStats('test', child_processes=True).to_dict()['peak_children_rss_mb'])
+            self.assertIn('child process', str(profiling.RunStats('test', child_processes=True)))
+
+    def test_finish_writes_json_and_profile(self):
+        fd, json_filename = tempfile.mkstemp()
+        os.close(fd)
+        fd, profile_filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            run_stats = profiling.RunStats('seq_mode', profile_filename)
+            seq_mode.hash_file('./sample_files/fasta/sample.fasta', run_stats=run_stats)
+            run_stats.finish(json_filename=json_filename)
+
+            with open(json_filename) as f:
+                data = json.load(f)
+            self.assertEqual([phase['name'] for phase in data['phases']], ['read', 'count'])
+            self.assertEqual(data['phases'][0]['bytes'], os.path.getsize('./sample_files/fasta/sample.fasta'))
+            self.assertEqual(data['phases'][0]['records'], 1184)
+            if profiling.resource is not None:
+                self.assertTrue(data['peak_rss_mb'] > 0)
+
+            functions = [function for _, _, function in pstats.Stats(profile_filename).stats]
+            self.assertIn('count_sequences', functions)
+        finally:
+            os.remove(json_filename)
+            os.remove(profile_filename)
@@ -0,0 +1,34 @@
+import unittest
+
+from commands.structures.length_histogram import LengthHistogram
+from commands.structures.read_stats import ReadStats
+
+class TestReadStats(unittest.TestCase):
+    def setUp(self):
+        # Reads 'ACGTN' qualities '!!+5I' and 'GGC' qualities 'III'
+        self.stats = ReadStats(LengthHistogram([0, 0, 0, 1, 0, 1]), gc_bases=4, n_bases=1,
+                               quality_sums=[33 + 73, 33 + 73, 43 + 73, 53, 73])
+
+    def test_rates_of_all_bases(self):
+        self.assertEqual(self.stats.total(), 2)
+        self.assertEqual(self.stats.gc_content(), 50.0)
+        self.assertEqual(self.stats.n_rate(), 12.5)
+        self.assertEqual(ReadStats().gc_content(), 0.0)
+
+    def test_mean_qualities_by_reads_reaching_each_position(self):
+        self.assertEqual(self.stats.coverage(), [2, 2, 2, 1, 1])
+        self.assertEqual(self.stats.mean_qualities(), [20.0, 20.0, 25.0, 20.0, 40.0])
+        self.assertEqual(ReadStats().mean_qualities(), [])
+
+    def test_merge_adds_reads(self):
+        merged = ReadStats()
+        merged.merge(self.stats)
+        merged.merge(ReadStats(LengthHistogram([0, 1]), gc_bases=1, quality_sums=[40]))
+        self.assertEqual(merged.total(), 3)
+        self.assertEqual(merged.gc_bases, 5)
+        self.assertEqual(merged.quality_sums, [33 + 73 + 40, 33 + 73, 43 + 73, 53, 73])
+
+    def test_serializes_to_dict(self):
+        self.assertEqual(ReadStats.from_dict(self.stats.to_dict()), self.stats)
+        with self.assertRaises(ValueError):
+            ReadStats.from_dict({'version': 0})
@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from commands import fastq_nt_gt_len as fastq
+from commands.scan_cache import ScanCache, file_key
+
+class TestScanCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.fastq_files = []
+        for filename in ['./tests/test_files/fastq_other/test_4.fastq', './tests/test_files/fastq/test_1.fastq']:
+            copy = os.path.join(self.temp_dir, os.path.basename(filename))
+            shutil.copy(filename, copy)
+            self.fastq_files.append(copy)
+        self.cache_file = os.path.join(self.temp_dir, 'scan_cache.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_rerun_scans_only_changed_files(self):
+        cache = ScanCache(self.cache_file)
+        first = list(fastq.scan_files(self.fastq_files, cache=cache))
+        cache.save()
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+        cache = ScanCache(self.cache_file)
+        self.assertEqual(list(fastq.scan_files(self.fastq_files, cache=cache)), first)
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
+
+        with open(self.fastq_files[1], 'a') as f:
+            f.write('@extra\nACGT\n+\nIIII\n')
+        cache = ScanCache(self.cache_file)
+        results = list(fastq.scan_files(self.fastq_files, jobs=2, cache=cache))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(results[1][1].total(), first[1][1].total() + 1)
+
+    def test_save_evicts_deleted_files(self):
+        cache = ScanCache(self.cache_file)
+        list(fastq.scan_files(self.fastq_files, cache=cache))
+        cache.save()
+
+        os.remove(self.fastq_files[0])
+        cache = ScanCache(self.cache_file)
+        cache.save()
+        self.assertEqual(list(ScanCache(self.cache_file).entries), [os.path.abspath(self.fastq_files[1])])
+
+    def test_checksum_catches_contents_changed_in_place(self):
+        cache = ScanCache(self.cache_file, checksum=True)
+        list(fastq.scan_files(self.fastq_files, cache=cache))
+        cache.save()
+
+        # Same size and modification time, other contents
+        stat = os.stat(self.fastq_files[0])
+        with open(self.fastq_files[0], 'r+') as f:
+            f.write('X')
+        os.utime(self.fastq_files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(file_key(self.fastq_files[0])[:3], [stat.st_size, stat.st_mtime_ns, stat.st_ino])
+
+        cache = ScanCache(self.cache_file, checksum=True)
+        list(fastq.scan_files(self.fastq_files, cache=cache))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_unreadable_cache_starts_over(self):
+        with open(self.cache_file, 'w') as f:
+            f.write('not json')
+
+        cache = ScanCache(self.cache_file)
+        self.assertEqual(cache.entries, {})
+        list(fastq.scan_files(self.fastq_files, cache=cache))
+        cache.save()
+        self.assertEqual(len(ScanCache(self.cache_file).entries), 2)
+
+    def test_qc_results_cached_apart_from_histograms(self):
+        cache = ScanCache(self.cache_file)
+        list(fastq.scan_files(self.fastq_files, cache=cache))
+        cache.save()
+
+        # Histograms alone cannot answer QC statistics
+        cache = ScanCache(self.cache_file)
+        first = list(fastq.scan_files(self.fastq_files, cache=cache, qc=True))
+        cache.save()
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+        cache = ScanCache(self.cache_file)
+        self.assertEqual(list(fastq.scan_files(self.fastq_files, cache=cache, qc=True)), first)
+        self.assertEqual(list(fastq.scan_files(self.fastq_files, cache=cache)),
+                         [(filename, stats.histogram, size) for filename, stats, size in first])
+        self.assertEqual((cache.hits, cache.misses), (4, 0))
+
+    def test_workers_checksum_files_and_skip_unchanged_ones(self):
+        cache = ScanCache(self.cache_file, checksum=True)
+        first = list(fastq.scan_files(self.fastq_files, jobs=2, cache=cache))
+        cache.save()
+
+        # The worker takes the file's key itself, not scanning a cached file
+        key = file_key(self.fastq_files[0], True)
+        job = (self.fastq_files[0], 1, False, 'python', True, key)
+        self.assertEqual(fastq._scan_file(job), (self.fastq_files[0], None, os.path.getsize(self.fastq_files[0]), key))
+
+        stat = os.stat(self.fastq_files[0])
+        with open(self.fastq_files[0], 'r+') as f:
+            f.write('X')
+        os.utime(self.fastq_files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        cache = ScanCache(self.cache_file, checksum=True)
+        results = list(fastq.scan_files(self.fastq_files, jobs=2, cache=cache))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(results[1], first[1])
@@ -0,0 +1,27 @@
+import unittest
+
+from commands import seq_keys
+
+class TestSeqKeys(unittest.TestCase):
+    def test_pack_round_trips(self):
+        for seq in ['', 'ACGT', 'AAAAC', 'A', 'TTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTTT']:
+            key = seq_keys.pack(seq)
+            self.assertTrue(isinstance(key, bytes))
+            self.assertEqual(seq_keys.unpack(key), seq)
+
+    def test_pack_keeps_leading_a(self):
+        self.assertNotEqual(seq_keys.pack('AC'), seq_keys.pack('C'))
+        self.assertNotEqual(seq_keys.pack('A'), seq_keys.pack(''))
+
+    def test_pack_keeps_ambiguous_sequences_as_str(self):
+        for seq in ['ACGN', 'acgt', 'RYKM']:
+            self.assertEqual(seq_keys.pack(seq), seq)
+            self.assertEqual(seq_keys.unpack(seq_keys.pack(seq)), seq)
+
+    def test_digest_size(self):
+        self.assertEqual(len(seq_keys.digest('ACGT')), seq_keys.DIGEST_SIZE)
+        self.assertNotEqual(seq_keys.digest('ACGT'), seq_keys.digest('ACGN'))
+
+    def test_digest_keeps_non_ascii_sequences_apart(self):
+        self.assertNotEqual(seq_keys.digest(u'AC\u00e9T'), seq_keys.digest(u'AC\u00e8T'))
+        self.assertNotEqual(seq_keys.digest(u'AC\u00e9T'), seq_keys.digest('AC?T'))
@@ -1,3 +1,9 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 
 from commands import seq_mode
@@ -41,6 +47,178 @@ class TestSequenceMode(unittest.TestCase):
         hashed_seqs = seq_mode.hash_file(self.fasta_files[1])
         self.assertEqual(hashed_seqs.get(hashed_seqs.keys()[0]), 2)
 
+    def test_get_top_sequences_matches_full_sort(self):
+        hashed_seqs = seq_mode.hash_file('./sample_files/fasta/sample.fasta')
+        expected = [
+            '\t'.join(map(str, [seq, hashed_seqs[seq]]))
+            for seq in sorted(hashed_seqs, key=hashed_seqs.get, reverse=True)[:25]
+        ]
+        self.assertEqual(list(seq_mode.get_top_sequences(hashed_seqs, 25)), expected)
+
+    def test_compact_keys_match_str_keys(self):
+        filename = './sample_files/fasta/sample.fasta'
+        expected = list(seq_mode.get_top_sequences(seq_mode.hash_file(filename), 50))
+
+        packed = seq_mode.get_top_sequences(seq_mode.hash_file(filename, 'packed'), 50)
+        self.assertEqual(list(packed), expected)
+
+        digested = seq_mode.get_top_digested_sequences(filename, seq_mode.hash_file(filename, 'digest'), 50)
+        self.assertEqual(list(digested), expected)
+
+        # Digest counts carry the file their sequences are read back from
+        self.assertEqual(list(seq_mode.get_top_sequences(seq_mode.hash_file(filename, 'digest'), 50)), expected)
+        parallel = seq_mode.hash_file_parallel(filename, 2, 'digest')
+        self.assertEqual(list(seq_mode.get_top_sequences(parallel, 50)), expected)
+        with self.assertRaises(ValueError):
+            seq_mode.top_sequences(seq_mode.count_sequences(['ACGT'], 'digest'), 1)
+
+    def test_hash_file_parallel_matches_serial(self):
+        for filename in self.fasta_files + ['./sample_files/fasta/sample.fasta']:
+            expected = seq_mode.hash_file(filename)
+            for workers in (2, 3):
+                seq_hash = seq_mode.hash_file_parallel(filename, workers)
+                self.assertEqual(list(seq_hash.items()), list(expected.items()))
+
+    def test_split_records_begins_ranges_at_headers(self):
+        filename = './sample_files/fasta/sample.fasta'
+        ranges = seq_mode.split_records(filename, 4)
+        self.assertEqual(len(ranges), 4)
+        with open(filename, 'rb') as f:
+            for start, stop in ranges[1:]:
+                f.seek(start)
+                self.assertEqual(f.read(1), b'>')
+
+    def test_external_counting_matches_in_memory(self):
+        filename = './sample_files/fasta/sample.fasta'
+        expected = list(seq_mode.get_top_sequences(seq_mode.hash_file(filename), 50))
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            # Small enough a cap to spread the file over many buckets
+            results = seq_mode.get_top_external_sequences(filename, 50, 4096, temp_dir)
+            self.assertEqual(list(results), expected)
+            self.assertEqual(os.listdir(temp_dir), [])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_external_counting_repartitions_large_buckets(self):
+        filename = './sample_files/fasta/sample.fasta'
+        expected = list(seq_mode.get_top_sequences(seq_mode.hash_file(filename), 50))
+        max_memory = 4096
+        count_bucket = seq_mode.count_bucket
+        # Bytes of the distinct sequences of each bucket counted
+        counted_sizes = []
+
+        def checked_count_bucket(bucket_filename, num_seqs):
+            # Counting takes memory for each distinct sequence, not each copy
+            distinct = set(seq for _, seq in seq_mode.read_bucket(bucket_filename))
+            counted_sizes.append(sum(len(seq) + 1 for seq in distinct))
+            return count_bucket(bucket_filename, num_seqs)
+
+        temp_dir = tempfile.mkdtemp()
+        # Too few buckets for the cap, so each is partitioned again
+        seq_mode.MAX_BUCKETS, max_buckets = 4, seq_mode.MAX_BUCKETS
+        seq_mode.count_bucket = checked_count_bucket
+        try:
+            results = seq_mode.get_top_external_sequences(filename, 50, max_memory, temp_dir)
+            self.assertEqual(list(results), expected)
+            self.assertEqual(os.listdir(temp_dir), [])
+            self.assertTrue(counted_sizes)
+            self.assertTrue(all(size * seq_mode.BUCKET_EXPANSION <= max_memory for size in counted_sizes))
+        finally:
+            seq_mode.MAX_BUCKETS = max_buckets
+            seq_mode.count_bucket = count_bucket
+            shutil.rmtree(temp_dir)
+
+    def test_external_counting_splits_buckets_hashed_alike(self):
+        filename = './sample_files/fasta/sample.fasta'
+        expected = list(seq_mode.get_top_sequences(seq_mode.hash_file(filename), 50))
+        max_memory = 4096
+        partition_records, count_bucket = seq_mode.partition_records, seq_mode.count_bucket
+        counted_sizes = []
+
+        def colliding_partition_records(records, num_buckets, temp_dir, level=0):
+            if level != 1:
+                return partition_records(records, num_buckets, temp_dir, level)
+            # Every distinct sequence of a bucket hashed into the same sub-bucket
+            bucket_filenames = partition_records(records, 1, temp_dir, level)
+            for i in range(1, num_buckets):
+                empty = os.path.join(temp_dir, 'empty_{0}.txt'.format(i))
+                open(empty, 'w').close()
+                bucket_filenames.append(empty)
+            return bucket_filenames
+
+        def checked_count_bucket(bucket_filename, num_seqs):
+            distinct = set(seq for _, seq in seq_mode.read_bucket(bucket_filename))
+            counted_sizes.append(sum(len(seq) + 1 for seq in distinct))
+            return count_bucket(bucket_filename, num_seqs)
+
+        temp_dir = tempfile.mkdtemp()
+        seq_mode.MAX_BUCKETS, max_buckets = 4, seq_mode.MAX_BUCKETS
+        seq_mode.partition_records = colliding_partition_records
+        seq_mode.count_bucket = checked_count_bucket
+        try:
+            results = seq_mode.get_top_external_sequences(filename, 50, max_memory, temp_dir)
+            self.assertEqual(list(results), expected)
+            self.assertEqual(os.listdir(temp_dir), [])
+            self.assertTrue(all(size * seq_mode.BUCKET_EXPANSION <= max_memory for size in counted_sizes))
+        finally:
+            seq_mode.MAX_BUCKETS = max_buckets
+            seq_mode.partition_records = partition_records
+            seq_mode.count_bucket = count_bucket
+            shutil.rmtree(temp_dir)
+
+    def test_external_counting_of_one_repeated_sequence(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(temp_dir, 'repeated.fasta')
+            with open(filename, 'w') as f:
+                for i in range(1000):
+                    f.write('>seq_{0}\nACGTACGTAC\n'.format(i))
+            results = seq_mode.get_top_external_sequences(filename, 5, 1024, temp_dir)
+            self.assertEqual(list(results), ['ACGTACGTAC\t1000'])
+            self.assertEqual(os.listdir(temp_dir), ['repeated.fasta'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_external_counting_is_timed_as_count_phase(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            stats_filename = os.path.join(temp_dir, 'stats.json')
+            subprocess.check_call([
+                sys.executable, './commands/seq_mode.py', './sample_files/fasta/sample.fasta',
+                '--max-memory', '1', '--temp-dir', temp_dir, '--stats-json', stats_filename,
+            ], stdout=subprocess.DEVNULL)
+            with open(stats_filename) as f:
+                phases = dict((phase['name'], phase['seconds']) for phase in json.load(f)['phases'])
+            # Buckets are counted when results are taken, which must be within 'count'
+            self.assertGreater(phases['count'], 0)
+            self.assertGreater(phases['count'], phases['top'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_api_raises_on_missing_file_instead_of_exiting(self):
+        missing = './tests/test_files/fasta/missing.fasta'
+        seq_hash = seq_mode.hash_file(self.fasta_files[0], 'digest')
+        calls = [
+            lambda: seq_mode.hash_file(missing),
+            lambda: seq_mode.hash_file_parallel(missing, 2),
+            lambda: seq_mode.sketch_file(missing, 5),
+            lambda: seq_mode.top_digested_sequences(missing, seq_hash, 5),
+            lambda: list(seq_mode.get_top_external_sequences(missing, 5, 4096)),
+        ]
+        for call in calls:
+            with self.assertRaises((IOError, OSError)):
+                call()
+
+    def test_sketch_file_finds_top_sequence(self):
+        sketch = seq_mode.sketch_file(self.fasta_files[0], 5)
+        self.assertTrue(len(sketch.counts) <= 5)
+
+        exact = seq_mode.get_top_sequences(seq_mode.hash_file(self.fasta_files[0]), 1)
+        approximate = seq_mode.get_top_sketched_sequences(sketch, 1)
+        self.assertEqual(next(approximate).split()[0], next(exact).split()[0])
+
     def test_fails_on_incorrect_file(self):
-        with self.assertRaises(SystemExit):
+        with self.assertRaises((IOError, OSError)):
             hashed_seqs = seq_mode.hash_file('./tests/wrong_filename.fastb')
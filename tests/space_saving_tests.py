@@ -0,0 +1,40 @@
+import unittest
+
+from commands.structures.space_saving import SpaceSaving
+
+class TestSpaceSaving(unittest.TestCase):
+    def test_counts_exactly_within_capacity(self):
+        sketch = SpaceSaving(10)
+        for item in 'abracadabra':
+            sketch.add(item)
+
+        self.assertEqual(sketch.top(2), [('a', 5, 0), ('b', 2, 0)])
+        self.assertEqual(sketch.total, 11)
+
+    def test_holds_at_most_capacity_items(self):
+        sketch = SpaceSaving(3)
+        for item in range(100):
+            sketch.add(item)
+
+        self.assertEqual(len(sketch.counts), 3)
+        self.assertEqual(sum(len(bucket) for bucket in sketch.buckets.values()), 3)
+
+    def test_keeps_heavy_hitters(self):
+        sketch = SpaceSaving(5)
+        stream = []
+        for noise in range(200):
+            stream.extend(['HEAVY', 'noise_{0}'.format(noise)])
+            if noise % 3 == 0:
+                stream.append('MEDIUM')
+        for item in stream:
+            sketch.add(item)
+
+        top = sketch.top(2)
+        self.assertEqual([item for item, count, error in top], ['HEAVY', 'MEDIUM'])
+        # Counts never underestimate, and overestimate by at most `error`
+        heavy, count, error = top[0]
+        self.assertTrue(count - error <= 200 <= count)
+
+    def test_rejects_empty_capacity(self):
+        with self.assertRaises(ValueError):
+            SpaceSaving(0)